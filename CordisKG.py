@@ -5,11 +5,25 @@ from neo4j import ServiceUnavailable
 from CordisKG.neo4j_wrapper import Neo4jDatabase
 from CordisKG.create import *
 from CordisKG.parse_pdfs import export_pdfs_to_txt
+from CordisKG.bulk_import import export_bulk_import_files
+from CordisKG.registry import models
+from CordisKG.instrumentation import metrics
 
 def CORDISKG():
+    # Write the files of an initial load, which neo4j-admin imports
+    # into a stopped database, thus no connection is opened.
+    if bulk_import:
+        with metrics.stage('bulk_import'):
+            export_bulk_import_files(
+                bulk_import_dir, projects_csv, deliverables_csv, persons_csv,
+                project_keyphrases_csv, deliverables_keyphrases_csv
+            )
+        metrics.dump(metrics_path)
+        return
+
     # Open the database.
     try:
-        database = Neo4jDatabase(uri, user, pwd)
+        database = Neo4jDatabase(uri, user, pwd, max_connection_pool_size)
         # Neo4j server is unavailable.
         # This client app cannot open a connection.
     except ServiceUnavailable as error:
@@ -19,28 +33,53 @@ def CORDISKG():
         sys.exit(1)
 
     if extract_data:
-        export_keys_to_csv(
-           projects_csv, project_keyphrases_csv, 
-           aux_keys_path, top_n, ngram_range, cutoff,
-           id_field = 'id', text_field = 'objective'
-        )
-        export_keys_to_csv(
-            deliverables_csv, deliverables_keyphrases_csv, 
-            aux_keys_path, top_n, ngram_range, cutoff, 
-            id_field = 'rcn', text_field = 'description'
-        )
-        export_pdfs_to_txt(deliverables_csv, deliverables_dir)
-        extract_persons_to_csv(deliverables_dir, persons_csv)
+        with metrics.stage('extract'):
+            export_keys_to_csv(
+               projects_csv, project_keyphrases_csv, 
+               aux_keys_path, top_n, ngram_range, cutoff,
+               id_field = 'id', text_field = 'objective',
+               word_boundaries = word_boundaries,
+               batch_size = nlp_batch_size, n_process = nlp_processes,
+               workers = workers, checkpoint_every = checkpoint_every
+            )
+            export_keys_to_csv(
+                deliverables_csv, deliverables_keyphrases_csv, 
+                aux_keys_path, top_n, ngram_range, cutoff, 
+                id_field = 'rcn', text_field = 'description',
+                word_boundaries = word_boundaries,
+                batch_size = nlp_batch_size, n_process = nlp_processes,
+                workers = workers, checkpoint_every = checkpoint_every
+            )
+            export_pdfs_to_txt(
+                deliverables_csv, deliverables_dir,
+                workers = download_workers, rate = download_rate,
+                conversion_workers = conversion_workers,
+                conversion_timeout = conversion_timeout,
+                checkpoint_every = checkpoint_every
+            )
+            extract_persons_to_csv(
+                deliverables_dir, persons_csv, checkpoint_every,
+                batch_size = nlp_batch_size, n_process = nlp_processes
+            )
+            models.report()
 
     if create:
-        create_unique_constraints(database)
-        create_project_graph(database, projects_csv)
-        create_keyphrases_graph(database, project_keyphrases_csv, 'Project')
-        create_deliverable_graph(database, deliverables_csv, persons_csv)
-        create_keyphrases_graph(database, deliverables_keyphrases_csv, 'Deliverable')
+        with metrics.stage('create'):
+            create_unique_constraints(database)
+            create_project_graph(database, projects_csv, batch_size)
+            create_keyphrases_graph(database, project_keyphrases_csv, 'Project', batch_size, ingestion_workers)
+            create_deliverable_graph(database, deliverables_csv, persons_csv, batch_size)
+            create_keyphrases_graph(database, deliverables_keyphrases_csv, 'Deliverable', batch_size, ingestion_workers)
 
     if run_algorithms:
-        create_similarity_graph(database, False, True)
-        run_initial_algorithms(database)
+        with metrics.stage('algorithms'):
+            create_similarity_graph(
+                database, False, True, algorithms_backend, incremental_similarity,
+                batch_size, ingestion_workers
+            )
+            run_initial_algorithms(database, algorithms_backend)
+
+    # Write the timings of every stage at the end of the run.
+    metrics.dump(metrics_path)
 
 if __name__  ==  '__main__': CORDISKG()
@@ -0,0 +1,44 @@
+import contextvars
+from itertools import islice
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from CordisKG.instrumentation import collect_metrics, merged
+
+def chunks(iterable, size):
+    """
+    Function which lazily splits an iterable
+    into lists of at most size elements.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bounded_map(executor, function, iterable, window):
+    """
+    Function which maps the function over the iterable with the executor,
+    and yields the results in order. At most window items are submitted
+    without their result being yielded, so that a streamed iterable
+    is consumed only as fast as the executor completes its items.
+    The calls of a thread pool run in a copy of the current context,
+    thus under the current stage of the metrics, while the workers
+    of a process pool return their metrics, which are merged.
+    """
+    if isinstance(executor, ProcessPoolExecutor):
+        function = collect_metrics(function)
+        submit = lambda item: executor.submit(function, item)
+        results = lambda future: merged([future.result()])
+    else:
+        submit = lambda item: executor.submit(contextvars.copy_context().run, function, item)
+        results = lambda future: [future.result()]
+
+    pending = deque()
+    for item in iterable:
+        if len(pending) >= window:
+            yield from results(pending.popleft())
+        pending.append(submit(item))
+    while pending:
+        yield from results(pending.popleft())
@@ -0,0 +1,225 @@
+import time
+import random
+import numpy
+from difflib import get_close_matches
+from collections import OrderedDict
+from suffix_trees import STree
+from CordisKG.utils import find_keys_in_text, remove_common_strings_from_list, char_counts
+from CordisKG.matcher import KeyphraseMatcher
+from CordisKG.graph_algos import GraphAlgos
+from CordisKG.local_algos import LocalGraphAlgos, modularity
+
+def benchmark_find_keys(texts, keyphrases, repeat = 3):
+    """
+    Function which measures the best of repeat runs of find_keys_in_text()
+    and of the compiled keyphrase matcher over the same texts,
+    after checking that both return the same keyphrases.
+    The matcher timing includes the compilation of the automaton.
+    """
+    matcher = KeyphraseMatcher(keyphrases)
+    if any(find_keys_in_text(text, keyphrases) != matcher.find(text) for text in texts):
+        raise ValueError('The matcher results differ from find_keys_in_text()!')
+
+    timings = {'find_keys_in_text': [], 'KeyphraseMatcher': []}
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for text in texts:
+            find_keys_in_text(text, keyphrases)
+        timings['find_keys_in_text'].append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        matcher = KeyphraseMatcher(keyphrases)
+        for text in texts:
+            matcher.find(text)
+        timings['KeyphraseMatcher'].append(time.perf_counter() - start_time)
+
+    for name, seconds in timings.items():
+        print(f'{name}: {min(seconds)} secs for {len(texts)} texts')
+    return {name: min(seconds) for name, seconds in timings.items()}
+
+
+def remove_common_strings_pairwise(keyphrases, cutoff = 0.7):
+    """
+    Reference version of remove_common_strings_from_list(),
+    which calls get_close_matches() against the full list for every
+    keyphrase and builds a suffix tree for every group of close matches.
+    """
+    results = []
+    keyphrases = list(map(str.lower, keyphrases))
+    for keyphrase in keyphrases:
+        close_matches = get_close_matches(
+            keyphrase, keyphrases, 
+            n = len(keyphrases), 
+            cutoff = cutoff
+        )
+        if len(close_matches) > 1:
+            st = STree.STree([keyphrase] + close_matches)
+            largest_common_string = ' '.join(
+                term for term in st.lcs().strip().split()
+                if len(term) > 2
+            )
+            if largest_common_string:
+                results.append(largest_common_string)
+        else:
+            results.append(keyphrase)
+    return list(OrderedDict.fromkeys(results).keys())
+
+
+def benchmark_remove_common_strings(keyphrase_lists, cutoff = 0.7):
+    """
+    Function which times remove_common_strings_from_list() against
+    the pairwise reference over a corpus of keyphrase lists, and
+    returns the timings along with the number of lists with different output,
+    which is expected to be 0.
+    """
+    start_time = time.perf_counter()
+    expected = [remove_common_strings_pairwise(keys, cutoff) for keys in keyphrase_lists]
+    pairwise_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    results = [remove_common_strings_from_list(keys, cutoff) for keys in keyphrase_lists]
+    blocked_time = time.perf_counter() - start_time
+
+    differences = sum(1 for x, y in zip(expected, results) if x != y)
+    print(f'remove_common_strings_pairwise: {pairwise_time} secs')
+    print(f'remove_common_strings_from_list: {blocked_time} secs')
+    print(f'{differences} out of {len(keyphrase_lists)} lists differ')
+    return {
+        'remove_common_strings_pairwise': pairwise_time,
+        'remove_common_strings_from_list': blocked_time,
+        'differences': differences
+    }
+
+
+# The words of the synthetic keyphrases, with plurals and short terms.
+synthetic_words = [
+    'battery', 'model', 'models', 'modelling', 'cell', 'cells', 'learning',
+    'machine', 'deep', 'graph', 'graphs', 'knowledge', 'energy', 'storage',
+    'solar', 'network', 'networks', 'data', 'management', 'plan', 'ai', 'x'
+]
+
+
+def synthetic_keyphrases(rng, size = 30):
+    """
+    Function which returns a list of keyphrases, with plurals, misspellings
+    and duplicates, so that close matches overlap without being transitive.
+    """
+    keyphrases = []
+    for _ in range(size):
+        if keyphrases and rng.random() < 0.3:
+            keyphrase = rng.choice(keyphrases)
+            if rng.random() < 0.5:
+                position = rng.randrange(len(keyphrase) + 1)
+                keyphrase = keyphrase[:position] + rng.choice('aes ') + keyphrase[position:]
+        else:
+            keyphrase = ' '.join(rng.choice(synthetic_words) for _ in range(rng.randint(1, 3)))
+        keyphrases.append(keyphrase.title() if rng.random() < 0.2 else keyphrase)
+    return keyphrases
+
+
+def benchmark_remove_common_strings_corpus(size = 3000, cutoff = 0.7, seed = 0):
+    """
+    Function which times remove_common_strings_from_list() against
+    the pairwise reference on a single list of synthetic keyphrases,
+    of the size of the keyphrases of a whole corpus, and reports
+    the fraction of the pairs that the length and character bounds keep.
+    """
+    keyphrases = synthetic_keyphrases(random.Random(seed), size)
+    unique = list(dict.fromkeys(map(str.lower, keyphrases)))
+    lengths = numpy.array([len(keyphrase) for keyphrase in unique])
+    characters = char_counts(unique)
+    kept = 0
+    for i in range(len(unique)):
+        total = numpy.maximum(lengths + lengths[i], 1)
+        matches = numpy.minimum(characters, characters[i]).sum(axis = 1)
+        kept += int(numpy.sum(
+            (2.0 * numpy.minimum(lengths, lengths[i]) / total >= cutoff) &
+            (2.0 * matches / total >= cutoff)
+        ))
+    print(f'{kept} out of {len(unique) ** 2} pairs of {len(unique)} distinct keyphrases are scored')
+    return {**benchmark_remove_common_strings([keyphrases], cutoff), 'scored_pairs': kept / len(unique) ** 2}
+
+
+def benchmark_node_similarity(database, node_list, rel_list, cutoff = 0.23, top_k = 1, block_size = 1000):
+    """
+    Function which times the GDS node similarity against the local
+    sparse Jaccard similarity on the same projection, without writing
+    any relationships, and returns the timings along with the number
+    of similarity pairs that differ between them.
+    Both timings include the projection of the graph.
+    """
+    start_time = time.perf_counter()
+    with GraphAlgos(database, node_list, rel_list) as graph:
+        expected = database.execute(
+            f'CALL gds.nodeSimilarity.stream("{graph.graph_name}", {{'
+            f'similarityCutoff: {cutoff}, topK: {top_k}}}) '
+            'YIELD node1, node2, similarity '
+            'RETURN node1, node2, similarity', 'r'
+        )
+    gds_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    local_graph = LocalGraphAlgos(database, node_list, rel_list)
+    sources, targets, scores = local_graph.similarities(cutoff, top_k, block_size)
+    local_time = time.perf_counter() - start_time
+
+    # Pairs are compared by their node ids, and their scores up to rounding.
+    expected = {(node1, node2, round(score, 6)) for node1, node2, score in expected}
+    results = set(zip(
+        local_graph.node_ids[sources].tolist(),
+        local_graph.node_ids[targets].tolist(),
+        (round(score, 6) for score in scores.tolist())
+    ))
+    differences = len(expected ^ results)
+    print(f'gds.nodeSimilarity: {gds_time} secs, {len(expected) / gds_time:.0f} pairs/sec')
+    print(f'LocalGraphAlgos.similarities: {local_time} secs, {len(results) / local_time:.0f} pairs/sec')
+    print(f'{differences} out of {len(expected | results)} pairs differ')
+    return {
+        'gds.nodeSimilarity': gds_time,
+        'LocalGraphAlgos.similarities': local_time,
+        'differences': differences
+    }
+
+
+def benchmark_louvain(database, node_list, rel_list, max_levels = 10, max_iterations = 10):
+    """
+    Function which times the GDS Louvain against the local Louvain,
+    whose local moving computes the best community of a block of nodes
+    at once, on the same projection, without writing any communities,
+    and returns the timings along with the modularity of both partitions
+    on the undirected graph of the projection.
+    Both timings include the projection of the graph.
+    """
+    start_time = time.perf_counter()
+    with GraphAlgos(database, node_list, rel_list) as graph:
+        expected = database.execute(
+            f'CALL gds.louvain.stream("{graph.graph_name}", {{'
+            f'maxLevels: {max_levels}, maxIterations: {max_iterations}}}) '
+            'YIELD nodeId, communityId '
+            'RETURN nodeId, communityId', 'r'
+        )
+    gds_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    local_graph = LocalGraphAlgos(database, node_list, rel_list)
+    nodes, communities = local_graph.communities(max_levels, max_iterations)
+    local_time = time.perf_counter() - start_time
+
+    # Both partitions are scored on the undirected graph of the projection.
+    _, adjacency = local_graph.subgraph()
+    undirected = (adjacency + adjacency.T).tocsr()
+    indices = {node_id: index for index, node_id in enumerate(local_graph.node_ids.tolist())}
+    gds_communities = numpy.zeros(len(indices), dtype = int)
+    for node_id, community in expected:
+        gds_communities[indices[node_id]] = community
+    _, gds_communities = numpy.unique(gds_communities, return_inverse = True)
+    gds_modularity = modularity(undirected, gds_communities)
+    local_modularity = modularity(undirected, communities)
+    print(f'gds.louvain: {gds_time} secs, modularity {gds_modularity:.4f}')
+    print(f'LocalGraphAlgos.communities: {local_time} secs, modularity {local_modularity:.4f}')
+    return {
+        'gds.louvain': gds_time,
+        'LocalGraphAlgos.communities': local_time,
+        'gds.modularity': gds_modularity,
+        'local.modularity': local_modularity
+    }
@@ -0,0 +1,153 @@
+import os
+import csv
+import math
+from contextlib import ExitStack
+from CordisKG.utils import counter, read_csv_rows
+from CordisKG.create import (
+    project_records, keyphrase_records, read_projects, join_deliverables
+)
+
+class BulkWriter:
+    """
+    Writer of a header-typed node or relationship file for neo4j-admin import,
+    which streams its rows to disk, and skips the rows with an already written key.
+    The keys are kept in a hash set, so each check takes constant time.
+    """
+    def __init__(self, path, header):
+        self.path = path
+        self.keys = set()
+        self.file = open(path, 'w', newline = '', encoding = 'utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.file.close()
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def write(self, key, row):
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        self.writer.writerow([value(field) for field in row])
+        return True
+
+
+def value(field):
+    # Missing numbers are written as empty fields, which neo4j-admin skips,
+    # rather than as nan, which it cannot parse.
+    if isinstance(field, float) and math.isnan(field):
+        return ''
+    return field
+
+
+def import_command(output_dir, nodes, relationships, database = 'neo4j'):
+    """
+    Function which returns the neo4j-admin command that imports the files
+    into an empty, stopped database.
+    """
+    return ' '.join(
+        ['neo4j-admin import', f'--database={database}', '--multiline-fields=true'] +
+        [f'--nodes={os.path.join(output_dir, name)}' for name in nodes] +
+        [f'--relationships={os.path.join(output_dir, name)}' for name in relationships]
+    )
+
+
+@counter
+def export_bulk_import_files(output_dir, projects_csv, deliverables_csv, persons_csv,
+                             project_keyphrases_csv, deliverables_keyphrases_csv):
+    """
+    Function that reads the csvs, and writes the node and relationship files
+    of the whole knowledge graph, for an initial load with neo4j-admin import.
+    The files contain the same nodes and relationships that the create functions
+    would create in a database, and the number of rows of each file is returned.
+    """
+    os.makedirs(output_dir, exist_ok = True)
+    nodes = {
+        'projects.csv': [
+            ':ID(Project)', 'id:long', 'acronym', 'call', 'status', 'programme',
+            'topics', 'startDate', 'endDate', 'projectUrl', 'totalCost:double',
+            'ecMaxContribution:double', 'fundingScheme', ':LABEL'
+        ],
+        'organizations.csv': [':ID(Organization)', 'name', ':LABEL'],
+        'deliverables.csv': [
+            ':ID(Deliverable)', 'rcn:long', 'title', 'projectAcronym',
+            'programme', 'deliverableType', 'url', ':LABEL'
+        ],
+        'persons.csv': [':ID(Person)', 'name', ':LABEL'],
+        'keyphrases.csv': [':ID(Keyphrase)', 'name', ':LABEL']
+    }
+    relationships = {
+        'participates_in.csv': [':START_ID(Organization)', ':END_ID(Project)', ':TYPE'],
+        'coordinates.csv': [':START_ID(Organization)', ':END_ID(Project)', ':TYPE'],
+        'belongs.csv': [':START_ID(Deliverable)', ':END_ID(Project)', ':TYPE'],
+        'writes.csv': [':START_ID(Person)', ':END_ID(Deliverable)', ':TYPE'],
+        'project_includes.csv': [':START_ID(Project)', ':END_ID(Keyphrase)', ':TYPE'],
+        'deliverable_includes.csv': [':START_ID(Deliverable)', ':END_ID(Keyphrase)', ':TYPE']
+    }
+
+    with ExitStack() as stack:
+        files = {
+            name: stack.enter_context(BulkWriter(os.path.join(output_dir, name), header))
+            for name, header in {**nodes, **relationships}.items()
+        }
+
+        # Write the projects, their organizations and their relationships.
+        for row in project_records(read_projects(projects_csv)):
+            files['projects.csv'].write(row['id'], [
+                row['id'], row['id'], row['acronym'], row['call'], row['status'],
+                row['programme'], row['topics'], row['startDate'], row['endDate'],
+                row['projectUrl'], row['totalCost'], row['ecMaxContribution'],
+                row['fundingScheme'], 'Project'
+            ])
+            for name in [row['coordinator']] + row['participants']:
+                files['organizations.csv'].write(name, [name, name, 'Organization'])
+                files['participates_in.csv'].write(
+                    (name, row['id']), [name, row['id'], 'participates_in']
+                )
+            files['coordinates.csv'].write(
+                (row['coordinator'], row['id']), [row['coordinator'], row['id'], 'coordinates']
+            )
+
+        # Write the deliverables of the existing projects, their persons and their relationships.
+        for row in join_deliverables(deliverables_csv, persons_csv):
+            if row['projectID'] not in files['projects.csv']:
+                continue
+            files['deliverables.csv'].write(row['rcn'], [
+                row['rcn'], row['rcn'], row['title'], row['projectAcronym'],
+                row['programme'], row['deliverableType'], row['url'], 'Deliverable'
+            ])
+            files['belongs.csv'].write(
+                (row['rcn'], row['projectID']), [row['rcn'], row['projectID'], 'belongs']
+            )
+            for name in row['persons']:
+                files['persons.csv'].write(name, [name, name, 'Person'])
+                files['writes.csv'].write((name, row['rcn']), [name, row['rcn'], 'writes'])
+
+        # Write the keyphrases of the existing projects and deliverables.
+        targets = [
+            (project_keyphrases_csv, 'id', 'projects.csv', 'project_includes.csv'),
+            (deliverables_keyphrases_csv, 'rcn', 'deliverables.csv', 'deliverable_includes.csv')
+        ]
+        for keys_path, id_field, target, includes in targets:
+            rows = read_csv_rows(keys_path, sep = ',', usecols = [id_field, 'keyphrases'])
+            for row in keyphrase_records(rows, id_field):
+                if row['id'] not in files[target]:
+                    continue
+                for key in row['keys']:
+                    files['keyphrases.csv'].write(key, [key, key, 'Keyphrase'])
+                    files[includes].write((row['id'], key), [row['id'], key, 'includes'])
+
+        counts = {name: len(file) for name, file in files.items()}
+
+    for name, count in counts.items():
+        print(f'Wrote {count} rows to {name}...')
+    print(import_command(output_dir, nodes, relationships))
+    return counts
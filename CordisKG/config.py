@@ -11,19 +11,42 @@ deliverables_dir = os.path.join(base_path, 'deliverables')
 persons_csv = os.path.join(base_path, 'persons.csv')
 project_keyphrases_csv = os.path.join(base_path, 'project_keyphrases.csv')
 deliverables_keyphrases_csv = os.path.join(base_path, 'deliverables_keyphrases.csv')
+embeddings_path = os.path.join(base_path, 'embeddings')
+bulk_import_dir = os.path.join(base_path, 'import')
+metrics_path = os.path.join(base_path, 'metrics') # Written as metrics.json and metrics.csv.
 
 # Session variables
-debug = True
 extract_data = False
 create = False
 run_algorithms = True
+bulk_import = False
 
 # Database variables
 uri = 'bolt://localhost:7687'
 user = 'neo4j'
 pwd = '123'
+max_connection_pool_size = 100
 
 # Algorithmic variables
 top_n = 10
 ngram_range = (1, 3)
 cutoff = 0.7
+word_boundaries = False
+nlp_batch_size = 64
+nlp_processes = 1
+workers = 1
+checkpoint_every = 1000
+
+# Download variables
+download_workers = 4
+download_rate = 1.0
+conversion_workers = 4
+conversion_timeout = 60
+
+# Graph algorithm variables, the backend is either gds or local.
+algorithms_backend = 'gds'
+incremental_similarity = False
+
+# Ingestion variables
+batch_size = 5000
+ingestion_workers = 4
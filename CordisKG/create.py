@@ -1,7 +1,10 @@
-import pandas
+import time
 from itertools import product
-from CordisKG.utils import counter, clear_screen, tokenize
+from collections import defaultdict
+from CordisKG.utils import counter, clear_screen, chunks, read_csv_rows
+from CordisKG.instrumentation import metrics
 from CordisKG.graph_algos import *
+from CordisKG.local_algos import LocalGraphAlgos
 
 def create_unique_constraints(database):
     """
@@ -20,152 +23,373 @@ def create_unique_constraints(database):
                      'ASSERT keyphrase.name IS UNIQUE', 'w')
     return
 
+# The columns of the csvs, which are read by the graph stages.
+project_columns = [
+    'id', 'acronym', 'call', 'status', 'programme', 'topics',
+    'startDate', 'endDate', 'projectUrl', 'totalCost',
+    'ecMaxContribution', 'fundingScheme', 'coordinator', 'participants'
+]
+deliverable_columns = [
+    'rcn', 'projectID', 'title', 'projectAcronym',
+    'programme', 'deliverableType', 'url'
+]
+
+def project_records(rows):
+    """
+    Function which converts the rows of the projects csv to parameter maps,
+    with the same field conversions as the per-row project queries.
+    """
+    for row in rows:
+        yield {
+            'id': int(row.id),
+            'acronym': str(row.acronym),
+            'call': str(row.call),
+            'status': str(row.status),
+            'programme': str(row.programme),
+            'topics': str(row.topics),
+            'startDate': str(row.startDate),
+            'endDate': str(row.endDate),
+            'projectUrl': str(row.projectUrl),
+            'totalCost': float(str(row.totalCost).replace(',', '.')),
+            'ecMaxContribution': float(str(row.ecMaxContribution).replace(',', '.')),
+            'fundingScheme': str(row.fundingScheme),
+            'coordinator': str(row.coordinator),
+            'participants': str(row.participants).split(';')
+        }
+
+
+def read_projects(cordis_path):
+    return read_csv_rows(cordis_path, sep = ';', usecols = project_columns)
+
+
+def read_deliverables(deliverables_csv, chunk_size = 100000):
+    """
+    Generator which reads the fields of the deliverables in dictionaries
+    keyed by their rcn, of at most chunk_size deliverables each,
+    which the rows of the persons csv are joined with.
+    """
+    rows = read_csv_rows(deliverables_csv, sep = ';', usecols = deliverable_columns)
+    for chunk in chunks(rows, chunk_size):
+        yield {row.rcn: row for row in chunk}
+
+
+def execute_passes(database, passes, batch_size, workers = 1):
+    """
+    Function which runs each (label, query, items, key) pass in turn,
+    by sending the items in batches, as the key parameter of its UNWIND query.
+    The items are streamed, and the number of items of each pass is returned.
+    """
+    totals = []
+    for label, query, items, key in passes:
+        start_time = time.perf_counter()
+        sizes = []
+        def batches(items = items, key = key):
+            for batch in chunks(items, batch_size):
+                sizes.append(len(batch))
+                yield {key: batch}
+        with metrics.timer(f'execute_passes[{label}]') as measurement:
+            count = database.execute_many(query, batches(), batch_size = 1, workers = workers)
+            measurement['items'] = sum(sizes)
+        rate = sum(sizes) / (time.perf_counter() - start_time)
+        # The failed batches are not committed, thus they are reported apart.
+        print(f'Sent {sum(sizes)} {label} in {len(sizes)} batches, '
+              f'{count} committed ({rate:.0f} rows/sec)...')
+        totals.append(sum(sizes))
+    return totals
+
+
+@counter
+def create_project_graph_batched(database, cordis_path, batch_size):
+    """
+    Function that creates the projects, their organizations 
+    and the coordinator / participant relationships in batches of rows,
+    which are sent as parameters of the same UNWIND queries.
+    The csv is streamed once for each pass.
+    """
+    projects_query = (
+        'UNWIND $rows AS row '
+        'CREATE (p:Project {'
+        'id: row.id, acronym: row.acronym, call: row.call, '
+        'status: row.status, programme: row.programme, '
+        'topics: row.topics, startDate: row.startDate, '
+        'endDate: row.endDate, projectUrl: row.projectUrl, '
+        'totalCost: row.totalCost, ecMaxContribution: row.ecMaxContribution, '
+        'fundingScheme: row.fundingScheme})'
+    )
+    organizations_query = (
+        'UNWIND $names AS name '
+        'MERGE (:Organization {name: name})'
+    )
+    relationships_query = (
+        'UNWIND $rows AS row '
+        'MATCH (p:Project {id: row.id}) '
+        'MATCH (c:Organization {name: row.coordinator}) '
+        'MERGE (c)-[:participates_in]->(p) '
+        'MERGE (c)-[:coordinates]->(p) '
+        'WITH p, row '
+        'UNWIND row.participants AS name '
+        'MATCH (o:Organization {name: name}) '
+        'MERGE (o)-[:participates_in]->(p)'
+    )
+    names = list(dict.fromkeys(
+        name for row in project_records(read_projects(cordis_path))
+        for name in [row['coordinator']] + row['participants']
+    ))
+    # Each pass sends one batch per transaction, through the same session.
+    passes = [
+        ('projects', projects_query, project_records(read_projects(cordis_path)), 'rows'),
+        ('organizations', organizations_query, names, 'names'),
+        ('relationships', relationships_query, project_records(read_projects(cordis_path)), 'rows')
+    ]
+    execute_passes(database, passes, batch_size)
+    return
+
+
+def deliverable_records(persons, deliverables):
+    """
+    Function which joins the rows of the persons csv with the deliverables on rcn,
+    and converts them to parameter maps, with the persons of each deliverable in a list.
+    The persons of deliverables which are missing from the deliverables are skipped.
+    """
+    for row in persons:
+        deliverable = deliverables.get(row.rcn)
+        if deliverable is None:
+            continue
+        yield {
+            'projectID': int(deliverable.projectID),
+            'rcn': int(deliverable.rcn),
+            'title': str(deliverable.title),
+            'projectAcronym': str(deliverable.projectAcronym),
+            'programme': str(deliverable.programme),
+            'deliverableType': str(deliverable.deliverableType),
+            'url': str(deliverable.url),
+            'persons': str(row.persons).split(';')
+        }
+
+
+def join_deliverables(deliverables_csv, persons_csv, chunk_size = 100000):
+    """
+    Generator which joins the persons with the deliverables on rcn,
+    one chunk of deliverables at a time, so that only a chunk is kept in memory,
+    while the persons csv is streamed once for each chunk.
+    """
+    for deliverables in read_deliverables(deliverables_csv, chunk_size):
+        persons = read_csv_rows(persons_csv, sep = ',', usecols = ['rcn', 'persons'])
+        yield from deliverable_records(persons, deliverables)
+
+def keyphrase_records(rows, id_field):
+    """
+    Function which converts the rows of a keyphrases csv to {id, keys} maps.
+    The keyphrases of each target are deduplicated and sorted.
+    """
+    for row in rows:
+        yield {'id': int(getattr(row, id_field)), 'keys': sorted(set(str(row.keyphrases).split(';')))}
+
 @counter
-def create_project_graph(database, cordis_path):
+def create_project_graph(database, cordis_path, batch_size = None):
     """
     Function that reads the csv, and creates the knowledge graph.
+    If batch_size is set, the rows are ingested in batches, 
+    otherwise each row is ingested with its own queries.
     """
-    rows = pandas.read_csv(cordis_path, sep = ';')
-    total = len(rows)
-    for i in range(total):
-
-        print(f'Creating {i} out of {total} projects...')
-        # Create the project node, with all its fields.
-        query = (
-            'CREATE (p:Project {'
-            f'id: {rows["id"].iloc[i]}, '
-            f'acronym: "{rows["acronym"].iloc[i]}", '
-            f'call: "{rows["call"].iloc[i]}", '
-            f'status: "{rows["status"].iloc[i]}", '
-            f'programme: "{rows["programme"].iloc[i]}", '
-            f'topics: "{rows["topics"].iloc[i]}", '
-            f'startDate: "{rows["startDate"].iloc[i]}", '
-            f'endDate: "{rows["endDate"].iloc[i]}", '
-            f'projectUrl: "{rows["projectUrl"].iloc[i]}", '
-            f'totalCost: {float(str(rows["totalCost"].iloc[i]).replace(",", "."))}, '
-            f'ecMaxContribution: {float(str(rows["ecMaxContribution"].iloc[i]).replace(",", "."))}, '
-            f'fundingScheme: "{rows["fundingScheme"].iloc[i]}"}})'
-        )
-        database.execute(query, 'w')
-        coordinator = rows["coordinator"].iloc[i]
-
-        # Construct the participants list.
-        participants = str(rows["participants"].iloc[i]).split(';')
-
-        # Unwind the list of participants and their relationships with the project.
-        # Create the coordinator and its relationship as well.
-        query = (
-            f'MATCH (p:Project {{id: {rows["id"].iloc[i]}}}) '
-            f'UNWIND {participants} as name '
-            'MERGE (o:Organization {name: name}) '
-            'MERGE (o)-[:participates_in]->(p) '
-            f'MERGE (c:Organization {{name: "{coordinator}"}}) '
-            'MERGE (c)-[:participates_in]->(p) '
-            'MERGE (c)-[:coordinates]->(p) '
-        )
-        database.execute(query, 'w')
-        clear_screen()
+    if batch_size:
+        create_project_graph_batched(database, cordis_path, batch_size)
+        return
+
+    # Create the project node, with all its fields, then unwind the list
+    # of participants and their relationships with the project.
+    # Create the coordinator and its relationship as well.
+    query = (
+        'CREATE (p:Project {'
+        'id: $id, acronym: $acronym, call: $call, '
+        'status: $status, programme: $programme, '
+        'topics: $topics, startDate: $startDate, '
+        'endDate: $endDate, projectUrl: $projectUrl, '
+        'totalCost: $totalCost, ecMaxContribution: $ecMaxContribution, '
+        'fundingScheme: $fundingScheme}) '
+        'WITH p '
+        'UNWIND $participants as name '
+        'MERGE (o:Organization {name: name}) '
+        'MERGE (o)-[:participates_in]->(p) '
+        'MERGE (c:Organization {name: $coordinator}) '
+        'MERGE (c)-[:participates_in]->(p) '
+        'MERGE (c)-[:coordinates]->(p) '
+    )
+    database.execute_many(query, project_records(read_projects(cordis_path)))
     return
 
-def create_keyphrases_graph(database, keys_path, target):
+@counter
+def create_keyphrases_graph(database, keys_path, target, batch_size = None, workers = 1):
     """
     Function that reads the csv, and creates the keyphrases graph.
+    If batch_size is set, the distinct keyphrases are created first,
+    and the relationships are created afterwards in batches,
+    which are committed concurrently by the workers.
     """
-    rows = pandas.read_csv(keys_path, sep = ',')
-    total = len(rows)
-
     # Create the id field string
     id_field = 'id' if target == 'Project' else 'rcn'
 
-    for i in range(total):
-        print(f'Creating keyphrases for {i} out of {total} {target}s...')
+    def records():
+        return keyphrase_records(
+            read_csv_rows(keys_path, sep = ',', usecols = [id_field, 'keyphrases']), id_field
+        )
 
-        # Construct the keyphrases list.
-        keys = str(rows["keyphrases"].iloc[i]).split(';')
+    if batch_size:
+        keyphrases_query = (
+            'UNWIND $names AS name '
+            'MERGE (:Keyphrase {name: name})'
+        )
+        relationships_query = (
+            'UNWIND $rows AS row '
+            'MATCH (k:Keyphrase {name: row.key}) '
+            'UNWIND row.ids AS id '
+            f'MATCH (t:{target} {{{id_field}: id}}) '
+            'MERGE (t)-[:includes]->(k)'
+        )
+        # Only the keyphrases of existing targets are created,
+        # as the per-row query matches the target before its keyphrases.
+        # The targets are grouped by keyphrase, so that each keyphrase
+        # is merged by a single batch, and the list of ids per keyphrase
+        # is the only structure kept in memory, as large as the relationships.
+        targets = {key for [key] in database.execute(f'MATCH (t:{target}) RETURN t.{id_field}', 'r') or []}
+        ids = defaultdict(list)
+        for row in records():
+            if row['id'] in targets:
+                for key in row['keys']:
+                    ids[key].append(row['id'])
+        names = sorted(ids)
 
-        # Unwind the list of keyphrases and their relationships with the target.
-        query = (
-            f'MATCH (t:{target} {{{id_field}: {rows[{id_field}].iloc[i, 0]}}}) '
-            f'UNWIND {keys} as key '
-            'MERGE (k:Keyphrase {name: key}) '
-            'MERGE (t)-[:includes]->(k) '
+        # The keyphrases are created by a single session, since batches
+        # of the same names would conflict, while the relationships
+        # of distinct keyphrases are merged in parallel. Concurrent batches
+        # may still share targets, thus the batches which deadlock
+        # are retried, and then committed serially by execute_many.
+        execute_passes(database, [('keyphrases', keyphrases_query, names, 'names')], batch_size)
+        rows = ({'key': key, 'ids': ids[key]} for key in names)
+        execute_passes(
+            database, [(f'{target} keyphrases', relationships_query, rows, 'rows')],
+            batch_size, workers
         )
-        database.execute(query, 'w')
-        clear_screen()
+        return
+
+    # Unwind the list of keyphrases and their relationships with the target.
+    query = (
+        f'MATCH (t:{target} {{{id_field}: $id}}) '
+        'UNWIND $keys as key '
+        'MERGE (k:Keyphrase {name: key}) '
+        'MERGE (t)-[:includes]->(k) '
+    )
+    count = database.execute_many(query, records())
+    print(f'Created keyphrases for {count} {target}s...')
     return
 
 @counter
-def create_deliverable_graph(database, deliverables_csv, persons_csv):
+def create_deliverable_graph(database, deliverables_csv, persons_csv, batch_size = 5000, chunk_size = 100000):
     """
     Function that reads the csvs, and creates the deliverables graph.
+    The persons of each deliverable are joined with its fields on rcn,
+    by chunks of deliverables, and the joined rows are ingested in batches.
     """
-    rows = pandas.read_csv(persons_csv, sep = ',')
-    other_rows = pandas.read_csv(deliverables_csv, sep = ';')
-    rows = rows.sort_values('rcn')
-    other_rows = other_rows.sort_values('rcn')
-
-    total = len(rows)
-    j = 0
-    for i in range(total):
-        print(f'Creating deliverable {i} out of {total} deliverables...')
-
-        # In case of a missing record, skip the index.
-        while rows["rcn"].iloc[i] != other_rows["rcn"].iloc[j]:
-            j += 1
-
-        # Construct the persons list.
-        persons = str(rows["persons"].iloc[i]).split(';')
-
-        # Unwind the list of keyphrases and their relationships with the project.
-        query = (
-            f'MATCH (p:Project {{id: {other_rows["projectID"].iloc[i]}}}) '
-            f'UNWIND {persons} as person '
-            f'MERGE (d:Deliverable {{ '
-            f'rcn: {rows["rcn"].iloc[i]}, '
-            f'title: "{other_rows["title"].iloc[i]}", '
-            f'projectAcronym: "{other_rows["projectAcronym"].iloc[i]}", '
-            f'programme: "{other_rows["programme"].iloc[i]}", '
-            f'deliverableType: "{other_rows["deliverableType"].iloc[i]}", '
-            f'url: "{other_rows["url"].iloc[i]}"}}) '
-            'MERGE (a:Person {name: person}) '
-            'MERGE (d)-[:belongs]->(p) '
-            'MERGE (a)-[:writes]->(d) '
-        )
-        database.execute(query, 'w')
-        clear_screen()
+    records = join_deliverables(deliverables_csv, persons_csv, chunk_size)
+
+    # The deliverables are merged on their unique rcn alone,
+    # so the lookup uses the constraint index, and the rest of the fields are set.
+    # Only the deliverables of existing projects are created, along with their persons.
+    query = (
+        'UNWIND $rows AS row '
+        'MATCH (p:Project {id: row.projectID}) '
+        'MERGE (d:Deliverable {rcn: row.rcn}) '
+        'SET d.title = row.title, d.projectAcronym = row.projectAcronym, '
+        'd.programme = row.programme, d.deliverableType = row.deliverableType, '
+        'd.url = row.url '
+        'MERGE (d)-[:belongs]->(p) '
+        'WITH d, row '
+        'UNWIND row.persons AS name '
+        'MERGE (a:Person {name: name}) '
+        'MERGE (a)-[:writes]->(d)'
+    )
+    passes = [('deliverables', query, records, 'rows')]
+    execute_passes(database, passes, batch_size)
     return
 
 
+@counter
+def delete_relationships(database, relationship, batch_size = 10000, workers = 1):
+    """
+    Function that deletes all relationships of a type in committed batches.
+    With a single worker, the batches are deleted in turn, until none is left,
+    otherwise their ids are read in pages, and disjoint chunks of them
+    are deleted concurrently.
+    """
+    if workers > 1:
+        return database.execute_chunked(
+            'MATCH ()-[r]->() WHERE id(r) IN $ids DELETE r',
+            ids_query = (
+                f'MATCH ()-[r:{relationship}]->() WHERE id(r) > $after '
+                'RETURN id(r) ORDER BY id(r) LIMIT $page_size'
+            ),
+            batch_size = batch_size, workers = workers
+        )
+    return database.execute_chunked(
+        f'MATCH ()-[r:{relationship}]->() '
+        'WITH r LIMIT $batch_size '
+        'DELETE r RETURN count(*)',
+        batch_size = batch_size
+    )
+
+
 @counter
 def create_similarity_graph(database, 
                             similar_organizations_projects = True,
-                            similar_persons = True
+                            similar_persons = True,
+                            backend = 'gds',
+                            incremental = False,
+                            batch_size = 10000,
+                            workers = 1
                            ):
     """
     Function that creates a similarity graph between organizations,
     based on the keyphrases of their common projects.
+    The similarities are computed either through the GDS plugin of the database,
+    or in-process, if the backend is set to local.
+    If incremental is set, the similarity graph is updated in place,
+    only for the nodes whose neighbourhood changed since the previous update,
+    which is always computed in-process.
     """
+    graphs = []
+    if similar_organizations_projects:
+        graphs.append((
+            ['Organization', 'Project', 'Keyphrase'],
+            [('participates_in', 'NATURAL', []), 
+            ('includes', 'NATURAL', [])]
+        ))
+    if similar_persons:
+        graphs.append((
+            ['Person', 'Deliverable', 'Project', 'Keyphrase'],
+            [('writes', 'NATURAL', []), 
+            ('belongs', 'NATURAL', []),
+            ('includes', 'NATURAL', [])]
+        ))
+
+    if incremental:
+        for node_list, rel_list in graphs:
+            with LocalGraphAlgos(database, node_list, rel_list) as graph:
+                graph.updateNodeSimilarity(
+                    write_property = 'score', 
+                    write_relationship = 'is_similar', 
+                    cutoff = 0.23, top_k = 1
+                )
+        return
+
+    Algos = LocalGraphAlgos if backend == 'local' else GraphAlgos
+
     # Remove similarity edges from previous iterations.
-    database.execute('MATCH ()-[r:is_similar]->() DELETE r', 'w')
+    delete_relationships(database, 'is_similar', batch_size, workers)
 
     # Create the similarity graph using Jaccard similarity measure.
-    if similar_organizations_projects:
-        with GraphAlgos(database, 
-                       ['Organization', 'Project', 'Keyphrase'],
-                       [('participates_in', 'NATURAL', []), 
-                       ('includes', 'NATURAL', [])]) as graph1:
-            graph1.nodeSimilarity(
-                write_property = 'score', 
-                write_relationship = 'is_similar', 
-                cutoff = 0.23, top_k = 1
-            )
-    if similar_persons:
-        with GraphAlgos(database, 
-                       ['Person', 'Deliverable', 'Project', 'Keyphrase'],
-                       [('writes', 'NATURAL', []), 
-                       ('belongs', 'NATURAL', []),
-                       ('includes', 'NATURAL', [])]) as graph2:
-            graph2.nodeSimilarity(
+    for node_list, rel_list in graphs:
+        with Algos(database, node_list, rel_list) as graph:
+            graph.nodeSimilarity(
                 write_property = 'score', 
                 write_relationship = 'is_similar', 
                 cutoff = 0.23, top_k = 1
@@ -173,27 +397,30 @@ def create_similarity_graph(database,
     return
 
 
-def run_initial_algorithms(database):
+@counter
+def run_initial_algorithms(database, backend = 'gds'):
     """
     Function that runs centrality & community detection algorithms,
     in order to prepare the data for analysis and visualization.
     Pagerank & Louvain are used, respectively.
+    The algorithms run either through the GDS plugin of the database,
+    or in-process, if the backend is set to local.
     """
-    with GraphAlgos(database, ['Project', 'Keyphrase'], 
-                    ['includes'], orientation = 'UNDIRECTED') as graph1:
-        graph1.pagerank(write_property = 'pagerank')
-
-    with GraphAlgos(database, ['Project'], ['is_similar']) as graph2:
-        graph2.louvain(write_property = 'community')
+    Algos = LocalGraphAlgos if backend == 'local' else GraphAlgos
 
-    with GraphAlgos(database, ['Organization'], ['is_similar']) as graph3:
-        graph3.louvain(write_property = 'community')
-
-    with GraphAlgos(database, ['Deliverable'], ['is_similar']) as graph4:
-        graph4.louvain(write_property = 'community')
+    with Algos(database, ['Project', 'Keyphrase'], 
+               ['includes'], orientation = 'UNDIRECTED') as graph1:
+        graph1.pagerank(write_property = 'pagerank')
 
-    with GraphAlgos(database, ['Person'], ['is_similar']) as graph5:
-        graph5.louvain(write_property = 'community')
+    # The similarity graph is projected once, and the communities
+    # are detected separately for the nodes of each label. The communities
+    # of each label are written once they are detected, thus a failed label
+    # neither blocks nor discards the communities of the rest.
+    with Algos(database, ['Project', 'Organization', 'Deliverable', 'Person'],
+               ['is_similar']) as graph2:
+        for label in ['Project', 'Organization', 'Deliverable', 'Person']:
+            graph2.louvain(write_property = 'community', node_labels = [label])
+            graph2.write(node_labels = [label])
 
     return
 
@@ -0,0 +1,147 @@
+import os
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class TokenBucket:
+    """
+    Thread-safe token bucket, which limits the requests of all
+    download threads to rate per second, with bursts up to capacity.
+    """
+    def __init__(self, rate, capacity = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class Downloader:
+    """
+    Downloader of deliverable pdfs, which keeps a pooled session
+    with a retry policy, and runs up to workers requests in flight,
+    under a global rate limit shared by all of them.
+    """
+    # The busy server responses, which are retried.
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self, workers = 4, rate = 1.0, max_retries = 5, backoff_factor = 0.5, timeout = 60):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.bucket = TokenBucket(rate)
+
+        # The retries are made by get() rather than by the adapter,
+        # so that every retry takes a token of the rate limit as well.
+        adapter = HTTPAdapter(pool_connections = workers, pool_maxsize = workers, max_retries = 0)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Set the headers to a mozilla firefox user,
+        # the cookies are kept by the session.
+        self.session.headers.update({'User-Agent': 'Mozilla/5.0'})
+
+    def get(self, url, **kwargs):
+        """
+        Sends a rate limited request, and retries it with exponential backoff
+        on connection errors and busy server responses. The response of the
+        last attempt is returned, and the error of the last attempt is raised.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                response = self.session.get(url, timeout = self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code not in Downloader.retry_statuses or attempt == self.max_retries:
+                    return response
+                response.close()
+            time.sleep(self.backoff_factor * 2 ** attempt)
+
+    def download_pdf(self, url, filename):
+        """
+        Connects to the EU Cordis site and downloads a deliverable pdf
+        using the url. Returns True if the pdf was succesfully retrieved
+        and False otherwise.
+        """
+        try:
+            # Download the html page text from the url,
+            # a response which failed after all retries is skipped.
+            response = self.get(url)
+            if not response.ok:
+                return False
+            html_page = response.text
+
+            # Check if the html page contains the error code, and return early.
+            if 'Error code' in html_page:
+                return False
+
+            # The download pdf url can be found in the bottom part of the page.
+            l_idx = html_page.rfind('window.location=\'') + len('window.location=') + 1
+            r_idx = html_page.rfind('\'')
+            pdf_url = html_page[l_idx: r_idx]
+
+            # Stream the file from the url to disk, only if it's a pdf.
+            # The partial file is renamed once the download completes,
+            # and is removed if the body is shorter than its declared length.
+            partial_filename = f'{filename}.part'
+            with self.get(pdf_url, stream = True) as response:
+                if 'application/pdf' not in response.headers.get('content-type', ''):
+                    return False
+                size = 0
+                with open(partial_filename, 'wb') as file:
+                    for chunk in response.iter_content(chunk_size = 64 * 1024):
+                        file.write(chunk)
+                        size += len(chunk)
+                length = response.headers.get('content-length')
+                if length is not None and size != int(length):
+                    os.remove(partial_filename)
+                    print(f'Truncated download of {pdf_url}: {size} out of {length} bytes')
+                    return False
+                os.replace(partial_filename, filename)
+            return True
+        except (requests.RequestException, OSError) as err:
+            print(err)
+            if os.path.exists(f'{filename}.part'):
+                os.remove(f'{filename}.part')
+            return False
+
+    def download_all(self, items):
+        """
+        Downloads the (key, url, filename) items concurrently,
+        and yields (key, filename, status) tuples as they complete.
+        At most twice the workers items are pending at any time.
+        """
+        items = iter(items)
+        pending = {}
+        with ThreadPoolExecutor(max_workers = self.workers) as executor:
+            while True:
+                for key, url, filename in items:
+                    future = executor.submit(self.download_pdf, url, filename)
+                    pending[future] = (key, filename)
+                    if len(pending) >= 2 * self.workers:
+                        break
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when = FIRST_COMPLETED)
+                for future in done:
+                    key, filename = pending.pop(future)
+                    yield key, filename, future.result()
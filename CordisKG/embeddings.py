@@ -0,0 +1,90 @@
+import os
+import json
+import hashlib
+import numpy as np
+from CordisKG.batching import chunks
+
+class EmbeddingCache:
+    """
+    On-disk store of text embeddings, keyed by the hash of the model name
+    and the text content. The vectors are appended to a raw float32 file,
+    which is read back as a memory map, while a json index maps
+    each content hash to the row of its vector.
+    """
+    def __init__(self, path, model_name):
+        self.model_name = model_name
+        self.vectors_path = f'{path}.f32'
+        self.index_path = f'{path}.json'
+        self.index = {}
+        self.dim = None
+        self._vectors = None
+
+        # Without the vectors file, e.g. after a first run that was interrupted
+        # before writing any vector, the index is stale and the store starts empty.
+        if os.path.exists(self.index_path) and os.path.exists(self.vectors_path):
+            with open(self.index_path, 'r', encoding = 'utf-8') as file:
+                stored = json.load(file)
+            self.dim = stored['dim']
+
+            # Rows that were indexed but never fully written are dropped,
+            # along with any partially written vector.
+            rows = os.path.getsize(self.vectors_path) // (4 * self.dim)
+            os.truncate(self.vectors_path, rows * 4 * self.dim)
+            self.index = {
+                key: row for key, row in stored['index'].items()
+                if row < rows
+            }
+
+    def key(self, text):
+        return hashlib.sha1(f'{self.model_name}\0{text}'.encode('utf-8')).hexdigest()
+
+    def vectors(self):
+        """
+        Returns the memory map of all stored vectors.
+        """
+        if self._vectors is None and self.index:
+            self._vectors = np.memmap(
+                self.vectors_path, dtype = np.float32, mode = 'r',
+                shape = (max(self.index.values()) + 1, self.dim)
+            )
+        return self._vectors
+
+    def put(self, texts, vectors):
+        """
+        Appends the vectors of the texts to the store,
+        the index is written to disk by save().
+        """
+        vectors = np.asarray(vectors, dtype = np.float32)
+        self.dim = vectors.shape[1]
+        with open(self.vectors_path, 'ab') as file:
+            rows = file.tell() // (4 * self.dim)
+            file.write(vectors.tobytes())
+        for i, text in enumerate(texts):
+            self.index[self.key(text)] = rows + i
+
+        # The memory map is reopened with the new size on the next read.
+        self._vectors = None
+
+    def save(self):
+        with open(self.index_path, 'w', encoding = 'utf-8') as file:
+            json.dump({'dim': self.dim, 'index': self.index}, file)
+
+    def embed(self, texts, encode, batch_size = 32):
+        """
+        Returns the embeddings of the texts, in their order.
+        Only the texts missing from the store are encoded, in batches
+        sorted by length to minimize the padding of each batch.
+        """
+        missing = sorted(
+            {text for text in texts if self.key(text) not in self.index},
+            key = len
+        )
+        for batch in chunks(missing, batch_size):
+            self.put(batch, encode(batch))
+        if missing:
+            self.save()
+
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype = np.float32)
+        vectors = self.vectors()
+        return np.asarray(vectors[[self.index[self.key(text)] for text in texts]])
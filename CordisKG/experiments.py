@@ -1,97 +1,228 @@
 import os
+import json
+import time
+import hashlib
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 import CordisKG.models
 import CordisKG.metrics
-import CordisKG.utils
+from CordisKG.registry import models
+from CordisKG.embeddings import EmbeddingCache
+from CordisKG.normalizer import load_normalizer
+from CordisKG.instrumentation import collect_metrics, merged
 
-def run_experiments(dirpath, outpath, top_n, ngram_range):
-    # Initialize the spacy and keybert models.
-    nlp_model, bert_model = CordisKG.utils.load_models()
+# The compared methods, in the order of the output columns.
+methods = ['Yake', 'Keybert', 'Textrank', 'Singlerank']
 
-    # Make a list of all subdirectories.
-    directories = next(os.walk(dirpath))[1][0:]
+class PredictionCache:
+    """
+    On-disk cache of the predicted keyphrases of each method, along with
+    the extraction time of each document, keyed by the hash of the method,
+    its parameters and the document text. Each entry holds the ranked
+    keyphrases up to the top_n they were extracted with, thus rescoring
+    the same documents with different metrics or any smaller cutoff
+    reads the predictions from the cache, and slices them.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding = 'utf-8') as file:
+                self.entries = json.load(file)
+
+    @staticmethod
+    def key(method, parameters, text):
+        return hashlib.sha1(json.dumps([method, parameters, text]).encode('utf-8')).hexdigest()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def covers(self, key, top_n):
+        # The entry holds at least the top_n keyphrases, or every keyphrase of the document.
+        return key in self.entries and self.entries[key].get('top_n', 0) >= top_n
+
+    def get(self, key):
+        return self.entries[key]
+
+    def put(self, key, predicted, seconds, top_n):
+        self.entries[key] = {'predicted': predicted, 'seconds': seconds, 'top_n': top_n}
+
+    def save(self):
+        # Write to a temporary file and replace the cache,
+        # so that a crash never leaves a partially written cache.
+        if not self.path:
+            return
+        with open(f'{self.path}.part', 'w', encoding = 'utf-8') as file:
+            json.dump(self.entries, file)
+        os.replace(f'{self.path}.part', self.path)
+
+
+def read_dataset(path):
+    """
+    Function which reads the language of a dataset, and its documents
+    in a dictionary of (text, assigned keyphrases) keyed by the document name.
+    """
+    # Find the language of the current dataset.
+    with open(os.path.join(path, 'language.txt'),
+              'r', encoding = 'utf-8-sig', errors = 'ignore') as text:
+        language = text.read().rstrip().lower()
+
+    # The documents and their keys are paired by the sorted order of their names.
+    docnames = sorted(os.listdir(os.path.join(path, 'docsutf8')))
+    keynames = sorted(os.listdir(os.path.join(path, 'keys')))
+    documents = {}
+
+    for docname, keyname in zip(docnames, keynames):
+        with open(os.path.join(path, 'docsutf8', docname), 'r', encoding = 'utf-8-sig', errors = 'ignore') as text, \
+             open(os.path.join(path, 'keys', keyname), 'r', encoding = 'utf-8-sig', errors = 'ignore') as keys:
+            documents[docname] = (text.read().replace('\n', ' '), keys.read().splitlines())
+    return language, documents
+
+
+def extract_keys(task):
+    """
+    Function which runs one method on one document, in a worker process,
+    and returns the predicted keyphrases along with the extraction time.
+    The models are loaded once for each process, by the registry.
+    """
+    method, text, top_n = task
+    start_time = time.perf_counter()
+    if method == 'Yake':
+        predicted = CordisKG.models.yake(text, dedupFunc = 'seqm', windowsSize = 1, top_n = top_n)
+    elif method == 'Textrank':
+        predicted = CordisKG.models.textrank(text, models.spacy(pipes = ('textrank',)), top_n = top_n)
+    else:
+        predicted = CordisKG.models.singlerank(text, top_n = top_n)
+    return predicted, time.perf_counter() - start_time
+
+
+def run_experiments(dirpath, outpath, top_n, ngram_range, embeddings_path,
+                    cache_path = None, workers = 1, score_at = None, checkpoint_every = 100,
+                    cache_top_n = None):
+    """
+    Function which benchmarks the keyphrase extraction methods on every dataset
+    of the directory, and writes the mean partial match of each method at each
+    cutoff of score_at, along with the percentiles of its latency per document.
+    The (dataset, document, method) tasks which are missing from the prediction
+    cache are run by a pool of worker processes, except for KeyBERT,
+    which embeds the documents in batches in the main process,
+    thus its latency is the time of its batches averaged over their documents.
+    The ranked keyphrases are extracted and cached up to the largest of top_n,
+    score_at and cache_top_n, and are sliced at each cutoff, thus the cache
+    is reused for any smaller top_n. KeyBERT with Max Sum chooses the most
+    diverse combination of exactly top_n keyphrases, which is not a prefix
+    of a larger one, thus its cache is keyed by top_n as well.
+    """
+    score_at = score_at or [top_n]
+    max_n = max([top_n, cache_top_n or 0] + score_at)
+    cache = PredictionCache(cache_path)
+
+    def entry_key(method, text):
+        parameters = {'ngram_range': ngram_range}
+        if method == 'Keybert':
+            parameters['top_n'] = top_n
+        return cache.key(method, parameters, text)
+
+    def method_top_n(method):
+        return top_n if method == 'Keybert' else max_n
+
+    # Read every dataset, and normalize the assigned keyphrases once,
+    # into the token sets which the partial match intersects.
+    # Keybert needs the text to be larger in terms than 2 * top_n,
+    # thus the shorter documents are skipped by every method.
+    datasets = {}
+    for directory in sorted(next(os.walk(dirpath))[1]):
+        language, documents = read_dataset(os.path.join(dirpath, directory))
+        normalizer = load_normalizer(language)
+        datasets[directory] = (language, {
+            docname: (text, normalizer.token_sets(actual_tags))
+            for docname, (text, actual_tags) in documents.items()
+            if len(text.split()) >= 2 * top_n
+        })
+
+    # Find the tasks, whose predictions are not cached,
+    # the documents which appear in several datasets are run once.
+    tasks = {}
+    for _, documents in datasets.values():
+        for text, _ in documents.values():
+            for method in methods:
+                key = entry_key(method, text)
+                if not cache.covers(key, method_top_n(method)):
+                    tasks[key] = (method, text, key)
+    pending = list(tasks.values())
+    keybert_pending = [task for task in pending if task[0] == 'Keybert']
+    pending = [task for task in pending if task[0] != 'Keybert']
+    print(f'{len(pending) + len(keybert_pending)} tasks are not cached.')
+
+    if keybert_pending:
+        # The embeddings are shared by all datasets and reruns.
+        embeddings = EmbeddingCache(embeddings_path, 'distiluse-base-multilingual-cased-v2')
+        texts = [text for _, text, _ in keybert_pending]
+        start_time = time.perf_counter()
+        keybert_keys = CordisKG.models.keybert_batch(
+            texts, models.keybert(), embeddings, ngram_range = ngram_range,
+            measure = 'maxsum', diversity = 0.7, top_n = top_n
+        )
+        seconds = (time.perf_counter() - start_time) / len(texts)
+        for (_, _, key), predicted in zip(keybert_pending, keybert_keys):
+            cache.put(key, predicted, seconds, top_n)
+        cache.save()
+
+    tasks = ((method, text, max_n) for method, text, _ in pending)
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers = workers)
+        # The metrics of the workers are merged, as their results are read.
+        results = merged(executor.map(collect_metrics(extract_keys), tasks, chunksize = 8))
+    else:
+        executor = None
+        results = map(extract_keys, tasks)
+    try:
+        for j, ((_, _, key), (predicted, seconds)) in enumerate(zip(pending, results), start = 1):
+            cache.put(key, predicted, seconds, max_n)
+            if j % checkpoint_every == 0:
+                print(f'Processed {j} in {len(pending)} tasks.')
+                cache.save()
+    finally:
+        cache.save()
+        if executor is not None:
+            executor.shutdown()
+
+    # Score the cached predictions of each dataset.
     data = []
+    for directory, (language, documents) in datasets.items():
+        normalizer = load_normalizer(language)
+        scores = {(method, n): [] for method in methods for n in score_at}
+        latencies = {method: [] for method in methods}
+        for text, actual_tags in documents.values():
+            for method in methods:
+                entry = cache.get(entry_key(method, text))
+                latencies[method].append(entry['seconds'])
+                # Convert the tags to lowercase, strip punctuation and then apply stemming,
+                # once for all cutoffs, since each cutoff scores a prefix of the same tags.
+                predicted_tags = normalizer.token_sets(entry['predicted'][:max(score_at)])
+                for n in score_at:
+                    scores[(method, n)].append(
+                        CordisKG.metrics.partial_match(actual_tags, predicted_tags[:n])
+                    )
+
+        # Each row has the dataset name prepended at the start.
+        data.append(
+            [directory] +
+            [np.mean(scores[(method, n)]) if documents else np.nan for n in score_at for method in methods] +
+            [
+                1000 * np.percentile(latencies[method], q) if documents else np.nan
+                for method in methods for q in (50, 90, 99)
+            ]
+        )
 
-    for i, directory in enumerate(directories):
-        print(f'Processing {i} in {len(directories)} datasets.')
-        # Initialize the empty document set.
-        documents = {}
-        language = ''
-
-        # Change current working directory to the dataset directory.
-        os.chdir(os.path.join(dirpath, directory))
-
-        # Find the language of the current dataset.
-        with open(os.path.join(os.getcwd(), 'language.txt'), 
-                  'r', encoding = 'utf-8-sig', errors = 'ignore') as text:
-            language = text.read().rstrip().lower()
-        
-        # Find document / key filenames and paths.
-        # Each time we enter the subdirectory 
-        # of the current working directory.
-        # First the docs then the keys subdirectory.
-
-        os.chdir(os.path.join(os.getcwd(), 'docsutf8'))
-        docnames = sorted(os.listdir())
-        docpaths = list(map(os.path.abspath, docnames))
-
-        os.chdir(os.path.join(os.getcwd(), '../keys'))
-        keynames = sorted(os.listdir())
-        keypaths = list(map(os.path.abspath, keynames))
-
-        for (docname, docpath, keypath) in zip(docnames, docpaths, keypaths):
-            with open(docpath, 'r', encoding = 'utf-8-sig', errors = 'ignore') as text, \
-                 open(keypath, 'r', encoding = 'utf-8-sig', errors = 'ignore') as keys:
-                documents[docname] = (
-                    [text.read().replace('\n', ' ')]
-                    + [keys.read().splitlines()]
-                )
-
-        mean_f1_measures = [0.0, 0.0, 0.0, 0.0]
-        # Each method produces tags has a default n-gram range from 1 to 3.
-        total = len(documents)
-        skipped = 0
-        for j, (key, (text, actual_tags)) in enumerate(documents.items()):
-            # Keybert needs the text to be larger in terms than 2 * top_n.
-            if len(text.split()) < 2 * top_n:
-                skipped += 1
-                continue
-
-            print(f'Processing {j} in {total} documents.')
-            for k, predicted_tags in enumerate([
-                CordisKG.models.yake(text, dedupFunc = 'seqm', windowsSize = 1, top_n = top_n),
-                CordisKG.models.keybert(text, bert_model, ngram_range = ngram_range, 
-                                      measure = 'maxsum', diversity = 0.7, top_n = top_n),
-                CordisKG.models.textrank(text, nlp_model, top_n = top_n), 
-                CordisKG.models.singlerank(text, top_n = top_n)
-            ]):
-                # Convert the tags to lowercase, strip punctuation and then apply stemming.
-                actual_tags = CordisKG.utils.preprocess(actual_tags, language)
-                predicted_tags = CordisKG.utils.preprocess(predicted_tags, language)
-
-                # All of f1 measures from each method and text are being summed,
-                # separately for each method, the mean is calculated in the list 
-                # comprehension, found below this nested loop.
-                mean_f1_measures[k] += CordisKG.metrics.partial_match (
-                    actual_tags, predicted_tags
-                )
-            CordisKG.utils.clear_screen()
-
-        mean_f1_measures = [
-            sum_f1_measure / (total - skipped) 
-            for sum_f1_measure in mean_f1_measures
-        ]
-        # Append f1 measure list for each document to the data list of lists,
-        # each list has the dataset name prepended at the start of the row.
-        data.append([directory] + mean_f1_measures)
-        CordisKG.utils.clear_screen()
-        break # Debug line
-
-    # Construct the dataframe.
-    df = pd.DataFrame(data, columns = [
-        f'pF1@{top_n}','Yake', 'Keybert',
-         'Textrank', 'Singlerank'
-    ])
+    # Construct the dataframe, with the quality and the latency of each method side by side.
+    df = pd.DataFrame(data, columns =
+        ['Dataset'] +
+        [f'{method} pF1@{n}' for n in score_at for method in methods] +
+        [f'{method} p{q} (ms)' for method in methods for q in (50, 90, 99)]
+    )
     # Set the index to the first column and save to excel.
-    df.set_index([f'pF1@{top_n}']).to_excel(outpath)
+    df.set_index(['Dataset']).to_excel(outpath)
+    return df
@@ -1,69 +1,242 @@
+import os
+import csv
+import glob
+import math
 import pandas
+import hashlib
 import CordisKG.models
 import CordisKG.utils
+from functools import partial
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from CordisKG.matcher import load_matcher
+from CordisKG.registry import models
+from CordisKG.manifest import Manifest
+from CordisKG.batching import chunks, bounded_map
 
-def export_keys_to_csv(input_csv, output_csv, aux_keys_path, top_n, ngram_range, cutoff, id_field, text_field):
+def load_worker_models(aux_keys_path, word_boundaries):
+    """
+    Function which loads the spacy, pke and yake state
+    and the auxiliary keyphrases matcher of an export,
+    once for each process.
+    """
+    models.spacy(pipes = ('textrank', 'textrank_texts'))
+    models.spacy_pke()
+    load_matcher(aux_keys_path, word_boundaries)
+
+
+def extract_keys(text, textrank_phrases, aux_keys_matcher, top_n, ngram_range, cutoff):
+    """
+    Function which extracts the keyphrases of a text, by combining
+    its TextRank phrases with SingleRank, YAKE and the auxiliary keyphrases.
+    The keyphrases are returned in a ';' separated string.
+    """
+    # Find if any of the auxiliary keys is present in the text.
+    found_aux_keys = aux_keys_matcher.find(text)
+
+    # Extract keyphrases from the text using the selected methods.
+    #CordisKG.models.keybert(text, bert_model, ngram_range, top_n = top_n, measure = 'maxsum', diversity = 0.7),
+    extracted_keys = [
+        textrank_phrases,
+        CordisKG.models.singlerank(text, top_n = top_n),
+        CordisKG.models.yake(text, ngram_range, top_n = top_n, dedupFunc = 'seqm')
+    ]
+
+    # Flatten the list of extracted keyphrases into a single list of all keyphrases
+    # and remove common strings from this list.
+    all_extracted_keys = (
+    CordisKG.utils.remove_common_strings_from_list (
+        CordisKG.utils.flatten_list(extracted_keys),
+        cutoff
+    ))
+
+    # Enhance the list of extracted keys, with the found auxiliary keys.
+    all_extracted_keys += found_aux_keys
+    return ';'.join(all_extracted_keys)
+
+
+def extract_keys_shard(shard, aux_keys_path, top_n, ngram_range, cutoff, word_boundaries, batch_size):
+    """
+    Function which extracts the keyphrase strings of a shard of texts
+    in a worker process, and returns them in the order of the shard.
+    """
+    aux_keys_matcher = load_matcher(aux_keys_path, word_boundaries)
+    textrank_keys = CordisKG.models.textrank_pipe(
+        enumerate(shard), top_n = top_n, batch_size = batch_size
+    )
+    return [
+        extract_keys(shard[i], textrank_phrases, aux_keys_matcher, top_n, ngram_range, cutoff)
+        for i, textrank_phrases in textrank_keys
+    ]
+
+
+def read_exported_keys(output_csv, id_field):
+    """
+    Function which reads the keyphrases of a previous export,
+    along with the delta csvs of an interrupted export,
+    in a dictionary keyed by the string of each id,
+    where the rows of the later deltas replace the earlier rows.
+    """
+    keyphrase_strings = {}
+    for path in [output_csv] + sorted(glob.glob(f'{output_csv}.delta*[0-9]')):
+        if os.path.exists(path):
+            rows = pandas.read_csv(path, sep = ',', dtype = str, keep_default_na = False)
+            keyphrase_strings.update(zip(rows[id_field], rows['keyphrases']))
+    return keyphrase_strings
+
+
+def export_keys_to_csv(input_csv, output_csv, aux_keys_path, top_n, ngram_range, cutoff, id_field, text_field,
+                       word_boundaries = False, batch_size = 64, n_process = 1, workers = 1, checkpoint_every = 1000):
     """
     Function that reads an input csv, and produces an output csv,
     which has a column with extracted keyphrases from the text.
+    If workers is larger than 1, the rows are split in shards,
+    which are processed by a pool of worker processes.
+    Only the rows which are new or have changed since the previous export
+    are processed. Every checkpoint_every rows, or every shard of the workers,
+    the new rows are written to a delta csv, and the output is rewritten
+    with the delta csvs, in the order of the input rows, once at the end.
     """
-    # Initialize the spacy and keybert models.
-    nlp_model, bert_model = CordisKG.utils.load_models()
-
-    # Clear the screen after loading the models
-    CordisKG.utils.clear_screen()
-
-    # Read the input_csv
-    rows = pandas.read_csv(input_csv, sep = ';')
-    total = len(rows)
-    data = []
-
-    # Read all auxiliary keyphrases
-    with open(aux_keys_path, 'r', encoding = 'utf-8-sig', errors = 'ignore') as keys:
-        aux_keys = keys.read().splitlines()
-
-    for i in range(total):
-        print(f'Processing {i} in {total} documents.')
-
-        # Read the text from row.
-        text = str(rows[text_field].iloc[i]).replace('\n', ' ')
-
-        # Find if any of the auxiliary keys is present in the text.
-        found_aux_keys = CordisKG.utils.find_keys_in_text(text, aux_keys)
-
-        # Extract keyphrases from the text using the selected methods.
-        #CordisKG.models.keybert(text, bert_model, ngram_range, top_n = top_n, measure = 'maxsum', diversity = 0.7),
-        extracted_keys = [
-            CordisKG.models.textrank(text, nlp_model, top_n = top_n), 
-            CordisKG.models.singlerank(text, top_n = top_n),
-            CordisKG.models.yake(text, ngram_range, top_n = top_n, dedupFunc = 'seqm')
-        ]
-
-        # Flatten the list of extracted keyphrases into a single list of all keyphrases
-        # and remove common strings from this list.
-        all_extracted_keys = (
-        CordisKG.utils.remove_common_strings_from_list (
-            CordisKG.utils.flatten_list(extracted_keys),
-            cutoff
-        ))
-
-        # Enhance the list of extracted keys, with the found auxiliary keys.
-        all_extracted_keys += found_aux_keys
-        keyphrase_string = ';'.join(all_extracted_keys)
-
-        # Format all keyphrases to be newline separated strings.
-        data.append([
-            rows[id_field].iloc[i],
-            f'{keyphrase_string}'
-        ])
+    def read_rows():
+        # The texts are streamed from the input_csv in each pass,
+        # rather than held in memory for the whole export.
+        rows = CordisKG.utils.read_csv_rows(input_csv, sep = ';', usecols = [id_field, text_field])
+        for row in rows:
+            yield getattr(row, id_field), str(getattr(row, text_field)).replace('\n', ' ')
+
+    # The manifest keeps the hash of each text, along with the parameters,
+    # and the auxiliary keyphrases, that its keyphrases were extracted with.
+    with open(aux_keys_path, 'rb') as keys:
+        aux_keys_hash = hashlib.sha1(keys.read()).hexdigest()
+    manifest = Manifest(f'{output_csv}.manifest', {
+        'top_n': top_n, 'ngram_range': ngram_range, 'cutoff': cutoff,
+        'word_boundaries': word_boundaries, 'aux_keys': aux_keys_hash
+    })
+    delta_pattern = f'{output_csv}.delta*[0-9]'
+    if not manifest.entries:
+        # The deltas of an export with other parameters are stale.
+        for delta_csv in glob.glob(delta_pattern):
+            os.remove(delta_csv)
+    keyphrase_strings = read_exported_keys(output_csv, id_field) if manifest.entries else {}
+
+    # The first pass keeps only the ids, in the order of the output,
+    # and the positions of the rows which are new or have changed.
+    ids, pending = [], []
+    for i, (id, text) in enumerate(read_rows()):
+        ids.append(id)
+        if manifest.changed(id, text) or str(id) not in keyphrase_strings:
+            pending.append(i)
+    total = len(ids)
+    print(f'{len(pending)} out of {total} documents are new or changed.')
+
+    def pending_rows():
+        # The second pass streams the (position, text) pairs of the pending rows.
+        positions = iter(pending)
+        position = next(positions, None)
+        for i, (_, text) in enumerate(read_rows()):
+            if i == position:
+                yield i, text
+                position = next(positions, None)
+
+    rows = []
+    def record(i, text, keyphrase_string):
+        keyphrase_strings[str(ids[i])] = keyphrase_string
+        manifest.update(ids[i], text)
+        rows.append([ids[i], keyphrase_string])
+
+    def checkpoint():
+        # Write the new rows into the next delta csv, and then save the manifest,
+        # so the manifest never marks a row, whose keyphrases were not written.
+        if not rows:
+            return
+        delta_csv = f'{output_csv}.delta{len(glob.glob(delta_pattern)):06d}'
+        with open(f'{delta_csv}.part', 'w', encoding = 'utf-8', newline = '') as file:
+            writer = csv.writer(file, lineterminator = '\n')
+            writer.writerow([id_field, 'keyphrases'])
+            writer.writerows(rows)
+        os.replace(f'{delta_csv}.part', delta_csv)
+        manifest.save()
+        rows.clear()
+
+    if workers > 1:
+        # Several shards per worker balance the load of the pool,
+        # while at most twice the workers shards are in flight,
+        # and their keyphrases are returned in the order of the shards.
+        shard_size = max(1, min(checkpoint_every, math.ceil(len(pending) / (4 * workers))))
+        extract = partial(
+            extract_keys_shard, aux_keys_path = aux_keys_path,
+            top_n = top_n, ngram_range = ngram_range, cutoff = cutoff,
+            word_boundaries = word_boundaries, batch_size = batch_size
+        )
+        shards = deque()
+        def shard_texts():
+            for shard in chunks(pending_rows(), shard_size):
+                shards.append(shard)
+                yield [text for _, text in shard]
+
+        processed = 0
+        with ProcessPoolExecutor(
+            max_workers = workers, initializer = load_worker_models,
+            initargs = (aux_keys_path, word_boundaries)) as executor:
+            for shard_keys in bounded_map(executor, extract, shard_texts(), 2 * workers):
+                shard = shards.popleft()
+                for (i, text), keyphrase_string in zip(shard, shard_keys):
+                    record(i, text, keyphrase_string)
+                processed += len(shard)
+                print(f'Processed {processed} in {len(pending)} documents.')
+                checkpoint()
+    else:
+        # Initialize the spacy model of TextRank, keybert is not used by this export.
+        load_worker_models(aux_keys_path, word_boundaries)
+
+        # Clear the screen after loading the models
         CordisKG.utils.clear_screen()
-        #break # Debug line
-    
-    # Construct the dataframe.
-    df = pandas.DataFrame(data, columns = [
-        id_field, 'keyphrases'
-    ])
-
-    # Set the index to the first column and save to a csv file.
-    df.set_index([id_field]).to_csv(output_csv)
+
+        # Compile all auxiliary keyphrases into a matcher,
+        # which is shared by all exports of the same run.
+        aux_keys_matcher = load_matcher(aux_keys_path, word_boundaries)
+
+        # TextRank streams the texts through spacy in batches,
+        # while the rest of the methods process each text in turn.
+        # Only the texts which spacy has not yielded yet are buffered.
+        buffered = {}
+        def pending_texts():
+            for i, text in pending_rows():
+                buffered[i] = text
+                yield i, text
+
+        textrank_keys = CordisKG.models.textrank_pipe(
+            pending_texts(), top_n = top_n,
+            batch_size = batch_size, n_process = n_process
+        )
+        for j, (i, textrank_phrases) in enumerate(textrank_keys, start = 1):
+            print(f'Processing {i} in {total} documents.')
+            text = buffered.pop(i)
+            record(i, text, extract_keys(
+                text, textrank_phrases, aux_keys_matcher,
+                top_n, ngram_range, cutoff
+            ))
+            if j % checkpoint_every == 0:
+                checkpoint()
+            CordisKG.utils.clear_screen()
+            #break # Debug line
+
+    checkpoint()
+
+    # Construct the dataframe, in the order of the input rows,
+    # where the records which are no longer in the input are dropped.
+    df = pandas.DataFrame([
+        [id, keyphrase_strings[str(id)]] for id in ids
+        if str(id) in keyphrase_strings
+    ], columns = [id_field, 'keyphrases'])
+
+    # Set the index to the first column and save to a csv file, which
+    # replaces the output at once, so a crash never leaves a truncated output.
+    # The manifest is saved after its output, and the deltas are removed last.
+    df.set_index([id_field]).to_csv(f'{output_csv}.part')
+    os.replace(f'{output_csv}.part', output_csv)
+    manifest.retain(ids)
+    manifest.save()
+    for delta_csv in glob.glob(delta_pattern):
+        os.remove(delta_csv)
     return
@@ -1,29 +1,119 @@
 import os
-import pandas
-from CordisKG.utils import counter, load_models, clear_screen, postprocess
+import csv
+import glob
+from itertools import chain
+from CordisKG.utils import counter, clear_screen, postprocess
+from CordisKG.registry import models
+from CordisKG.manifest import Manifest, file_fingerprint
+
+def read_rows(path):
+    """
+    Function which lazily reads the rows of a csv, without its header.
+    """
+    with open(path, 'r', encoding = 'utf-8', newline = '') as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        yield from reader
+
+
+def merge_persons(persons_csv, delta_csvs, docnames):
+    """
+    Function which merges the rows of the delta csvs into the persons csv.
+    All of them are sorted in the order of the documents, so they are merged
+    as streams, where the delta rows replace the previous rows of the same rcn.
+    Rows without persons, or of documents that no longer exist, are dropped.
+    """
+    existing = set(docnames)
+    previous = read_rows(persons_csv) if os.path.exists(persons_csv) else iter(())
+    delta = chain.from_iterable(map(read_rows, delta_csvs))
+
+    def key(row):
+        return f'{row[0]}.txt'
+
+    def merged():
+        p, d = next(previous, None), next(delta, None)
+        while p is not None or d is not None:
+            if d is None or (p is not None and key(p) < key(d)):
+                yield p
+                p = next(previous, None)
+            else:
+                if p is not None and key(p) == key(d):
+                    p = next(previous, None)
+                yield d
+                d = next(delta, None)
+
+    with open(f'{persons_csv}.part', 'w', encoding = 'utf-8', newline = '') as file:
+        writer = csv.writer(file, lineterminator = '\n')
+        writer.writerow(['rcn', 'persons'])
+        for rcn, persons in merged():
+            if persons and f'{rcn}.txt' in existing:
+                writer.writerow([rcn, persons])
+    os.replace(f'{persons_csv}.part', persons_csv)
+    for delta_csv in delta_csvs:
+        os.remove(delta_csv)
+
+
+def read_documents(pending):
+    """
+    Function which lazily reads the pending documents, as (text, context) 
+    tuples for nlp.pipe(), where the context is the docname and its fingerprint.
+    """
+    for docname, docpath in pending:
+        fingerprint = file_fingerprint(docpath)
+        with open(docpath, 'r', encoding = 'utf-8-sig', errors = 'ignore') as file:
+            yield file.read().replace('\n', ' '), (docname, fingerprint)
+
 
 @counter
-def extract_persons_to_csv(deliverables_dir, persons_csv):
-    nlp_model = load_models()[0]
-    rows = []
+def extract_persons_to_csv(deliverables_dir, persons_csv, checkpoint_every = 1000, batch_size = 64, n_process = 1):
+    """
+    Function which extracts the persons of each deliverable .txt into a csv.
+    The documents are streamed through the NER pipeline of spacy with nlp.pipe(),
+    and only the documents which are new or have changed since the previous
+    extraction are processed. Every checkpoint_every documents, their rows
+    are written to a delta csv, which is merged into the persons csv at the end.
+    """
+    # Only the named entities are used, so the rest of the pipeline is not loaded.
+    nlp_model = models.spacy_ner()
     
     # Change current working directory to the deliverables directory.
     os.chdir(deliverables_dir)
 
     # Find document filenames and paths.
-    docnames = sorted(os.listdir())
+    docnames = sorted(name for name in os.listdir() if name.endswith('.txt'))
     docpaths = list(map(os.path.abspath, docnames))
 
-    total = len(docnames)
-    for i, (docname, docpath) in enumerate(zip(docnames, docpaths)):
-        print(f'Processing {i} in {total} documents.')
+    # The manifest keeps the size and modification time of each document.
+    manifest = Manifest(f'{persons_csv}.manifest', {'model': nlp_model.meta['name']})
 
-        # Open the file and read the text.
-        with open(docpath, 'r', encoding = 'utf-8-sig', errors = 'ignore') as file:
-            text = file.read().replace('\n', ' ')
+    # Merge the checkpointed rows of an interrupted run first.
+    delta_pattern = f'{persons_csv}.delta*[0-9]'
+    merge_persons(persons_csv, sorted(glob.glob(delta_pattern)), docnames)
+
+    pending = [
+        (docname, docpath) for docname, docpath in zip(docnames, docpaths)
+        if manifest.changed(docname, file_fingerprint(docpath))
+    ]
+    rows = []
+
+    def checkpoint():
+        # Write the rows into the next delta csv, and then save the manifest.
+        delta_csv = f'{persons_csv}.delta{len(glob.glob(delta_pattern)):06d}'
+        with open(f'{delta_csv}.part', 'w', encoding = 'utf-8', newline = '') as file:
+            writer = csv.writer(file, lineterminator = '\n')
+            writer.writerow(['rcn', 'persons'])
+            writer.writerows(rows)
+        os.replace(f'{delta_csv}.part', delta_csv)
+        manifest.save()
+        rows.clear()
 
-        # Perform NER with spacy.
-        doc = nlp_model(text)
+    total = len(pending)
+    docs = nlp_model.pipe(
+        read_documents(pending), as_tuples = True,
+        batch_size = batch_size, n_process = n_process
+    )
+    for i, (doc, (docname, fingerprint)) in enumerate(docs):
+        print(f'Processing {i} in {total} new or changed documents.')
 
         # Extract entities of the text that are classified
         # as persons with full names. 
@@ -38,22 +128,24 @@ def extract_persons_to_csv(deliverables_dir, persons_csv):
         # and extra whitespace from each name in the list.
         persons = [x for x in postprocess(persons) if x.strip()]
 
-        # If the persons list is empty, then continue to the next deliverable.
-        if not persons: continue
-
         # Isolate the name of the file, which is the rcn.
         rcn = docname.split('.txt')[0]
 
-        # Each row is a list of rcn and persons 
-        # in a ';' separated string.
+        # Each row is the rcn and persons in a ';' separated string.
+        # An empty persons string removes the previous row of the rcn.
         rows.append([rcn, ';'.join(persons)])
+        manifest.update(docname, fingerprint)
+
+        if len(rows) == checkpoint_every:
+            checkpoint()
         clear_screen()
 
-    # Write all rows into a dataframe
-    df = pandas.DataFrame(rows, columns = [
-        'rcn', 'persons'
-    ])
+    if rows:
+        checkpoint()
 
-    # Set the index to the first column and save to an csv file.
-    df.set_index(['rcn']).to_csv(persons_csv)
+    # Merge the delta csvs into the persons csv, 
+    # and drop the documents which no longer exist.
+    merge_persons(persons_csv, sorted(glob.glob(delta_pattern)), docnames)
+    manifest.retain(docnames)
+    manifest.save()
     return
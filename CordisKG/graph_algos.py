@@ -1,9 +1,14 @@
+import uuid
 import traceback
+from CordisKG.instrumentation import counter
 
 class GraphAlgos:
     """
     Wrapper class which handle the graph algorithms 
     more efficiently, by abstracting repeating code.
+    The graph is projected once in memory, when the with statement is entered,
+    and every algorithm mutates the projection, while the computed
+    properties are written back together, when the with statement exits.
     """
     database = None # Static variable shared across objects.
 
@@ -27,40 +32,94 @@ class GraphAlgos:
         self.rel_list = rel_list
         self.orientation = orientation
 
-        # Construct the projection of the anonymous graph.
-        self.graph_projection = (
-            f'{{nodeProjection: {node_list}, '
-            f'relationshipProjection: {{{rel_string}}}'
-        )
-
-    def pagerank(self, write_property, max_iterations = 20, damping_factor = 0.85):
+        # Construct the projection of the named graph.
+        self.graph_projection = f'{node_list}, {{{rel_string}}}'
+        self.graph_name = None
+
+        # The node properties and (relationship, property) pairs,
+        # which were computed in the projection and are written back on exit.
+        # The database returns no result for a failed algorithm,
+        # thus its property is not written back.
+        self.node_properties = []
+        self.relationships = []
+
+    @counter
+    def project(self):
+        if self.graph_name is None:
+            self.graph_name = f'cordiskg_{uuid.uuid4().hex}'
+            GraphAlgos.database.execute(
+                f'CALL gds.graph.create("{self.graph_name}", {self.graph_projection})', 'w'
+            )
+
+    def filters(self, node_labels, relationship_types):
+        # Restrict an algorithm to a subgraph of the projection.
+        setup = ''
+        if node_labels:
+            setup += f'nodeLabels: {list(node_labels)}, '
+        if relationship_types:
+            setup += f'relationshipTypes: {list(relationship_types)}, '
+        return setup
+
+    @counter
+    def pagerank(self, write_property, max_iterations = 20, damping_factor = 0.85,
+                 node_labels = None, relationship_types = None):
+        self.project()
         setup = (
-            f'{self.graph_projection}, '
-            f'writeProperty: "{write_property}", '
+            f'{{{self.filters(node_labels, relationship_types)}'
+            f'mutateProperty: "{write_property}", '
             f'maxIterations: {max_iterations}, '
             f'dampingFactor: {damping_factor}}}'
         )
-        GraphAlgos.database.execute(f'CALL gds.pageRank.write({setup})', 'w')
+        if GraphAlgos.database.execute(f'CALL gds.pageRank.mutate("{self.graph_name}", {setup})', 'w') is not None:
+            self.node_properties.append(write_property)
 
-    def nodeSimilarity(self, write_property, write_relationship, cutoff = 0.5, top_k = 10):
+    @counter
+    def nodeSimilarity(self, write_property, write_relationship, cutoff = 0.5, top_k = 10,
+                       node_labels = None, relationship_types = None):
+        self.project()
         setup = (
-            f'{self.graph_projection}, '
-            f'writeProperty: "{write_property}", '
-            f'writeRelationshipType: "{write_relationship}", '
+            f'{{{self.filters(node_labels, relationship_types)}'
+            f'mutateProperty: "{write_property}", '
+            f'mutateRelationshipType: "{write_relationship}", '
             f'similarityCutoff: {cutoff}, '
             f'topK: {top_k}}}'
         )
-        query = f'CALL gds.nodeSimilarity.write({setup})'
-        GraphAlgos.database.execute(f'CALL gds.nodeSimilarity.write({setup})', 'w')
+        if GraphAlgos.database.execute(f'CALL gds.nodeSimilarity.mutate("{self.graph_name}", {setup})', 'w') is not None:
+            self.relationships.append((write_relationship, write_property))
 
-    def louvain(self, write_property, max_levels = 10, max_iterations = 10):
+    @counter
+    def louvain(self, write_property, max_levels = 10, max_iterations = 10,
+                node_labels = None, relationship_types = None):
+        self.project()
         setup = (
-            f'{self.graph_projection}, '
-            f'writeProperty: "{write_property}", '
+            f'{{{self.filters(node_labels, relationship_types)}'
+            f'mutateProperty: "{write_property}", '
             f'maxLevels: {max_levels}, '
             f'maxIterations: {max_iterations}}}'
         )
-        GraphAlgos.database.execute(f'CALL gds.louvain.write({setup})', 'w')
+        if GraphAlgos.database.execute(f'CALL gds.louvain.mutate("{self.graph_name}", {setup})', 'w') is not None:
+            self.node_properties.append(write_property)
+
+    @counter
+    def write(self, node_labels = None):
+        """
+        Writes the computed node properties in a single pass,
+        and each computed relationship type along with its property.
+        If node_labels is given, the node properties are only written
+        for the nodes of these labels, e.g. of an algorithm on a subgraph.
+        """
+        node_properties = list(dict.fromkeys(self.node_properties))
+        if node_properties:
+            labels = f', {list(node_labels)}' if node_labels else ''
+            GraphAlgos.database.execute(
+                f'CALL gds.graph.writeNodeProperties("{self.graph_name}", {node_properties}{labels})', 'w'
+            )
+        for relationship, write_property in self.relationships:
+            GraphAlgos.database.execute(
+                f'CALL gds.graph.writeRelationship("{self.graph_name}", '
+                f'"{relationship}", "{write_property}")', 'w'
+            )
+        self.node_properties, self.relationships = [], []
 
     def create_named_graph(self, named_graph):
         # Construct the node string.
@@ -141,9 +200,15 @@ class GraphAlgos:
 
     # These methods enable the use of this class in a with statement.
     def __enter__(self):
+        self.project()
         return self
 
-    # Automatic cleanup of the created graph of this class.
+    # Write the computed properties, and drop the projected graph of this class.
     def __exit__(self, exc_type, exc_value, tb):
         if exc_type is not None:
-            traceback.print_exception(exc_type, exc_value, tb)
\ No newline at end of file
+            traceback.print_exception(exc_type, exc_value, tb)
+        elif self.graph_name is not None:
+            self.write()
+        if self.graph_name is not None:
+            GraphAlgos.database.execute(f'CALL gds.graph.drop("{self.graph_name}")', 'w')
+            self.graph_name = None
@@ -0,0 +1,284 @@
+import os
+import csv
+import copy
+import json
+import math
+import time
+import inspect
+import platform
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+try: # psutil is optional, and measures the current resident memory.
+    import psutil
+except ImportError:
+    psutil = None
+
+try: # resource is not available on Windows.
+    import resource
+except ImportError:
+    resource = None
+
+
+def resident_memory():
+    """
+    Function which returns the resident memory of the process in bytes.
+    Without psutil, the peak resident memory is returned instead,
+    or 0 if neither psutil nor resource are available.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return peak_memory()
+
+
+def peak_memory():
+    """
+    Function which returns the peak resident memory of the process in bytes,
+    or the current resident memory, if the peak is not available.
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on OS X and in kilobytes on Linux.
+        return peak if platform.system() == 'Darwin' else peak * 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) # The peak is only reported on Windows.
+    return 0
+
+
+class Histogram:
+    """
+    Latency histogram with logarithmic buckets, where bucket i holds
+    the durations from 2^(i-1) up to 2^i microseconds, so that recording
+    a duration takes constant time and memory.
+    """
+    buckets = 48
+
+    def __init__(self):
+        self.counts = [0] * Histogram.buckets
+        self.calls = 0
+        self.items = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds, items = 0):
+        i = 0 if seconds <= 1e-6 else min(Histogram.buckets - 1, math.ceil(math.log2(seconds * 1e6)))
+        self.counts[i] += 1
+        self.calls += 1
+        self.items += items
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        # Adds the calls of another histogram, e.g. of a worker process.
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.calls += other.calls
+        self.items += other.items
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """
+        Returns the upper bound of the bucket of the q-th percentile in seconds,
+        bounded by the largest recorded duration.
+        """
+        rank, seen = q / 100 * self.calls, 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.max, 2 ** i * 1e-6)
+        return self.max
+
+
+class MetricsCollector:
+    """
+    Process-wide collector, which records the duration of every call
+    in a histogram keyed by the stage and the name of the function,
+    along with the number of calls and of the processed items.
+    Nothing is printed per call, the summary is dumped at the end of the run.
+    """
+    def __init__(self):
+        self.reset()
+        self.current_stage = contextvars.ContextVar('stage', default = 'main')
+
+    def reset(self):
+        self.histograms = {}
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        """
+        Returns a copy of the recorded calls and stages, which can be
+        pickled, e.g. by a worker process, and merged by the parent.
+        """
+        with self.lock:
+            return {'histograms': copy.deepcopy(self.histograms), 'stages': copy.deepcopy(self.stages)}
+
+    def merge(self, snapshot):
+        # Adds the calls and the stages of a snapshot to the collector.
+        with self.lock:
+            for key, histogram in snapshot['histograms'].items():
+                self.histograms.setdefault(key, Histogram()).merge(histogram)
+            for name, other in snapshot['stages'].items():
+                stage = self.stages.setdefault(name, {'seconds': 0.0, 'process_peak_memory': 0, 'memory_delta': 0})
+                stage['seconds'] += other['seconds']
+                stage['process_peak_memory'] = max(stage['process_peak_memory'], other['process_peak_memory'])
+                stage['memory_delta'] = max(stage['memory_delta'], other['memory_delta'])
+
+    def record(self, name, seconds, items = 0):
+        key = (self.current_stage.get(), name)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].record(seconds, items)
+
+    @contextmanager
+    def timer(self, name, items = 0):
+        """
+        Records the duration of the with block. The yielded dictionary
+        can update the number of items, once they are known.
+        """
+        measurement = {'items': items}
+        start_time = time.perf_counter()
+        try:
+            yield measurement
+        finally:
+            self.record(name, time.perf_counter() - start_time, measurement['items'])
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Records the calls of the with block under the stage, along with
+        its duration, the peak resident memory of the process at its end,
+        which includes every earlier stage, and the largest growth
+        of the resident memory during a block of the stage.
+        The durations of the blocks of a repeated stage are summed.
+        """
+        token = self.current_stage.set(name)
+        start_time, start_memory = time.perf_counter(), resident_memory()
+        try:
+            yield
+        finally:
+            self.current_stage.reset(token)
+            seconds = time.perf_counter() - start_time
+            memory_delta = resident_memory() - start_memory
+            with self.lock:
+                stage = self.stages.setdefault(name, {'seconds': 0.0, 'process_peak_memory': 0, 'memory_delta': 0})
+                stage['seconds'] += seconds
+                stage['process_peak_memory'] = max(stage['process_peak_memory'], peak_memory())
+                stage['memory_delta'] = max(stage['memory_delta'], memory_delta)
+
+    def summary(self):
+        return [
+            {
+                'stage': stage, 'name': name, 'calls': histogram.calls,
+                'items': histogram.items, 'total': histogram.total,
+                'mean': histogram.total / histogram.calls,
+                'p50': histogram.percentile(50), 'p90': histogram.percentile(90),
+                'p99': histogram.percentile(99), 'max': histogram.max
+            }
+            for (stage, name), histogram in sorted(self.histograms.items())
+        ]
+
+    def dump(self, path):
+        """
+        Writes the summary of the calls and the stages in a json file,
+        and the summary of the calls in a csv file, next to each other.
+        """
+        summary = self.summary()
+        with open(f'{path}.json', 'w', encoding = 'utf-8') as file:
+            json.dump({
+                'calls': summary, 'stages': self.stages, 'process_peak_memory': peak_memory()
+            }, file, indent = 2)
+        with open(f'{path}.csv', 'w', newline = '', encoding = 'utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames = [
+                'stage', 'name', 'calls', 'items', 'total', 'mean', 'p50', 'p90', 'p99', 'max'
+            ])
+            writer.writeheader()
+            writer.writerows(summary)
+
+
+# The collector is shared by all stages of the process, and a forked
+# worker process starts with an empty one, whose metrics it returns.
+metrics = MetricsCollector()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child = metrics.reset)
+
+
+class collect_metrics:
+    """
+    Wraps a function, which is run by a worker process, so that each call
+    returns its result along with the metrics it recorded in the worker,
+    under the stage of the parent at the time of wrapping.
+    The parent adds them to its collector with merged().
+    """
+    def __init__(self, function):
+        self.function = function
+        self.stage = metrics.current_stage.get()
+
+    def __call__(self, *args, **kwargs):
+        token = metrics.current_stage.set(self.stage)
+        try:
+            return self.function(*args, **kwargs), metrics.snapshot()
+        finally:
+            metrics.current_stage.reset(token)
+            metrics.reset()
+
+
+def merged(results):
+    """
+    Function which merges the metrics of the (result, snapshot) pairs
+    of collect_metrics() into the collector, and yields the results.
+    """
+    for result, snapshot in results:
+        metrics.merge(snapshot)
+        yield result
+
+
+def counter(func = None, items = None):
+    """
+    Records the elapsed time of each call of the function in the metrics collector.
+    If items is given, it is called with the arguments of the function,
+    and returns the number of items that the call processes.
+    The call of a generator function is recorded once it is exhausted or closed,
+    with the time spent in the generator, rather than in its consumer,
+    and with the number of yielded values, if items is not given.
+    """
+    if func is None:
+        return functools.partial(counter, items = items)
+
+    name = func.__qualname__
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def wrapper_generator(*args, **kwargs):
+            generator = func(*args, **kwargs)
+            seconds, count = 0.0, 0
+            try:
+                while True:
+                    start_time = time.perf_counter()
+                    try:
+                        value = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        seconds += time.perf_counter() - start_time
+                    count += 1
+                    yield value
+            finally:
+                generator.close()
+                metrics.record(name, seconds, items(*args, **kwargs) if items else count)
+        return wrapper_generator
+
+    @functools.wraps(func)
+    def wrapper_counter(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.record(
+                name, time.perf_counter() - start_time,
+                items(*args, **kwargs) if items else 0
+            )
+    return wrapper_counter
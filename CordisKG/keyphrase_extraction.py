@@ -4,10 +4,12 @@ import numpy as np
 import pandas as pd
 import CordisKG.models
 import CordisKG.utils
+from CordisKG.registry import models
+from CordisKG.embeddings import EmbeddingCache
 
-def keyphrase_extraction(input_path, out_path, top_n):
-    # Initialize the spacy and keybert models.
-    nlp_model, bert_model = CordisKG.utils.load_models()
+def keyphrase_extraction(input_path, out_path, top_n, embeddings_path, batch_size = 64):
+    # Initialize the keybert model.
+    bert_model = models.keybert()
 
     # Initialize the empty document set.
     documents = {}
@@ -30,17 +32,31 @@ def keyphrase_extraction(input_path, out_path, top_n):
     docnames = sorted(os.listdir())
     docpaths = list(map(os.path.abspath, docnames))
 
+    texts = {}
+    for docname, docpath in zip(docnames, docpaths):
+        with open(docpath, 'r', encoding = 'utf-8-sig', errors = 'ignore') as file:
+            texts[docname] = file.read().replace('\n', ' ')
+
+    # KeyBERT embeds all documents and candidates in batches, through the cache.
+    keybert_keys = CordisKG.models.keybert_batch(
+        list(texts.values()), bert_model, 
+        EmbeddingCache(embeddings_path, 'distiluse-base-multilingual-cased-v2'),
+        top_n = top_n, measure = 'maxsum', diversity = 0.7
+    )
+
+    # TextRank streams the documents through spacy in batches,
+    # while the rest of the methods process each document in turn.
     total = len(docnames)
-    for i, (docname, docpath) in enumerate(zip(docnames, docpaths)):
+    textrank_keys = CordisKG.models.textrank_pipe(texts.items(), top_n = top_n, batch_size = batch_size)
+    for i, (docname, textrank_phrases) in enumerate(textrank_keys):
         print(f'Processing {i} in {total} documents.')
-        with open(docpath, 'r', encoding = 'utf-8-sig', errors = 'ignore') as file:
-            text = file.read().replace('\n', ' ')
-            documents[docname] = {
-                '1-keybert': CordisKG.models.keybert(text, bert_model, top_n = top_n, measure = 'maxsum', diversity = 0.7),
-                '2-textrank': CordisKG.models.textrank(text, nlp_model, top_n = top_n),
-                '3-singlerank': CordisKG.models.singlerank(text, top_n = top_n),
-                '4-yake': CordisKG.models.yake(text, top_n = top_n, dedupFunc = 'seqm'),
-            }
+        text = texts[docname]
+        documents[docname] = {
+            '1-keybert': keybert_keys[i],
+            '2-textrank': textrank_phrases,
+            '3-singlerank': CordisKG.models.singlerank(text, top_n = top_n),
+            '4-yake': CordisKG.models.yake(text, top_n = top_n, dedupFunc = 'seqm'),
+        }
         CordisKG.utils.clear_screen()
 
     # Write ngrams from each method to a json file.
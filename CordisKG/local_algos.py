@@ -0,0 +1,488 @@
+import time
+import hashlib
+import traceback
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+from CordisKG.batching import chunks
+from CordisKG.instrumentation import counter
+
+class LocalGraphAlgos:
+    """
+    Wrapper class which runs the graph algorithms in-process,
+    as an alternative to the GDS procedures of the GraphAlgos class.
+    The projected nodes and relationships are pulled once into
+    a sparse adjacency matrix, and the results are written back
+    to the database in batches.
+    """
+    database = None # Static variable shared across objects.
+
+    def __init__(self, database, node_list, rel_list, orientation = "NATURAL", batch_size = 5000):
+        # Initialize the static variable and class member.
+        if LocalGraphAlgos.database is None:
+            LocalGraphAlgos.database = database
+
+        # Assign the graph details in the self object.
+        self.node_list = node_list
+        self.rel_list = rel_list
+        self.orientation = orientation
+        self.batch_size = batch_size
+
+        # The relationships are given either as types,
+        # or as (type, orientation, properties) tuples.
+        if type(rel_list[0]) is str:
+            self.rel_orientations = [(rel, orientation) for rel in rel_list]
+        else:
+            self.rel_orientations = [(rel[0], rel[1]) for rel in rel_list]
+
+        self.node_ids = None
+        self.node_labels = None
+        self.adjacencies = None
+
+    @counter
+    def project(self):
+        """
+        Pulls the nodes of the labels, and the relationships of the types
+        between them, into a csr matrix per type, where each row holds the
+        outgoing relationships of a node in the given orientation.
+        Parallel relationships are summed, as GDS keeps each one of them.
+        """
+        if self.adjacencies is not None:
+            return
+        start_time = time.perf_counter()
+        label_filter = ' OR '.join(f'n:{label}' for label in self.node_list)
+        result = LocalGraphAlgos.database.execute(
+            f'MATCH (n) WHERE {label_filter} RETURN id(n), labels(n)', 'r'
+        )
+        self.node_ids = np.array([row[0] for row in result], dtype = np.int64)
+        self.node_labels = [set(row[1]) for row in result]
+        index = {node_id: i for i, node_id in enumerate(self.node_ids.tolist())}
+
+        n = len(self.node_ids)
+        self.adjacencies = {}
+        for rel, orientation in self.rel_orientations:
+            result = LocalGraphAlgos.database.execute(
+                f'MATCH (a)-[:{rel}]->(b) RETURN id(a), id(b)', 'r'
+            )
+            # Only the relationships between projected nodes are kept.
+            pairs = [
+                (index[a], index[b]) for a, b in result
+                if a in index and b in index
+            ]
+            sources, targets = [], []
+            if pairs:
+                a, b = map(list, zip(*pairs))
+                if orientation in ('NATURAL', 'UNDIRECTED'):
+                    sources += a
+                    targets += b
+                if orientation in ('REVERSE', 'UNDIRECTED'):
+                    sources += b
+                    targets += a
+            self.adjacencies[rel] = csr_matrix(
+                (np.ones(len(sources)), (sources, targets)), shape = (n, n)
+            )
+        print(
+            f'Projected {n} nodes and '
+            f'{sum(matrix.nnz for matrix in self.adjacencies.values())} relationships '
+            f'in {time.perf_counter() - start_time:.2f} secs...'
+        )
+
+    def subgraph(self, node_labels = None, relationship_types = None):
+        """
+        Returns the indices of the nodes with any of the labels,
+        and the adjacency matrix of the relationship types between them,
+        which default to the whole projection, like the filters of GDS.
+        """
+        self.project()
+        n = len(self.node_ids)
+        types = relationship_types or list(self.adjacencies)
+        # The types which were not projected are skipped, thus
+        # no matching type results in an empty matrix of the same shape.
+        adjacency = sum(
+            (self.adjacencies[rel] for rel in types if rel in self.adjacencies),
+            csr_matrix((n, n))
+        ).tocsr()
+        if not node_labels:
+            return np.arange(n), adjacency
+        nodes = np.array([
+            i for i, labels in enumerate(self.node_labels)
+            if labels & set(node_labels)
+        ], dtype = np.int64)
+        return nodes, adjacency[nodes][:, nodes].tocsr()
+
+    @counter(items = lambda self, write_property, nodes, values: len(nodes))
+    def write_node_property(self, write_property, nodes, values):
+        """
+        Writes the values of the nodes to the property,
+        in batches of parameterized updates.
+        """
+        query = (
+            'UNWIND $rows AS row '
+            'MATCH (n) WHERE id(n) = row.id '
+            f'SET n.{write_property} = row.value'
+        )
+        rows = [
+            {'id': node_id, 'value': value}
+            for node_id, value in zip(self.node_ids[nodes].tolist(), values.tolist())
+        ]
+        LocalGraphAlgos.database.execute_many(
+            query, ({'rows': batch} for batch in chunks(rows, self.batch_size)),
+            batch_size = 1
+        )
+
+    @counter
+    def pagerank(self, write_property, max_iterations = 20, damping_factor = 0.85, tolerance = 1e-7,
+                 node_labels = None, relationship_types = None):
+        """
+        Runs PageRank with the same scores as GDS, where every node starts at
+        1 - damping_factor, and the rank of nodes without outgoing relationships
+        is not redistributed. The iterations stop early, once every score
+        changes less than the tolerance.
+        """
+        nodes, adjacency = self.subgraph(node_labels, relationship_types)
+        out_degrees = np.asarray(adjacency.sum(axis = 1)).ravel()
+        inverse_degrees = np.divide(
+            1.0, out_degrees, out = np.zeros_like(out_degrees), where = out_degrees > 0
+        )
+        transposed = adjacency.T.tocsr()
+
+        scores = np.full(adjacency.shape[0], 1 - damping_factor)
+        for _ in range(max_iterations):
+            new_scores = (1 - damping_factor) + damping_factor * (transposed @ (scores * inverse_degrees))
+            converged = np.all(np.abs(new_scores - scores) < tolerance)
+            scores = new_scores
+            if converged:
+                break
+        self.write_node_property(write_property, nodes, scores)
+        return scores
+
+    def similarities(self, cutoff = 0.5, top_k = 10, block_size = 1000,
+                     node_labels = None, relationship_types = None):
+        """
+        Returns the (source, target, score) arrays of the top_k most similar
+        nodes of each node, by the Jaccard similarity of their outgoing neighbours,
+        with the same results as the GDS node similarity.
+        The sources and targets are indices of the projected nodes.
+        """
+        nodes, incidence = self.subgraph(node_labels, relationship_types)
+        incidence.data[:] = 1
+        sources, targets, scores = jaccard_top_k(incidence, cutoff, top_k, block_size)
+        return nodes[sources], nodes[targets], scores
+
+    def projection_key(self):
+        """
+        Returns the key of the projection, which namespaces the fingerprints
+        and the similarity relationships of each projection, since projections
+        of different labels share nodes, e.g. the projects.
+        """
+        projection = repr((sorted(self.node_list), sorted(self.rel_orientations)))
+        return hashlib.sha1(projection.encode('utf-8')).hexdigest()[:12]
+
+    @counter
+    def nodeSimilarity(self, write_property, write_relationship, cutoff = 0.5, top_k = 10, block_size = 1000,
+                       node_labels = None, relationship_types = None):
+        """
+        Creates the similarity relationships of the top_k most similar nodes of each node,
+        which are marked with the key of the projection, as by updateNodeSimilarity().
+        """
+        sources, targets, scores = self.similarities(
+            cutoff, top_k, block_size, node_labels, relationship_types
+        )
+        query = (
+            'UNWIND $rows AS row '
+            'MATCH (a) WHERE id(a) = row.source '
+            'MATCH (b) WHERE id(b) = row.target '
+            f'CREATE (a)-[:{write_relationship} {{{write_property}: row.score, projection: $projection}}]->(b)'
+        )
+        rows = [
+            {'source': source, 'target': target, 'score': score}
+            for source, target, score in zip(
+                self.node_ids[sources].tolist(), self.node_ids[targets].tolist(), scores.tolist()
+            )
+        ]
+        projection = self.projection_key()
+        LocalGraphAlgos.database.execute_many(
+            query, ({'rows': batch, 'projection': projection} for batch in chunks(rows, self.batch_size)),
+            batch_size = 1
+        )
+        return len(rows)
+
+    @counter
+    def updateNodeSimilarity(self, write_property, write_relationship, cutoff = 0.5, top_k = 10,
+                             block_size = 1000, hash_property = None):
+        """
+        Updates the similarity relationships in place, by recomputing the top_k
+        most similar nodes only for the nodes whose outgoing neighbours changed
+        since the previous update, and for the nodes whose similarities they affect.
+        The fingerprint of each node is kept in the hash property, as the hash
+        of its neighbours along with the number of its similarity relationships,
+        so that the nodes which lost a similar node to a deletion are updated as well.
+        The hash property and the relationships are namespaced by the key
+        of the projection, so that the updates of projections with shared nodes
+        neither delete nor count the relationships of each other.
+        The unmarked relationships, e.g. of a full rebuild with GDS,
+        are replaced. Returns the number of updated nodes.
+        """
+        projection = self.projection_key()
+        hash_property = hash_property or f'similarity_hash_{projection}'
+        _, incidence = self.subgraph()
+        incidence.data[:] = 1
+        node_ids = self.node_ids.tolist()
+        degrees = np.diff(incidence.indptr)
+
+        def neighbours_hash(i):
+            neighbours = np.sort(self.node_ids[incidence.indices[incidence.indptr[i]: incidence.indptr[i + 1]]])
+            return hashlib.sha1(neighbours.tobytes()).hexdigest()
+
+        # Read the stored fingerprints, along with the current number of similarity relationships.
+        label_filter = ' OR '.join(f'n:{label}' for label in self.node_list)
+        stored = {
+            node_id: (fingerprint, count) for node_id, fingerprint, count in
+            LocalGraphAlgos.database.execute(
+                f'MATCH (n) WHERE ({label_filter}) AND n.{hash_property} IS NOT NULL '
+                f'RETURN id(n), n.{hash_property}, '
+                f'size([(n)-[r:{write_relationship}]->() WHERE r.projection = $projection | r])', 'r',
+                {'projection': projection}
+            )
+        }
+        changed = []
+        for i, node_id in enumerate(node_ids):
+            fingerprint, count = stored.get(node_id, (None, 0))
+            if (degrees[i] > 0 or fingerprint) and fingerprint != f'{neighbours_hash(i)}:{count}':
+                changed.append(i)
+        if not changed:
+            print('No similarities changed...')
+            return 0
+
+        # The similarities of a changed node affect the nodes which share any
+        # of its current neighbours, and the nodes which were similar to it before.
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        shared = np.zeros(incidence.shape[1])
+        shared[incidence[changed].indices] = 1
+        previous = LocalGraphAlgos.database.execute(
+            f'MATCH (a)-[r:{write_relationship}]->(b) '
+            'WHERE id(b) IN $ids AND r.projection = $projection RETURN id(a)', 'r',
+            {'ids': [node_ids[i] for i in changed], 'projection': projection}
+        )
+        affected = np.union1d(
+            np.union1d(changed, np.flatnonzero(incidence @ shared)),
+            [index[row[0]] for row in previous if row[0] in index]
+        ).astype(np.int64)
+
+        # Recompute the top_k similar nodes of the affected nodes against all nodes.
+        sources, targets, scores = jaccard_top_k(incidence, cutoff, top_k, block_size, rows = affected)
+        similar = {i: [] for i in affected.tolist()}
+        for source, target, score in zip(sources.tolist(), targets.tolist(), scores.tolist()):
+            similar[source].append({'target': node_ids[target], 'score': score})
+
+        # Update the similarity relationships of each affected node in place,
+        # by deleting the stale ones of the projection and the unmarked ones,
+        # and merging the rest, and store its fingerprint.
+        query = (
+            'UNWIND $rows AS row '
+            'MATCH (a) WHERE id(a) = row.source '
+            f'SET a.{hash_property} = row.fingerprint '
+            'WITH a, row '
+            f'OPTIONAL MATCH (a)-[r:{write_relationship}]->(b) '
+            'WHERE r.projection IS NULL OR (r.projection = $projection '
+            'AND NOT id(b) IN [pair IN row.similar | pair.target]) '
+            'DELETE r '
+            'WITH DISTINCT a, row '
+            'UNWIND row.similar AS pair '
+            'MATCH (b) WHERE id(b) = pair.target '
+            f'MERGE (a)-[r:{write_relationship} {{projection: $projection}}]->(b) '
+            f'SET r.{write_property} = pair.score'
+        )
+        rows = [
+            {
+                'source': node_ids[i], 'similar': pairs,
+                'fingerprint': f'{neighbours_hash(i)}:{len(pairs)}'
+            }
+            for i, pairs in similar.items()
+        ]
+        LocalGraphAlgos.database.execute_many(
+            query, ({'rows': batch, 'projection': projection} for batch in chunks(rows, self.batch_size)),
+            batch_size = 1
+        )
+        print(f'Updated the similarities of {len(rows)} out of {len(node_ids)} nodes...')
+        return len(rows)
+
+    def communities(self, max_levels = 10, max_iterations = 10,
+                    node_labels = None, relationship_types = None):
+        """
+        Returns the indices of the projected nodes, along with their communities,
+        by Louvain on the undirected graph of the projection. Each level
+        moves the nodes between communities, for up to max_iterations sweeps,
+        while the modularity improves, and the communities of the level
+        are aggregated into the nodes of the next one.
+        """
+        nodes, adjacency = self.subgraph(node_labels, relationship_types)
+        graph = (adjacency + adjacency.T).tocsr()
+        communities = np.arange(graph.shape[0])
+
+        for _ in range(max_levels):
+            labels, moved = local_moving(graph, max_iterations)
+            if not moved:
+                break
+
+            # Relabel the communities as 0..k-1 and aggregate each one into a node,
+            # whose self loop holds the weight inside the community.
+            _, labels = np.unique(labels, return_inverse = True)
+            communities = labels[communities]
+            membership = csr_matrix(
+                (np.ones(len(labels)), (np.arange(len(labels)), labels)),
+                shape = (len(labels), labels.max() + 1)
+            )
+            graph = (membership.T @ graph @ membership).tocsr()
+        return nodes, communities
+
+    @counter
+    def louvain(self, write_property, max_levels = 10, max_iterations = 10,
+                node_labels = None, relationship_types = None):
+        nodes, communities = self.communities(max_levels, max_iterations, node_labels, relationship_types)
+        self.write_node_property(write_property, nodes, communities)
+        return communities
+
+    def write(self, node_labels = None):
+        # The results are written once they are computed, thus nothing is left to write.
+        return
+
+    # These methods enable the use of this class in a with statement.
+    def __enter__(self):
+        self.project()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            traceback.print_exception(exc_type, exc_value, tb)
+
+
+def modularity(graph, labels):
+    """
+    Function which returns the modularity of the communities
+    of a weighted undirected graph, whose self loops hold
+    the weight inside the aggregated nodes.
+    """
+    degrees = np.asarray(graph.sum(axis = 1)).ravel()
+    total_weight = degrees.sum()
+    if total_weight == 0:
+        return 0.0
+    coo = graph.tocoo()
+    inside = coo.data[labels[coo.row] == labels[coo.col]].sum()
+    totals = np.bincount(labels, degrees)
+    return inside / total_weight - np.sum((totals / total_weight) ** 2)
+
+
+def local_moving(graph, max_iterations, block_size = 1000):
+    """
+    Function which moves the nodes of the weighted undirected graph
+    to the neighbouring community with the largest modularity gain,
+    and returns the labels along with whether any node moved.
+    Each sweep moves the nodes block by block, where the best community
+    of every node of the block is computed at once, from its sparse rows,
+    and the totals of the communities are updated after each block.
+    A singleton only joins another singleton of a lower label,
+    thus two nodes of the same block never swap their communities,
+    and a sweep is only kept, if it improves the modularity.
+    """
+    n = graph.shape[0]
+    labels = np.arange(n)
+    degrees = np.asarray(graph.sum(axis = 1)).ravel()
+    total_weight = degrees.sum()
+    if total_weight == 0:
+        return labels, False
+
+    # The self loops are not links to another node.
+    links = (graph - diags(graph.diagonal())).tocsr()
+    links.eliminate_zeros()
+
+    moved = False
+    current = modularity(graph, labels)
+    for _ in range(max_iterations):
+        previous = labels.copy()
+        totals = np.bincount(labels, degrees, minlength = n)
+        sizes = np.bincount(labels, minlength = n)
+        for start in range(0, n, block_size):
+            block = np.arange(start, min(start + block_size, n))
+            rows = links[block].tocoo()
+            if not rows.nnz:
+                continue
+            # The weights from each node of the block to its neighbouring communities.
+            weights = csr_matrix((rows.data, (rows.row, labels[rows.col])), shape = (len(block), n))
+            weights.sum_duplicates()
+            entries = np.repeat(np.arange(len(block)), np.diff(weights.indptr))
+            columns = weights.indices
+            nodes = block[entries]
+
+            # The gain of each neighbouring community, where the node is
+            # removed from the total of its own community first.
+            own = columns == labels[nodes]
+            gains = weights.data - (totals[columns] - own * degrees[nodes]) * degrees[nodes] / total_weight
+            stay = -(totals[labels[block]] - degrees[block]) * degrees[block] / total_weight
+            stay[entries[own]] = gains[own]
+
+            # The best community of each node, with ties broken by the lower community.
+            order = np.lexsort((columns, -gains, entries))
+            first = order[np.r_[0, np.flatnonzero(np.diff(entries[order])) + 1]]
+            best = labels[block]
+            best_gains = stay.copy()
+            best[entries[first]] = columns[first]
+            best_gains[entries[first]] = gains[first]
+            movers = (best_gains > stay) & (best != labels[block])
+            movers &= ~((sizes[labels[block]] == 1) & (sizes[best] == 1) & (best > labels[block]))
+            if not movers.any():
+                continue
+
+            sources, targets = labels[block[movers]], best[movers]
+            np.subtract.at(totals, sources, degrees[block[movers]])
+            np.add.at(totals, targets, degrees[block[movers]])
+            np.subtract.at(sizes, sources, 1)
+            np.add.at(sizes, targets, 1)
+            labels[block[movers]] = targets
+
+        score = modularity(graph, labels)
+        if score <= current:
+            labels = previous
+            break
+        current, moved = score, True
+    return labels, moved
+
+
+def jaccard_top_k(incidence, cutoff, top_k, block_size = 1000, rows = None):
+    """
+    Function which computes the Jaccard similarity between the rows
+    of a binary csr matrix, and keeps the top_k most similar other rows
+    of each row, whose similarity is at least the cutoff.
+    If rows is given, only the similarities of these rows are computed.
+    The intersections are computed with sparse products of a block of rows,
+    so the memory is bounded by the block size rather than the number of rows.
+    """
+    degrees = np.asarray(incidence.sum(axis = 1)).ravel()
+    transposed = incidence.T.tocsr()
+    rows = np.arange(incidence.shape[0]) if rows is None else np.asarray(rows, dtype = np.int64)
+    sources, targets, scores = [], [], []
+
+    for start in range(0, len(rows), block_size):
+        block = rows[start: start + block_size]
+        intersections = (incidence[block] @ transposed).tocsr()
+        for i, row in enumerate(block.tolist()):
+            if degrees[row] == 0:
+                continue
+            columns = intersections.indices[intersections.indptr[i]: intersections.indptr[i + 1]]
+            shared = intersections.data[intersections.indptr[i]: intersections.indptr[i + 1]]
+            similarity = shared / (degrees[row] + degrees[columns] - shared)
+
+            # Apply the cutoff and drop the node itself, before ranking the rest.
+            keep = (similarity >= cutoff) & (columns != row)
+            columns, similarity = columns[keep], similarity[keep]
+
+            # Rank by descending similarity, with ties broken by the lower node.
+            best = np.lexsort((columns, -similarity))[:top_k]
+            sources += [row] * len(best)
+            targets += columns[best].tolist()
+            scores += similarity[best].tolist()
+
+    return (
+        np.array(sources, dtype = np.int64),
+        np.array(targets, dtype = np.int64),
+        np.array(scores, dtype = np.float64)
+    )
@@ -0,0 +1,56 @@
+import os
+import json
+import hashlib
+
+class Manifest:
+    """
+    Manifest of a stage, which keeps the hash of the input of each record,
+    keyed by its id, along with the parameters the records were processed with.
+    If the parameters change, every record is considered changed.
+    """
+    def __init__(self, path, parameters):
+        self.path = path
+        self.parameters = json.loads(json.dumps(parameters, default = str))
+        self.entries = {}
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding = 'utf-8') as file:
+                stored = json.load(file)
+            if stored['parameters'] == self.parameters:
+                self.entries = stored['entries']
+
+    @staticmethod
+    def hash(content):
+        return hashlib.sha1(str(content).encode('utf-8')).hexdigest()
+
+    def __contains__(self, key):
+        return str(key) in self.entries
+
+    def changed(self, key, content):
+        return self.entries.get(str(key)) != self.hash(content)
+
+    def update(self, key, content):
+        self.entries[str(key)] = self.hash(content)
+
+    def retain(self, keys):
+        """
+        Removes the entries of the records that are no longer in the input.
+        """
+        keys = set(map(str, keys))
+        self.entries = {key: value for key, value in self.entries.items() if key in keys}
+
+    def save(self):
+        # Write to a temporary file and replace the manifest,
+        # so that a crash never leaves a partially written manifest.
+        with open(f'{self.path}.part', 'w', encoding = 'utf-8') as file:
+            json.dump({'parameters': self.parameters, 'entries': self.entries}, file)
+        os.replace(f'{self.path}.part', self.path)
+
+
+def file_fingerprint(path):
+    """
+    Function which returns the size and modification time of a file,
+    as a cheap substitute of hashing its content.
+    """
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
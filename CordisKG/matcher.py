@@ -0,0 +1,110 @@
+import functools
+from collections import deque
+
+class KeyphraseMatcher:
+    """
+    Multi-pattern matcher which compiles a list of keyphrases
+    into an Aho-Corasick automaton once, and then finds all
+    keyphrases that are present in a text with a single pass
+    over its lowercase version.
+    """
+    def __init__(self, keyphrases, word_boundaries = False):
+        # Lowercase all keyphrases, as in find_keys_in_text().
+        self.keyphrases = list(map(str.lower, keyphrases))
+        self.word_boundaries = word_boundaries
+
+        # The automaton is stored as parallel lists indexed by state,
+        # where state 0 is the root of the keyphrase trie.
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._empty = []
+
+        for index, keyphrase in enumerate(self.keyphrases):
+            self._insert(index, keyphrase)
+        self._build_failure_links()
+
+    def _insert(self, index, keyphrase):
+        if not keyphrase:
+            self._empty.append(index)
+            return
+        state = 0
+        for char in keyphrase:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(index)
+
+    def _build_failure_links(self):
+        # Breadth first traversal of the trie, where the failure link
+        # of each state points to the longest proper suffix in the trie.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                # Inherit the matches that end at the failure state.
+                self._output[next_state] = (
+                    self._output[next_state]
+                    + self._output[self._fail[next_state]]
+                )
+
+    def _is_boundary(self, text, start, end):
+        return (
+            (start == 0 or not text[start - 1].isalnum()) and
+            (end == len(text) or not text[end].isalnum())
+        )
+
+    def find(self, text):
+        """
+        Returns the keyphrases found in the text,
+        in the order of the keyphrases list.
+        """
+        text = text.lower()
+        goto, fail, output = self._goto, self._fail, self._output
+        keyphrases = self.keyphrases
+        found = set()
+
+        # Empty keyphrases are contained in any text.
+        if not self.word_boundaries:
+            found.update(self._empty)
+
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not output[state]:
+                continue
+            for index in output[state]:
+                if index in found:
+                    continue
+                if self.word_boundaries:
+                    start = position + 1 - len(keyphrases[index])
+                    if not self._is_boundary(text, start, position + 1):
+                        continue
+                found.add(index)
+
+        return [keyphrases[index] for index in sorted(found)]
+
+
+@functools.lru_cache(maxsize = None)
+def load_matcher(aux_keys_path, word_boundaries = False):
+    """
+    Function which reads the auxiliary keyphrases file
+    and compiles its matcher. The matcher is cached,
+    so that it is built once per run for each file.
+    """
+    with open(aux_keys_path, 'r', encoding = 'utf-8-sig', errors = 'ignore') as keys:
+        return KeyphraseMatcher(keys.read().splitlines(), word_boundaries)
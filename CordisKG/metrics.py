@@ -1,3 +1,4 @@
+from CordisKG.token_index import TokenIndex
 
 def partial_match(assigned, extracted):
     """
@@ -11,6 +12,8 @@ def partial_match(assigned, extracted):
                 (order doesn't matter in the list).
     extracted : A list of extracted keywords,
                 (order matters in the list).
+    The keywords are either strings, which are split in sets of terms,
+    or the sets of token ids of a normalizer, which are used directly.
     Returned value
     --------------
               : double
@@ -18,9 +21,19 @@ def partial_match(assigned, extracted):
     # Assigned should always contain the shorter list, while extracted the longest,
     # as to avoid counting partial matches more times than necessary.
     assigned, extracted = min((assigned, extracted), key = len), max((assigned, extracted), key = len)
-    assigned_sets = [set(keyword.split()) for keyword in assigned]
-    extracted_sets = [set(keyword.split()) for keyword in extracted]
+    assigned_sets = [term_set(keyword) for keyword in assigned]
+    extracted_sets = [term_set(keyword) for keyword in extracted]
 
-    return sum(
-        1.0 for i in assigned_sets  
-            if any(True for j in extracted_sets if i & j))
+    # Index the terms of the extracted keywords, so that each assigned keyword
+    # looks up its own terms, instead of intersecting every extracted keyword.
+    index = TokenIndex()
+    for j, extracted_set in enumerate(extracted_sets):
+        index.add(j, extracted_set)
+
+    return sum(1.0 for i in assigned_sets if index.shares_token(i))
+
+
+def term_set(keyword):
+    if isinstance(keyword, frozenset):
+        return keyword
+    return set(keyword.split())
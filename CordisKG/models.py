@@ -5,11 +5,15 @@ from statistics import mean
 from operator import itemgetter
 from itertools import islice, combinations
 from nltk import sent_tokenize
+from spacy.language import Language
 from RAKE import Rake, NLTKStopList
-from yake import KeywordExtractor
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from keybert.mmr import mmr
+from keybert.maxsum import max_sum_similarity
 from sentence_transformers import SentenceTransformer, util
 from CordisKG.utils import counter
+from CordisKG.registry import models
 
 @counter
 def tfidfvectorizer(text, ngram_range = (1, 3), top_n = 10):
@@ -63,23 +67,98 @@ def keybert(text, model, ngram_range = (1, 3), top_n = 10, measure = None, diver
                 diversity = diversity
         )]
 
+@counter(items = lambda texts, *args, **kwargs: len(texts))
+def keybert_batch(texts, model, cache, ngram_range = (1, 3), top_n = 10, measure = None, diversity = 0.5, batch_size = 32):
+    """
+    Batched version of keybert() over a list of texts, which returns
+    a list of keyphrases for each text. The documents and the distinct
+    candidates of all documents are embedded in length-sorted batches,
+    through the embedding cache. Thus, reruns and parameter sweeps 
+    over top_n and diversity are served from the cache.
+    """
+    # Select the candidates of each document in the same way as KeyBERT.
+    candidates = []
+    for text in texts:
+        try:
+            count = CountVectorizer(ngram_range = ngram_range, stop_words = 'english').fit([text])
+            candidates.append(count.get_feature_names())
+        except ValueError: # The document has no candidates.
+            candidates.append([])
+
+    def encode(batch):
+        return model.model.encode(batch, batch_size = batch_size)
+
+    doc_embeddings = cache.embed(texts, encode, batch_size)
+    all_candidates = list(dict.fromkeys(
+        candidate for text_candidates in candidates 
+        for candidate in text_candidates
+    ))
+    candidate_rows = {candidate: row for row, candidate in enumerate(all_candidates)}
+    candidate_embeddings = cache.embed(all_candidates, encode, batch_size)
+
+    results = []
+    for i, text_candidates in enumerate(candidates):
+        if not text_candidates:
+            results.append([])
+            continue
+        doc_embedding = doc_embeddings[i: i + 1]
+        word_embeddings = candidate_embeddings[[candidate_rows[c] for c in text_candidates]]
+        try:
+            if measure == 'mmr':
+                keywords = mmr(doc_embedding, word_embeddings, text_candidates, top_n, diversity)
+            elif measure == 'maxsum':
+                keywords = max_sum_similarity(doc_embedding, word_embeddings, text_candidates, top_n, 2 * top_n)
+            else:
+                distances = cosine_similarity(doc_embedding, word_embeddings)
+                keywords = [
+                    (text_candidates[index], round(float(distances[0][index]), 4))
+                    for index in distances.argsort()[0][-top_n:]
+                ][::-1]
+        except ValueError: # Fewer candidates than required, as in KeyBERT.
+            keywords = []
+        results.append([keyphrase for (keyphrase, _) in keywords])
+    return results
+
+@Language.component('textrank_texts')
+def textrank_texts(doc):
+    """
+    Replaces the phrases of PyTextRank with their texts, so that 
+    the documents can be sent back from the nlp.pipe() processes.
+    """
+    doc._.phrases = [phrase.text for phrase in doc._.phrases]
+    doc._.textrank = None
+    return doc
+
 @counter
 def textrank(text, nlp, top_n = 10):
 
-    # Temporarily add PyTextRank to the spaCy pipeline.
-    nlp.add_pipe('textrank', last = True)
+    # Add PyTextRank to the end of the spaCy pipeline once,
+    # the pipeline is kept for the next documents.
+    if 'textrank' not in nlp.pipe_names:
+        nlp.add_pipe('textrank', last = True)
 
     # Perform nlp on text.
     doc = nlp(text)
 
-    # Remove textrank from the pipeline.
-    nlp.remove_pipe('textrank')
-
     # Return the top N phrases from the document.
     return [phrase.text for phrase in doc._.phrases][:top_n]
 
 @counter
-def singlerank(text, top_n = 10):
+def textrank_pipe(items, top_n = 10, batch_size = 64, n_process = 1):
+    """
+    Streams (id, text) pairs through a persistent TextRank pipeline 
+    with nlp.pipe(), and yields (id, phrases) pairs in the same order.
+    """
+    nlp = models.spacy(pipes = ('textrank', 'textrank_texts'))
+    docs = nlp.pipe(
+        ((text, id) for (id, text) in items), as_tuples = True,
+        batch_size = batch_size, n_process = n_process
+    )
+    for doc, id in docs:
+        yield id, doc._.phrases[:top_n]
+
+@counter
+def singlerank(text, top_n = 10, spacy_model = None):
 
     # Clean the text from non-printable characters.
     text = ''.join(word for word in text if word in printable)
@@ -90,7 +169,10 @@ def singlerank(text, top_n = 10):
     # Load the content of the document and preprocess it with spacy.
     # Then, select the keyphrase candidates from the document,
     # and weight them using a random walk algorithm.
-    extractor.load_document(input = text, language = 'en')
+    # The preloaded spacy model is reused instead of loading one per document.
+    if spacy_model is None:
+        spacy_model = models.spacy_pke()
+    extractor.load_document(input = text, language = 'en', spacy_model = spacy_model)
     extractor.candidate_selection()
     extractor.candidate_weighting()
     
@@ -113,13 +195,8 @@ def rake(text, top_n = 10):
 @counter
 def yake(text, ngram_range = (1, 3), top_n = 10, dedupLim = 0.9, dedupFunc = 'seqm', windowsSize = 1):
 
-    # Initialize the keyword extractor object and its parameters.
-    kw_extractor = KeywordExtractor (
-        top = top_n,
-        n = ngram_range[1],
-        dedupLim = dedupLim,
-        dedupFunc = dedupFunc,
-        windowsSize = windowsSize
-    )
+    # Reuse the keyword extractor object of the same parameters.
+    kw_extractor = models.yake(ngram_range, top_n, dedupLim, dedupFunc, windowsSize)
+
     # Return the extracted keywords, in a list.
     return [keyword for (keyword, score) in kw_extractor.extract_keywords(text)]
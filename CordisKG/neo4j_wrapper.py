@@ -1,36 +1,193 @@
+import time
+import random
 from neo4j import GraphDatabase
-from neo4j.exceptions import ConstraintError, CypherError, ServiceUnavailable
+from neo4j.exceptions import ConstraintError, CypherError, ServiceUnavailable, TransientError
+from concurrent.futures import ThreadPoolExecutor
+from CordisKG.batching import chunks, bounded_map
 
-class Neo4jDatabase(object): 
+class Neo4jDatabase(object):
     """
-    Wrapper class which handles the database 
+    Wrapper class which handles the database
     more efficiently, by abstracting repeating code.
     """
-    def __init__(self, uri, user, password): # Create the database connection.
-        self._driver = GraphDatabase.driver(uri, auth=(user, password), encrypted = False)
+    # The number of times that a batch is retried after a transient error,
+    # once the retries of the driver have been exhausted.
+    transient_retries = 5
+
+    def __init__(self, uri, user, password, max_connection_pool_size = 100): # Create the database connection.
+        # The pool settings are passed to the driver configuration,
+        # so that concurrent batches can reuse the open connections.
+        # The pinned 1.7 driver has no fetch size setting, thus none is passed.
+        self._driver = GraphDatabase.driver(
+            uri, auth=(user, password), encrypted = False,
+            max_connection_pool_size = max_connection_pool_size
+        )
 
     def close(self):
         self._driver.close()
 
-    def execute(self, query, mode): # Execute queries in the database.
+    def execute(self, query, mode, parameters = None): # Execute queries in the database.
         with self._driver.session() as session:
             try:
                 if (mode == 'r'): # Reading query.
-                    result = session.read_transaction(self.__execute, query).values()
+                    result = session.read_transaction(self.__execute, query, parameters).values()
                 elif(mode == 'w'): # Writing query.
-                    result = session.write_transaction(self.__execute, query).values()
+                    result = session.write_transaction(self.__execute, query, parameters).values()
                 elif(mode == 'g'): # Returning graph data query.
-                    result = session.read_transaction(self.__execute, query).data()
+                    result = session.read_transaction(self.__execute, query, parameters).data()
                 else:
                     raise TypeError('Execution mode can either be (r)ead, (w)rite or (g)raph data!')
                 return result
             except (CypherError, ConstraintError) as err:
                 print(err) # Handle the erroneous query instead of breaking the execution.
 
+    def execute_many(self, query, parameters, batch_size = 1000, workers = 1):
+        """
+        Executes the same writing query once for each parameter map
+        of the iterable, by reusing a single session. Every batch_size
+        parameter maps are committed together in one transaction.
+        If workers is larger than 1, the batches are committed concurrently
+        by a pool of threads, each one in a session of its own, while
+        at most twice the workers batches are read from the parameters.
+        The results are consumed rather than materialized,
+        and the number of committed parameter maps is returned,
+        thus the maps of the failed batches are not counted.
+        The batches which still conflict with concurrent batches
+        after their retries are committed one by one, once the workers
+        are done, and a batch which keeps failing with a transient error
+        raises it, rather than being dropped.
+        """
+        failed = []
+        def run_in_session(batch):
+            with self._driver.session() as session:
+                try:
+                    return self.__write_batch(session, query, batch)
+                except TransientError:
+                    failed.append(batch)
+                    return 0
+
+        count, batches = 0, chunks(parameters, batch_size)
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers = workers) as executor:
+                count = sum(bounded_map(executor, run_in_session, batches, 2 * workers))
+            if failed:
+                print(f'Committing {len(failed)} conflicting batches serially...')
+            batches = failed
+
+        with self._driver.session() as session:
+            for batch in batches:
+                count += self.__write_batch(session, query, batch)
+        return count
+
+    def execute_chunked(self, query, ids_query = None, parameters = None, batch_size = 10000, workers = 1,
+                        page_size = 100000):
+        """
+        Executes a large writing query in committed batches of batch_size items,
+        instead of a single transaction that holds its locks until the end.
+        Without ids_query, the query limits its items with $batch_size,
+        returns the number of items it processed, and is executed repeatedly
+        until no item is left, e.g.
+        MATCH ()-[r:is_similar]->() WITH r LIMIT $batch_size DELETE r RETURN count(*)
+        With ids_query, the ids of the items are read in pages of page_size ids,
+        which are larger than $after, in ascending order, and limited to $page_size, e.g.
+        MATCH ()-[r:is_similar]->() WHERE id(r) > $after RETURN id(r) ORDER BY id(r) LIMIT $page_size
+        and the query is executed for each chunk of a page as $ids,
+        concurrently by the workers, since the chunks are disjoint.
+        The committed batches are kept, thus an interrupted execution is resumed
+        by executing it again. Transient errors are retried, as by execute_many().
+        The number of processed items is returned.
+        """
+        parameters = parameters or {}
+        total = 0
+        if ids_query is None:
+            with self._driver.session() as session:
+                while True:
+                    try:
+                        count = self.__write_transaction(
+                            session, self.__execute_count, query, {**parameters, 'batch_size': batch_size}
+                        )
+                    except TransientError:
+                        raise # A TransientError is a CypherError, but the batch is not erroneous.
+                    except (CypherError, ConstraintError) as err:
+                        print(err) # Stop at the erroneous batch, the committed ones are kept.
+                        break
+                    if not count:
+                        break
+                    total += count
+                    print(f'Processed {total} items...')
+            return total
+
+        def run(batch):
+            with self._driver.session() as session:
+                if self.__write_batch(session, query, [{**parameters, 'ids': batch}]):
+                    return len(batch)
+                return 0
+
+        def ids():
+            # The pages continue after the last id of the previous one,
+            # thus the processed items do not shift the next page.
+            after = -1
+            while True:
+                page = self.execute(ids_query, 'r', {**parameters, 'after': after, 'page_size': page_size}) or []
+                yield from (row[0] for row in page)
+                if len(page) < page_size:
+                    return
+                after = page[-1][0]
+
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            for count in bounded_map(executor, run, chunks(ids(), batch_size), 2 * workers):
+                total += count
+                print(f'Processed {total} items...')
+        return total
+
+    def __write_batch(self, session, query, batch):
+        """
+        Commits the batch in one transaction, and returns the number
+        of its parameter maps, or 0 if the query failed.
+        The last transient error is raised, since the batch is not committed.
+        """
+        try:
+            self.__write_transaction(session, self.__execute_batch, query, batch)
+            return len(batch)
+        except TransientError:
+            raise # A TransientError is a CypherError, but the batch is not erroneous.
+        except (CypherError, ConstraintError) as err:
+            print(err) # Handle the erroneous batch instead of breaking the execution.
+            return 0
+
+    def __write_transaction(self, session, function, *args):
+        """
+        Runs the function in a write transaction, and returns its result.
+        Transient errors, such as deadlocks between concurrent batches
+        that merge relationships on the same nodes, are retried by the driver
+        for a limited time, and then here, after a random delay that grows
+        with each attempt, so that the conflicting batches do not collide again.
+        The last transient error is raised, since nothing is committed.
+        """
+        for attempt in range(Neo4jDatabase.transient_retries + 1):
+            try:
+                return session.write_transaction(function, *args)
+            except TransientError:
+                if attempt == Neo4jDatabase.transient_retries:
+                    raise
+                time.sleep(random.uniform(0, 2 ** attempt))
+
     @staticmethod # static private method.
-    def __execute(tx, query):
+    def __execute(tx, query, parameters = None):
         try:
-            result = tx.run(query)
+            result = tx.run(query, parameters)
             return result
         except (CypherError, ConstraintError) as err:
-            print(err) # Handle the erroneous query instead of breaking the execution.
\ No newline at end of file
+            print(err) # Handle the erroneous query instead of breaking the execution.
+
+    @staticmethod # static private method.
+    def __execute_batch(tx, query, batch):
+        # The query text is the same for the whole batch,
+        # thus its plan is compiled once and reused from the cache.
+        for parameters in batch:
+            tx.run(query, parameters).consume()
+
+    @staticmethod # static private method.
+    def __execute_count(tx, query, parameters):
+        record = tx.run(query, parameters).single()
+        return record[0] if record else 0
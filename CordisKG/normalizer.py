@@ -0,0 +1,67 @@
+import functools
+from string import punctuation
+from stempel import StempelStemmer
+from nltk.stem import SnowballStemmer
+
+# Initialize all required stemmers once.
+stemmers = {
+    'english': SnowballStemmer('english'),
+    'french': SnowballStemmer('french'),
+    'spanish': SnowballStemmer('spanish'),
+    'portuguese': SnowballStemmer('portuguese'),
+    'polish': StempelStemmer.default()
+}
+
+# The translation table, which removes all punctuation, is compiled once.
+punctuation_table = str.maketrans('', '', punctuation)
+
+
+class Normalizer:
+    """
+    Normalization engine which converts keyphrases to lowercase,
+    strips their punctuation and stems them with the stemmer of the language,
+    or only converts them to lowercase, if no language is given.
+    The normalized keyphrases are split in sets of token ids, which are
+    shared by all keyphrases of the same normalizer, so that the matching
+    helpers intersect small integer sets, rather than re-splitting strings.
+    The stemmer and the token sets are memoized, since the same keyphrases
+    are normalized repeatedly across methods and documents.
+    """
+    def __init__(self, language = None, cache_size = 2 ** 16):
+        self.language = language
+        self.vocabulary = {}
+        if language is None:
+            self.normalize = functools.lru_cache(maxsize = cache_size)(str.lower)
+        else:
+            stem = functools.lru_cache(maxsize = cache_size)(stemmers[language].stem)
+            self.normalize = lambda keyphrase: stem(keyphrase.lower().translate(punctuation_table))
+        self.token_set = functools.lru_cache(maxsize = cache_size)(self._token_set)
+
+    def _token_set(self, keyphrase):
+        # Each new token is assigned the next id of the vocabulary.
+        return frozenset(
+            self.vocabulary.setdefault(token, len(self.vocabulary))
+            for token in self.normalize(keyphrase).split()
+        )
+
+    def normalize_all(self, keyphrases):
+        """
+        Returns the normalized string of each keyphrase of the list.
+        """
+        return list(map(self.normalize, keyphrases))
+
+    def token_sets(self, keyphrases):
+        """
+        Returns the set of token ids of each keyphrase of the list.
+        """
+        return list(map(self.token_set, keyphrases))
+
+
+@functools.lru_cache(maxsize = None)
+def load_normalizer(language = None):
+    """
+    Function which returns the normalizer of a language.
+    The normalizer is cached, so that the token ids of its
+    keyphrases are comparable across all calls of the same run.
+    """
+    return Normalizer(language)
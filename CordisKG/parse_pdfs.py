@@ -1,7 +1,9 @@
 import os
 import time
-import pandas
-import requests
+import queue
+import threading
+import multiprocessing
+import multiprocessing.connection
 from io import StringIO
 from pdfminer3.layout import LAParams, LTTextBox
 from pdfminer3.pdfpage import PDFPage
@@ -9,50 +11,9 @@ from pdfminer3.pdfinterp import PDFResourceManager
 from pdfminer3.pdfinterp import PDFPageInterpreter
 from pdfminer3.converter import PDFPageAggregator
 from pdfminer3.converter import TextConverter
-from CordisKG.utils import counter, clear_screen
-
-
-@counter
-def download_pdf(url, filename, max_retries = 5, backoff_factor = 0.5):
-    """
-    Function which connects to the EU Cordis site
-    and downloads a deliverable pdf using the url.
-    This function also returns True if the pdf 
-    was succesfully retrieved and false otherwise.
-    """
-
-    # Open a new session, configure
-    # the retry policy for all http connections,
-    # and connect to the url.
-    session = requests.Session()
-    session.get(url)
-
-    # Obtain cookies from the session and set the headers to a mozilla firefox user.
-    cookies = session.cookies.get_dict()
-    headers = {'User-Agent': 'Mozilla/5.0'}
-
-    # Download the html page text from the url.
-    html_page = requests.get(url, cookies = cookies, headers = headers).text
-
-    # Check if the html page contains the error code, and return early.
-    if 'Error code' in html_page:
-        return False
-
-    # The download pdf url can be found in the bottom part of the page.
-    l_idx = html_page.rfind('window.location=\'') + len('window.location=') + 1
-    r_idx = html_page.rfind('\'')
-    pdf_url = html_page[l_idx: r_idx]
-    
-    # Get a response from the pdf url.
-    response = requests.get(pdf_url, cookies = cookies, headers = headers)
-
-    # Save the file from the url, only if it's a pdf.
-    if 'application/pdf' in response.headers.get('content-type'):
-        with open(filename, 'wb') as file:
-            file.write(response.content)
-        return True
-    else: 
-        return False
+from CordisKG.utils import counter, clear_screen, read_csv_rows
+from CordisKG.downloader import Downloader
+from CordisKG.manifest import Manifest
 
 
 @counter
@@ -86,65 +47,217 @@ def convert_pdf_to_txt(input_pdf, output_txt, max_pages = 5):
     fake_file_handle.close()
     
     # Write the selected text from the pdf into a txt.
-    with open(output_txt, 'w', encoding = 'utf-8-sig', errors = 'ignore') as txt_file:
+    # The partial file is renamed once written, so that an interrupted
+    # conversion does not leave a .txt behind.
+    with open(f'{output_txt}.part', 'w', encoding = 'utf-8-sig', errors = 'ignore') as txt_file:
         txt_file.write(text)
+    os.replace(f'{output_txt}.part', output_txt)
     return
 
 
-def export_pdfs_to_txt(deliverables_csv, deliverables_dir, max_pages = 5):
+def convert_worker(conn, max_pages, convert = convert_pdf_to_txt):
+    """
+    Function which runs in a conversion process, and converts the
+    (key, input_pdf, output_txt) tasks received from the pipe, until None.
+    """
+    while True:
+        task = conn.recv()
+        if task is None:
+            return
+        key, input_pdf, output_txt = task
+        try:
+            convert(input_pdf, output_txt, max_pages)
+            status = True
+        except Exception:
+            status = False
+        conn.send((key, status))
+
+
+class ConversionPool:
+    """
+    Pool of pdf conversion processes, where each process receives
+    its tasks through its own pipe. A process that exceeds the timeout
+    of its conversion is terminated and replaced, so that a pathological
+    pdf cannot stall the pipeline.
+    """
+    def __init__(self, workers = 4, timeout = 60, max_pages = 5, convert = convert_pdf_to_txt):
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.convert = convert
+        self.slots = [self._start() for _ in range(workers)]
+
+    def _start(self):
+        conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target = convert_worker, args = (child_conn, self.max_pages, self.convert),
+            daemon = True
+        )
+        process.start()
+        child_conn.close()
+        return {'process': process, 'conn': conn, 'task': None, 'started': None}
+
+    def _restart(self, slot):
+        slot['process'].terminate()
+        slot['process'].join()
+        slot['conn'].close()
+        slot.update(self._start())
+
+    def convert_all(self, tasks):
+        """
+        Converts the (key, input_pdf, output_txt) tasks of the queue,
+        until None is received, and yields (key, input_pdf, status) tuples
+        as the conversions complete or time out.
+        """
+        exhausted = False
+        while True:
+            # Assign the next tasks to the idle processes,
+            # waiting for a task only if no process is busy.
+            for slot in self.slots:
+                if exhausted or slot['task'] is not None:
+                    continue
+                busy = any(other['task'] is not None for other in self.slots)
+                try:
+                    task = tasks.get_nowait() if busy else tasks.get(timeout = 0.1)
+                except queue.Empty:
+                    break
+                if task is None:
+                    exhausted = True
+                    break
+                slot['conn'].send(task)
+                slot['task'], slot['started'] = task, time.monotonic()
+
+            busy_slots = [slot for slot in self.slots if slot['task'] is not None]
+            if exhausted and not busy_slots:
+                return
+            if not busy_slots:
+                continue
+
+            # Collect the finished conversions.
+            ready = multiprocessing.connection.wait(
+                [slot['conn'] for slot in busy_slots], timeout = 0.1
+            )
+            for slot in busy_slots:
+                if slot['conn'] not in ready:
+                    continue
+                key, input_pdf, _ = slot['task']
+                slot['task'] = None
+                try:
+                    _, status = slot['conn'].recv()
+                except EOFError: # The process exited unexpectedly.
+                    self._restart(slot)
+                    status = False
+                yield key, input_pdf, status
+
+            # Replace the processes of the timed out conversions.
+            now = time.monotonic()
+            for slot in busy_slots:
+                if slot['task'] is not None and now - slot['started'] > self.timeout:
+                    key, input_pdf, _ = slot['task']
+                    slot['task'] = None
+                    self._restart(slot)
+                    yield key, input_pdf, False
+
+    def close(self):
+        for slot in self.slots:
+            slot['conn'].send(None)
+            slot['process'].join()
+            slot['conn'].close()
+
+
+def export_pdfs_to_txt(deliverables_csv, deliverables_dir, max_pages = 5, workers = 4, rate = 1.0,
+                       conversion_workers = 4, conversion_timeout = 60, queue_size = 64, checkpoint_every = 1000):
     """
     Function which reads the deliverables csv, and makes a .txt file out of each row,
     where this .txt contains the first max_pages of the pdf, and the filename of the .txt
-    is the rcn (Record Control Number). For storage reasons, only one .pdf is stored at a time, 
-    while all .txts will be saved. Thus each download_url call overwrites the same pdf file.
+    is the rcn (Record Control Number). The pdfs are downloaded concurrently,
+    with at most rate requests per second, into a bounded queue, from which 
+    a pool of processes converts them in parallel. Each .pdf is deleted once converted,
+    for storage reasons. Deliverables which already have a .txt are skipped,
+    unless their url has changed since it was converted.
     """
 
-    # Read the input_csv
-    rows = pandas.read_csv(deliverables_csv, sep = ';')
-    start = 0
-    total = len(rows)
-    data = []
-    
-    # Iterate all rows of the deliverables
-    for i in range(start, total):
-
-        # Measure the duration of the iteration.
-        # This is done to avoid flooding the server,
-        # with download requests.
-        start = time.perf_counter()
-        print(f'Processing {i} out of {total} deliverables.')
-
-        # Construct the file name and the path of the .pdf file.
-        deliverable_pdf = os.path.join(
-            deliverables_dir, 
-            f'{total}.pdf'
+    # Stream the rcn and url of each deliverable from the input_csv.
+    urls = {
+        row.rcn: row.url
+        for row in read_csv_rows(deliverables_csv, sep = ';', usecols = ['rcn', 'url'])
+    }
+    total = len(urls)
+
+    # The manifest keeps the hash of the url of each converted deliverable.
+    # A .txt without a manifest entry, from a run before the manifest, is kept.
+    manifest = Manifest(os.path.join(deliverables_dir, 'manifest.json'), {'max_pages': max_pages})
+
+    def fetched(rcn, url):
+        return (
+            os.path.exists(os.path.join(deliverables_dir, f'{rcn}.txt')) and
+            (rcn not in manifest or not manifest.changed(rcn, url))
         )
-        # Read the url from each row, and save the pdf.
-        download_status = download_pdf(rows['url'].iloc[i], deliverable_pdf)
 
+    # Construct the download items of the deliverables, 
+    # which are new or have changed since the previous run.
+    items = [
+        (rcn, url, os.path.join(deliverables_dir, f'{rcn}.pdf'))
+        for rcn, url in urls.items()
+        if not fetched(rcn, url)
+    ]
+    skipped = total - len(items)
 
-        # The above function call returns the download status.
-        # If the pdf failed to download, we continue to the next.
-        if download_status == False:
-            continue
+    # The downloads are produced in a separate thread, and the queue
+    # blocks the downloads when the conversions fall behind.
+    # Each thread updates only its own counters, which the other one reads.
+    tasks = queue.Queue(maxsize = queue_size)
+    downloads = {'downloaded': 0, 'failed': 0}
+    conversions = {'converted': 0, 'failed': 0}
+    start_time = time.perf_counter()
 
-        # Construct the file name and output path of the .txt file.
-        output_path = os.path.join(
-            deliverables_dir, 
-            f'{rows["rcn"].iloc[i]}.txt'
-        )
-        
-        # Convert the pdf to txt, if possible, and save it.
+    def produce():
         try:
-            convert_pdf_to_txt(deliverable_pdf, output_path, max_pages)
-        except:
-            pass
-        end = time.perf_counter()
-
-        # If the iteration had a duration less than a second then wait.
-        if end - start < 1:
-            time.sleep(1 - (end - start))
+            downloader = Downloader(workers, rate)
+            for rcn, deliverable_pdf, download_status in downloader.download_all(items):
+                # If the pdf failed to download, we continue to the next.
+                if download_status == False:
+                    downloads['failed'] += 1
+                    continue
+                downloads['downloaded'] += 1
+                output_path = os.path.join(deliverables_dir, f'{rcn}.txt')
+                tasks.put((rcn, deliverable_pdf, output_path))
+        finally:
+            tasks.put(None)
+
+    producer = threading.Thread(target = produce, daemon = True)
+    producer.start()
+
+    pool = ConversionPool(conversion_workers, conversion_timeout, max_pages)
+    for rcn, deliverable_pdf, conversion_status in pool.convert_all(tasks):
+        if conversion_status:
+            conversions['converted'] += 1
+            manifest.update(rcn, urls[rcn])
+            if conversions['converted'] % checkpoint_every == 0:
+                manifest.save()
+        else:
+            conversions['failed'] += 1
+        os.remove(deliverable_pdf)
+
+        # Report the throughput of each stage.
+        elapsed = time.perf_counter() - start_time
+        downloaded, converted = downloads['downloaded'], conversions['converted']
+        failed = downloads['failed'] + conversions['failed']
+        print(
+            f'Processing {skipped + converted + failed} out of {total} deliverables.\n'
+            f'Downloaded {downloaded} ({downloaded / elapsed:.2f} pdfs/sec), '
+            f'converted {converted} ({converted / elapsed:.2f} pdfs/sec), '
+            f'failed {failed}.'
+        )
         clear_screen()
+    pool.close()
+    producer.join()
+    manifest.save()
+
+    elapsed = time.perf_counter() - start_time
+    print(
+        f'Downloaded {downloads["downloaded"]} and converted {conversions["converted"]} pdfs '
+        f'in {elapsed:.0f} secs, {downloads["failed"] + conversions["failed"]} failed.'
+    )
     return
 
 
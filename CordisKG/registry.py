@@ -0,0 +1,86 @@
+import time
+import spacy
+from keybert import KeyBERT
+from yake import KeywordExtractor
+from CordisKG.utils import resident_memory
+
+class ModelRegistry:
+    """
+    Process-wide registry which loads each model lazily on first use,
+    and caches it for the life of the process. The load time and
+    the resident memory that each model added are recorded in stats.
+    """
+    def __init__(self):
+        self._models = {}
+        self.stats = {}
+
+    def _load(self, key, loader):
+        if key not in self._models:
+            memory = resident_memory()
+            start_time = time.perf_counter()
+            self._models[key] = loader()
+            self.stats[key] = {
+                'load_time': time.perf_counter() - start_time,
+                'memory': resident_memory() - memory
+            }
+        return self._models[key]
+
+    def spacy(self, name = 'en_core_web_sm', exclude = (), pipes = ()):
+        """
+        Returns the spacy pipeline, without the excluded components,
+        and with the extra pipes added at its end.
+        Each combination of components is cached separately.
+        """
+        def loader():
+            nlp = spacy.load(name, exclude = list(exclude))
+            for pipe in pipes:
+                nlp.add_pipe(pipe, last = True)
+            return nlp
+        return self._load(('spacy', name, tuple(exclude), tuple(pipes)), loader)
+
+    def spacy_ner(self, name = 'en_core_web_sm'):
+        """
+        Returns the spacy pipeline with only the named entity recognizer,
+        which has its own token-to-vector layer in the small english model.
+        """
+        return self.spacy(name, exclude = ('tok2vec', 'tagger', 'parser', 'attribute_ruler', 'lemmatizer'))
+
+    def spacy_pke(self, name = 'en_core_web_sm'):
+        """
+        Returns the spacy pipeline in the same configuration
+        that pke loads it for every document, when no model is supplied.
+        """
+        return self.spacy(name, exclude = ('ner', 'parser'), pipes = ('sentencizer',))
+
+    def keybert(self, name = 'distiluse-base-multilingual-cased-v2'):
+        return self._load(('keybert', name), lambda: KeyBERT(name))
+
+    def yake(self, ngram_range = (1, 3), top_n = 10, dedupLim = 0.9, dedupFunc = 'seqm', windowsSize = 1):
+        """
+        Returns the yake keyword extractor for the given parameters,
+        which holds no per-document state and can be reused.
+        """
+        return self._load(
+            ('yake', ngram_range[1], top_n, dedupLim, dedupFunc, windowsSize),
+            lambda: KeywordExtractor (
+                top = top_n,
+                n = ngram_range[1],
+                dedupLim = dedupLim,
+                dedupFunc = dedupFunc,
+                windowsSize = windowsSize
+            )
+        )
+
+    def report(self):
+        """
+        Prints the load time and the resident memory of each loaded model.
+        """
+        for key, stats in self.stats.items():
+            print(
+                f'{key}: {stats["load_time"]:.2f} secs, '
+                f'{stats["memory"] / 2 ** 20:.1f} MiB'
+            )
+
+
+# The registry is shared by all stages of the process.
+models = ModelRegistry()
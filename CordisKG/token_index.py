@@ -0,0 +1,119 @@
+from collections import defaultdict
+from CordisKG.normalizer import load_normalizer
+
+class TokenIndex:
+    """
+    Inverted index which maps the token ids of a normalizer
+    to the keys of the keyphrases that contain them.
+    The index is built once over a vocabulary and updated incrementally,
+    and finds the keys which share any token with a keyphrase in time
+    proportional to its posting lists, rather than to the whole vocabulary.
+    Each key is indexed either with the token set of its keyphrase,
+    or with a given token set, e.g. of an already normalized keyphrase.
+    """
+    def __init__(self, keyphrases = (), normalizer = None):
+        self.normalizer = normalizer or load_normalizer()
+        self.postings = defaultdict(set)
+        self.token_sets = {}
+        self.update(added = keyphrases)
+
+    def __contains__(self, key):
+        return key in self.token_sets
+
+    def __len__(self):
+        return len(self.token_sets)
+
+    def __iter__(self):
+        return iter(self.token_sets)
+
+    def tokens(self, keyphrase):
+        # The token sets, e.g. of the normalizer, are passed through.
+        if isinstance(keyphrase, (set, frozenset)):
+            return keyphrase
+        return self.normalizer.token_set(keyphrase)
+
+    def add(self, key, tokens = None):
+        """
+        Indexes the key, with the token set of the key itself,
+        if no token set is given. A key which is already indexed is replaced.
+        """
+        if key in self.token_sets:
+            self.remove(key)
+        tokens = self.tokens(key) if tokens is None else tokens
+        self.token_sets[key] = tokens
+        for token in tokens:
+            self.postings[token].add(key)
+
+    def remove(self, key):
+        """
+        Removes the key from the posting lists of its tokens,
+        and drops the posting lists which become empty.
+        """
+        for token in self.token_sets.pop(key, ()):
+            posting = self.postings[token]
+            posting.discard(key)
+            if not posting:
+                del self.postings[token]
+
+    def update(self, added = (), removed = ()):
+        """
+        Applies a bulk change of the vocabulary, the removed keys
+        are dropped before the added keys are indexed.
+        """
+        for key in removed:
+            self.remove(key)
+        for key in added:
+            self.add(key)
+
+    def shares_token(self, keyphrase):
+        """
+        Returns whether any indexed key shares a token with the keyphrase,
+        by a lookup of each of its tokens.
+        """
+        return any(token in self.postings for token in self.tokens(keyphrase))
+
+    def matches(self, keyphrase):
+        """
+        Returns the set of indexed keys, which share any token with the keyphrase,
+        by merging the posting lists of its tokens.
+        """
+        found = set()
+        for token in self.tokens(keyphrase):
+            found.update(self.postings.get(token, ()))
+        return found
+
+    def diff(self, source):
+        """
+        Returns the keyphrases of the source, in their order, which share
+        no token with any indexed key. The source is either a list of keyphrases,
+        or another index, whose keys are compared with their indexed token sets.
+        """
+        if isinstance(source, TokenIndex):
+            return [key for key, tokens in source.token_sets.items() if not self.shares_token(tokens)]
+        return [keyphrase for keyphrase in source if not self.shares_token(keyphrase)]
+
+    def overlap(self, source):
+        """
+        Returns a dictionary of the keyphrases of the source, which share
+        any token with the indexed keys, along with the set of these keys.
+        """
+        if isinstance(source, TokenIndex):
+            source = source.token_sets.items()
+        else:
+            source = ((keyphrase, keyphrase) for keyphrase in source)
+        overlap = {}
+        for key, keyphrase in source:
+            found = self.matches(keyphrase)
+            if found:
+                overlap[key] = found
+        return overlap
+
+
+def load_keyphrase_index(database):
+    """
+    Function which indexes the names of all Keyphrase nodes of the graph,
+    so that the keyphrases of a project or a deliverable can be diffed
+    against the whole vocabulary of the graph.
+    """
+    names = database.execute('MATCH (k:Keyphrase) RETURN k.name', 'r') or []
+    return TokenIndex(name for [name] in names if name)
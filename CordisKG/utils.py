@@ -1,27 +1,25 @@
 import os
-import time
-import spacy
+import csv
 import platform
 import functools
 import operator
-import CordisKG.config
+import numpy
+import pandas
+from CordisKG.instrumentation import counter, resident_memory
+from CordisKG.batching import chunks
+from CordisKG.normalizer import stemmers, load_normalizer
+from CordisKG.token_index import TokenIndex
 from suffix_trees import STree
 from string import punctuation
-from difflib import get_close_matches
-from keybert import KeyBERT
-from collections import OrderedDict
-from stempel import StempelStemmer
-from nltk.stem import SnowballStemmer
+from difflib import SequenceMatcher
+from nltk.corpus import stopwords
+from collections import OrderedDict, Counter, defaultdict
 
-
-# Initialize all required stemmers once.
-stemmers = {
-    'english': SnowballStemmer('english'),
-    'french': SnowballStemmer('french'),
-    'spanish': SnowballStemmer('spanish'),
-    'portuguese': SnowballStemmer('portuguese'),
-    'polish': StempelStemmer.default()
-}
+try: # pyarrow is optional, and streams csvs faster than pandas.
+    import pyarrow
+    import pyarrow.csv
+except ImportError:
+    pyarrow = None
 
 
 # Augment the stopwords set.
@@ -38,43 +36,13 @@ stop_words = set(stopwords.words('english')).union([
     'edu', 'com', 'org', 've', 'll', 'd', 're', 't', 's'])
 
 
-def counter(func):
-    """
-    Print the elapsed system time in seconds, 
-    if only the debug flag is set to True.
-    """
-    if not CordisKG.config.debug:
-        return func
-    @functools.wraps(func)
-    def wrapper_counter(*args, **kwargs):
-        start_time = time.perf_counter()
-        result = func(*args, **kwargs)
-        end_time = time.perf_counter()
-        print(f'{func.__name__}: {end_time - start_time} secs')
-        return result
-    return wrapper_counter
-
-
-def load_models():
-    """
-    Function which loads the english NLP model, and the Keybert model.
-    This needs to run once since all models need a few seconds to load.
-    """
-    return (
-        spacy.load('en_core_web_sm'),
-        KeyBERT('distiluse-base-multilingual-cased-v2')
-    )
-
-
 def preprocess(lis, language):
     """
     Function which applies stemming to a 
     lowercase version of each string of the list,
     which has all punctuation removed.
     """
-    return list(map(stemmers[language].stem, 
-           map(lambda s: s.translate(str.maketrans('', '', punctuation)),
-           map(str.lower, lis))))
+    return load_normalizer(language).normalize_all(lis)
 
 
 def postprocess(lis):
@@ -116,6 +84,65 @@ def flatten_list(l):
     return functools.reduce(operator.iconcat, l, [])
 
 
+def read_csv_chunks(path, sep = ',', usecols = None, chunksize = 50000):
+    """
+    Generator which streams a csv in dataframes of chunksize rows,
+    except for the last one, with only the used columns,
+    so the memory stays flat for any file size.
+    Every column is parsed as a string, which skips the type inference,
+    and the stages convert the fields they need. Missing values are NaN.
+    If pyarrow is available, its streaming reader is used, otherwise
+    the chunked reader of pandas, since the pyarrow engine of pandas
+    reads the whole file at once.
+    """
+    if pyarrow is None:
+        yield from pandas.read_csv(path, sep = sep, usecols = usecols, dtype = str, chunksize = chunksize)
+        return
+
+    # The column types of pyarrow are given by name, thus read the header
+    # when every column is used, without the byte order mark of the file.
+    if usecols is None:
+        with open(path, 'r', newline = '', encoding = 'utf-8-sig') as file:
+            usecols = next(csv.reader(file, delimiter = sep))
+
+    reader = pyarrow.csv.open_csv(
+        path,
+        parse_options = pyarrow.csv.ParseOptions(delimiter = sep, newlines_in_values = True),
+        convert_options = pyarrow.csv.ConvertOptions(
+            include_columns = usecols,
+            column_types = {column: pyarrow.string() for column in usecols},
+            strings_can_be_null = True
+        )
+    )
+
+    def frame(table):
+        frame = table.to_pandas()
+        return frame.where(frame.notna(), numpy.nan)
+
+    # The record batches of pyarrow are sized in bytes,
+    # thus they are sliced and joined in chunks of chunksize rows.
+    batches, rows = [], 0
+    for batch in reader:
+        batches.append(batch)
+        rows += batch.num_rows
+        while rows >= chunksize:
+            table = pyarrow.Table.from_batches(batches)
+            yield frame(table.slice(0, chunksize))
+            rest = table.slice(chunksize)
+            batches, rows = rest.to_batches(), rest.num_rows
+    if rows:
+        yield frame(pyarrow.Table.from_batches(batches))
+
+
+def read_csv_rows(path, sep = ',', usecols = None, chunksize = 50000):
+    """
+    Generator which streams the rows of a csv as named tuples,
+    with only the used columns as fields.
+    """
+    for chunk in read_csv_chunks(path, sep, usecols, chunksize):
+        yield from chunk.itertuples(index = False)
+
+
 def find_keys_in_text(text, keyphrases):
     """
     Function that exactly matches each keyphrase from 
@@ -131,42 +158,118 @@ def find_keys_in_text(text, keyphrases):
         if keyphrase in text.lower()
     ]
 
+def char_counts(strings, buckets = 64):
+    """
+    Function which returns the matrix of the character counts of the strings,
+    where the characters are folded in a number of buckets.
+    The common count of two rows bounds the matching characters of the strings
+    from above, as the quick_ratio() of SequenceMatcher, since folding
+    the characters only merges their counts.
+    """
+    counts = numpy.zeros((len(strings), buckets), dtype = numpy.int32)
+    for i, s in enumerate(strings):
+        for char, count in Counter(s).items():
+            counts[i, ord(char) % buckets] += count
+    return counts
+
+
+def longest_common_substrings(strings):
+    """
+    Function which returns the set of the largest common substrings of the strings.
+    Every common substring is a substring of the shortest string,
+    and a common substring of some length has common substrings
+    of every smaller length, so the length is binary searched.
+    """
+    shortest = min(strings, key = len)
+    others = [s for s in strings if s is not shortest]
+    def common(length):
+        return {
+            shortest[i: i + length] for i in range(len(shortest) - length + 1)
+            if all(shortest[i: i + length] in s for s in others)
+        }
+    low, high, found = 0, len(shortest), {''}
+    while low < high:
+        middle = (low + high + 1) // 2
+        substrings = common(middle)
+        if substrings:
+            low, found = middle, substrings
+        else:
+            high = middle - 1
+    return found
+
+
+def complete_terms(string):
+    # Strip the extra whitespace around the substring, and remove incomplete terms.
+    return ' '.join(term for term in string.strip().split() if len(term) > 2)
+
+
 def remove_common_strings_from_list(keyphrases, cutoff = 0.7):
     """
     Function which removes strings from a list that share a common substring,
     and includes the largest common substring between them in the final list.
-    This is achieved by grouping similar strings using get_close_matches()
-    and then by extracting their largest common substring using a suffix tree.
+    Each keyphrase is grouped with its close matches, as in get_close_matches(),
+    and then the largest common substring of the group is extracted.
+    The candidates are pruned in bulk with the bounds of real_quick_ratio()
+    and quick_ratio(), on the lengths and the character counts of the strings,
+    so only the remaining pairs are scored with ratio().
+    The suffix tree is only built for the groups whose largest common
+    substrings are tied and leave different terms, since it breaks their tie.
     """
+    # Lowercase all keyphrases, and count the duplicates,
+    # since each duplicate is a close match of its own.
+    keyphrases = list(map(str.lower, keyphrases))
+    counts = Counter(keyphrases)
+    unique = list(counts.keys())
+    lengths = numpy.array([len(keyphrase) for keyphrase in unique])
+    characters = char_counts(unique)
+
     results = []
+    matcher = SequenceMatcher()
+    for i, keyphrase in enumerate(unique):
+        # The upper bounds of ratio() are computed with the same expression,
+        # 2 * matches / total, so a pruned pair never reaches the cutoff.
+        # Two empty strings have a ratio of 1.
+        total = lengths + lengths[i]
+        with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+            bound = numpy.where(total > 0, 2.0 * numpy.minimum(lengths, lengths[i]) / total, 1.0)
+            candidates = numpy.flatnonzero(bound >= cutoff)
+            matches = numpy.minimum(characters[candidates], characters[i]).sum(axis = 1)
+            bound = numpy.where(total[candidates] > 0, 2.0 * matches / total[candidates], 1.0)
+        candidates = candidates[bound >= cutoff]
 
-    # Lowercase all keyphrases
-    keyphrases = list(map(str.lower, keyphrases))
+        # Score the candidates in the same way as get_close_matches(),
+        # where each duplicate is a match of its own, and sort them
+        # by decreasing score and then by decreasing string.
+        matcher.set_seq2(keyphrase)
+        close_matches = []
+        for j in candidates.tolist():
+            matcher.set_seq1(unique[j])
+            score = matcher.ratio()
+            if score >= cutoff:
+                close_matches += [(score, unique[j])] * counts[unique[j]]
+        close_matches = [match for _, match in sorted(close_matches, reverse = True)]
 
-    for keyphrase in keyphrases:
-        close_matches = get_close_matches(
-            keyphrase, keyphrases, 
-            n = len(keyphrases), 
-            cutoff = cutoff
-        )
         if len(close_matches) > 1:
-           # Create a suffix tree based on the list of highly similar keyphrases
-           # in order to calculate the largest common substring.
-           st = STree.STree([keyphrase] + close_matches)
-           largest_common_string = st.lcs().strip() # Strip extra whitespace around the substring.
-           
-           # Remove incomplete terms.
-           largest_common_string = ' '.join(
-               term for term in largest_common_string.split()
-               if len(term) > 2
-           ) 
+           # Calculate the largest common substring of the highly similar keyphrases,
+           # with a suffix tree, only if the largest common substrings
+           # leave different complete terms, since it breaks their tie.
+           largest_common_strings = {
+               complete_terms(string) for string in
+               longest_common_substrings([keyphrase] + close_matches)
+           }
+           if len(largest_common_strings) == 1:
+               largest_common_string = largest_common_strings.pop()
+           else:
+               st = STree.STree([keyphrase] + close_matches)
+               largest_common_string = complete_terms(st.lcs())
+
            # If the string is not empty, append it.
            if largest_common_string:
                results.append(largest_common_string)
 
         else: # unique keyphrase case
             results.append(keyphrase)
-    
+
     # Remove duplicate values using ordered dict.
     # and return the result list.
     return list(OrderedDict.fromkeys(results).keys())
@@ -177,13 +280,10 @@ def get_diff_of_keys(source, target):
     Function which returns a list of keyphrases, 
     that are included in source but not in target.
     This done through partial match of their keyphrases.
-    Each keyphrase is lowercase and split in a set of terms
-    to enable this partial match.
+    Each keyphrase is lowercase and split in a set of term ids
+    to enable this partial match, and the target is either a list
+    of keyphrases, or an already built index of their terms.
     """
-    return [
-        key_src for key_src in source 
-        if not any(
-            set(key_src.lower().split())
-            & set(key_tar.lower().split())
-            for key_tar in target)
-    ]
+    if not isinstance(target, TokenIndex):
+        target = TokenIndex(target)
+    return target.diff(source)
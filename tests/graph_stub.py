@@ -0,0 +1,124 @@
+from collections import defaultdict
+
+
+class RecordingDatabase:
+    """
+    Stand-in for Neo4jDatabase, which records every query
+    along with the parameter maps that it was executed with,
+    and applies them to an in-memory Graph, when one is given.
+    """
+    def __init__(self, graph = None):
+        self.graph = graph
+        self.calls = []
+
+    def execute(self, query, mode, parameters = None):
+        self.calls.append((query, [parameters or {}]))
+        if self.graph is not None:
+            return self.graph.apply(query, [parameters or {}])
+        return []
+
+    def execute_many(self, query, parameters, batch_size = 1000, workers = 1):
+        maps = list(parameters)
+        self.calls.append((query, maps))
+        if self.graph is not None:
+            self.graph.apply(query, maps)
+        return len(maps)
+
+
+class Graph:
+    """
+    The nodes and relationships, which the queries of the create functions
+    would create in an empty database. Each query is recognized by its text,
+    and applied with the MATCH and MERGE semantics of its clauses.
+    """
+    def __init__(self):
+        self.nodes = defaultdict(dict)
+        self.relationships = set()
+
+    def merge_node(self, label, key, properties = None):
+        self.nodes[label].setdefault(key, {}).update(properties or {})
+
+    def create_node(self, label, key, properties):
+        assert key not in self.nodes[label]
+        self.nodes[label][key] = properties
+
+    def merge_relationship(self, start, relationship, end):
+        # The relationship queries MATCH both of their nodes.
+        if start[1] in self.nodes[start[0]] and end[1] in self.nodes[end[0]]:
+            self.relationships.add((start, relationship, end))
+
+    def counts(self):
+        nodes = {label: len(keys) for label, keys in self.nodes.items()}
+        relationships = defaultdict(int)
+        for start, relationship, end in self.relationships:
+            relationships[(start[0], relationship, end[0])] += 1
+        return nodes, dict(relationships)
+
+    def project(self, row):
+        return {field: row[field] for field in row if field not in ('coordinator', 'participants')}
+
+    def apply(self, query, maps):
+        rows = [row for parameters in maps for row in parameters.get('rows', [])]
+        names = [name for parameters in maps for name in parameters.get('names', [])]
+
+        if query.startswith('CREATE CONSTRAINT'):
+            return []
+        if query.startswith('MATCH (t:') and 'RETURN' in query:
+            label = query[len('MATCH (t:'): query.index(')')]
+            return [[key] for key in self.nodes[label]]
+
+        if query.startswith('CREATE (p:Project {id: $id'):
+            for row in maps:
+                self.create_node('Project', row['id'], self.project(row))
+                # The coordinator is merged once for each participant.
+                for name in row['participants']:
+                    self.merge_node('Organization', name)
+                    self.merge_node('Organization', row['coordinator'])
+                    for start, relationship in [(name, 'participates_in'),
+                                                (row['coordinator'], 'participates_in'),
+                                                (row['coordinator'], 'coordinates')]:
+                        self.merge_relationship(('Organization', start), relationship, ('Project', row['id']))
+        elif query.startswith('UNWIND $rows AS row CREATE (p:Project'):
+            for row in rows:
+                self.create_node('Project', row['id'], self.project(row))
+        elif query.startswith('UNWIND $names AS name MERGE (:Organization'):
+            for name in names:
+                self.merge_node('Organization', name)
+        elif 'MATCH (c:Organization {name: row.coordinator})' in query:
+            for row in rows:
+                project = ('Project', row['id'])
+                self.merge_relationship(('Organization', row['coordinator']), 'participates_in', project)
+                self.merge_relationship(('Organization', row['coordinator']), 'coordinates', project)
+                for name in row['participants']:
+                    self.merge_relationship(('Organization', name), 'participates_in', project)
+        elif 'MERGE (d:Deliverable {rcn: row.rcn})' in query:
+            for row in rows:
+                if row['projectID'] not in self.nodes['Project']:
+                    continue
+                self.merge_node('Deliverable', row['rcn'], {
+                    field: row[field] for field in
+                    ['title', 'projectAcronym', 'programme', 'deliverableType', 'url']
+                })
+                self.merge_relationship(('Deliverable', row['rcn']), 'belongs', ('Project', row['projectID']))
+                for name in row['persons']:
+                    self.merge_node('Person', name)
+                    self.merge_relationship(('Person', name), 'writes', ('Deliverable', row['rcn']))
+        elif query.startswith('UNWIND $names AS name MERGE (:Keyphrase'):
+            for name in names:
+                self.merge_node('Keyphrase', name)
+        elif query.startswith('UNWIND $rows AS row MATCH (k:Keyphrase'):
+            label = query[query.index('MATCH (t:') + len('MATCH (t:'): query.index(' {', query.index('MATCH (t:'))]
+            for row in rows:
+                for id in row['ids']:
+                    self.merge_relationship((label, id), 'includes', ('Keyphrase', row['key']))
+        elif query.startswith('MATCH (t:') and 'MERGE (k:Keyphrase' in query:
+            label = query[len('MATCH (t:'): query.index(' {')]
+            for row in maps:
+                if row['id'] not in self.nodes[label]:
+                    continue
+                for key in row['keys']:
+                    self.merge_node('Keyphrase', key)
+                    self.merge_relationship((label, row['id']), 'includes', ('Keyphrase', key))
+        else:
+            raise AssertionError(f'Unexpected query: {query}')
+        return []
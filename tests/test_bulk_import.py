@@ -0,0 +1,64 @@
+import os
+import csv
+from CordisKG.bulk_import import export_bulk_import_files
+from tests.test_create import (
+    projects_csv, deliverables_csv, persons_csv,
+    project_keyphrases_csv, deliverables_keyphrases_csv, expected_graph
+)
+
+# The node and relationship counts of the graph, which each file holds.
+node_files = {
+    'projects.csv': 'Project',
+    'organizations.csv': 'Organization',
+    'deliverables.csv': 'Deliverable',
+    'persons.csv': 'Person',
+    'keyphrases.csv': 'Keyphrase'
+}
+relationship_files = {
+    'participates_in.csv': ('Organization', 'participates_in', 'Project'),
+    'coordinates.csv': ('Organization', 'coordinates', 'Project'),
+    'belongs.csv': ('Deliverable', 'belongs', 'Project'),
+    'writes.csv': ('Person', 'writes', 'Deliverable'),
+    'project_includes.csv': ('Project', 'includes', 'Keyphrase'),
+    'deliverable_includes.csv': ('Deliverable', 'includes', 'Keyphrase')
+}
+
+
+def export(output_dir):
+    return export_bulk_import_files(
+        str(output_dir), projects_csv, deliverables_csv, persons_csv,
+        project_keyphrases_csv, deliverables_keyphrases_csv
+    )
+
+
+def read_rows(path):
+    with open(path, newline = '', encoding = 'utf-8') as file:
+        return list(csv.reader(file))[1:]
+
+
+def test_bulk_files_match_create_functions(tmp_path):
+    counts = export(tmp_path)
+    nodes, relationships = expected_graph().counts()
+    for name, label in node_files.items():
+        assert counts[name] == nodes.get(label, 0), name
+    for name, relationship in relationship_files.items():
+        assert counts[name] == relationships.get(relationship, 0), name
+
+
+def test_bulk_files_contents(tmp_path):
+    counts = export(tmp_path)
+    # The returned counts are the rows of the files.
+    for name, count in counts.items():
+        assert len(read_rows(tmp_path / name)) == count
+
+    graph = expected_graph()
+    projects = {int(row[0]) for row in read_rows(tmp_path / 'projects.csv')}
+    deliverables = {int(row[0]) for row in read_rows(tmp_path / 'deliverables.csv')}
+    keyphrases = {row[0] for row in read_rows(tmp_path / 'keyphrases.csv')}
+    assert projects == set(graph.nodes['Project'])
+    assert deliverables == set(graph.nodes['Deliverable'])
+    assert keyphrases == set(graph.nodes['Keyphrase'])
+    # The persons of the orphan deliverable are skipped, and each author is written once.
+    writes = [(row[0], int(row[1])) for row in read_rows(tmp_path / 'writes.csv')]
+    assert writes.count(('Maria Papadopoulou', 9005)) == 1
+    assert all(rcn != 9004 for _, rcn in writes)
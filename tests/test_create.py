@@ -0,0 +1,164 @@
+import os
+from CordisKG.create import create_project_graph, create_deliverable_graph, create_keyphrases_graph
+from tests.graph_stub import RecordingDatabase, Graph
+
+data_path = os.path.join(os.path.dirname(__file__), 'data')
+projects_csv = os.path.join(data_path, 'projects.csv')
+deliverables_csv = os.path.join(data_path, 'deliverables.csv')
+persons_csv = os.path.join(data_path, 'persons.csv')
+project_keyphrases_csv = os.path.join(data_path, 'project_keyphrases.csv')
+deliverables_keyphrases_csv = os.path.join(data_path, 'deliverables_keyphrases.csv')
+
+
+# The graph of the fixtures, which the baseline queries create, one row at a time.
+# As in the baseline, an empty field is the string 'nan', e.g. the participants of project 104,
+# the orphan deliverable 9004 and its persons are skipped, since project 999 does not exist,
+# and the keyphrases of the orphan project and deliverable are not created.
+def project(id, acronym, call, status, programme, topics, start, end, url, total, contribution, scheme):
+    return {
+        'id': id, 'acronym': acronym, 'call': call, 'status': status, 'programme': programme,
+        'topics': topics, 'startDate': start, 'endDate': end, 'projectUrl': url,
+        'totalCost': total, 'ecMaxContribution': contribution, 'fundingScheme': scheme
+    }
+
+expected_projects = {
+    101: project(101, 'ALPHA', 'H2020-A', 'SIGNED', 'H2020-EU.1', 'TOPIC-1', '2018-01-01', '2020-12-31',
+                 'http://alpha.eu', 1000000.5, 900000.0, 'RIA'),
+    102: project(102, 'BETA', 'H2020-B', 'CLOSED', 'H2020-EU.2', 'TOPIC-2', '2017-05-01', '2019-04-30',
+                 'nan', 250000.0, 250000.25, 'CSA'),
+    103: project(103, 'GAMMA "G"', 'H2020-C', 'SIGNED', 'H2020-EU.3', 'TOPIC-3', '2019-02-01', '2022-01-31',
+                 'http://gamma.eu', 500000.0, 400000.0, 'IA'),
+    104: project(104, 'DELTA', 'H2020-D', 'SIGNED', 'H2020-EU.1', 'TOPIC-1', '2020-03-01', '2023-02-28',
+                 'http://delta.eu', 75000.0, 75000.0, 'MSCA')
+}
+expected_organizations = {
+    'University of Patras': [(101, True), (102, False), (103, False), (104, True)],
+    'National Technical University of Athens': [(101, False)],
+    'Fraunhofer': [(101, False), (102, True), (103, False)],
+    'CNRS': [(103, True)],
+    'nan': [(104, False)]
+}
+expected_deliverables = {
+    9001: (101, 'Data management plan', 'ALPHA', 'H2020-EU.1', 'ORDP', 'http://alpha.eu/d1.pdf'),
+    9002: (101, 'Final report', 'ALPHA', 'H2020-EU.1', 'Documents', 'http://alpha.eu/d2.pdf'),
+    9003: (102, 'Dissemination; plan', 'BETA', 'H2020-EU.2', 'Documents', 'http://beta.eu/d1.pdf'),
+    9005: (103, 'Prototype', 'GAMMA "G"', 'H2020-EU.3', 'Demonstrators', 'nan')
+}
+expected_persons = {
+    'Maria Papadopoulou': [9001, 9005],
+    'John Smith': [9001, 9002],
+    'Anna Müller': [9003],
+    'Pierre Dupont': [9005]
+}
+expected_keyphrases = {
+    ('Project', 101): ['knowledge graph', 'keyphrase extraction', 'neo4j'],
+    ('Project', 102): ['dissemination', 'knowledge graph'],
+    ('Project', 103): ['battery model', 'knowledge graph'],
+    ('Project', 104): ['machine learning'],
+    ('Deliverable', 9001): ['data management', 'neo4j'],
+    ('Deliverable', 9002): ['final report', 'knowledge graph'],
+    ('Deliverable', 9003): ['dissemination plan'],
+    ('Deliverable', 9005): ['prototype', 'battery model']
+}
+
+
+def expected_graph(deliverables = True, keyphrases = True):
+    graph = Graph()
+    graph.nodes['Project'] = {id: dict(properties) for id, properties in expected_projects.items()}
+    for name, projects in expected_organizations.items():
+        graph.merge_node('Organization', name)
+        for id, coordinates in projects:
+            graph.merge_relationship(('Organization', name), 'participates_in', ('Project', id))
+            if coordinates:
+                graph.merge_relationship(('Organization', name), 'coordinates', ('Project', id))
+    if deliverables:
+        for rcn, (id, title, acronym, programme, type, url) in expected_deliverables.items():
+            graph.merge_node('Deliverable', rcn, {
+                'title': title, 'projectAcronym': acronym, 'programme': programme,
+                'deliverableType': type, 'url': url
+            })
+            graph.merge_relationship(('Deliverable', rcn), 'belongs', ('Project', id))
+        for name, rcns in expected_persons.items():
+            graph.merge_node('Person', name)
+            for rcn in rcns:
+                graph.merge_relationship(('Person', name), 'writes', ('Deliverable', rcn))
+    if keyphrases:
+        for target, keys in expected_keyphrases.items():
+            for key in keys:
+                graph.merge_node('Keyphrase', key)
+                graph.merge_relationship(target, 'includes', ('Keyphrase', key))
+    return graph
+
+
+def project_graph(batch_size):
+    database = RecordingDatabase()
+    create_project_graph(database, projects_csv, batch_size)
+    graph = Graph()
+    for query, maps in database.calls:
+        graph.apply(query, maps)
+    return graph
+
+
+def keyphrases_graph(batch_size):
+    # The keyphrases pass reads the existing targets, thus the graph is replayed live.
+    graph = Graph()
+    database = RecordingDatabase(graph)
+    create_project_graph(database, projects_csv)
+    create_deliverable_graph(database, deliverables_csv, persons_csv)
+    create_keyphrases_graph(database, project_keyphrases_csv, 'Project', batch_size)
+    create_keyphrases_graph(database, deliverables_keyphrases_csv, 'Deliverable', batch_size, workers = 2)
+    return graph
+
+
+def test_project_graph_matches_expected():
+    expected = expected_graph(deliverables = False, keyphrases = False)
+    for batch_size in (None, 1, 2, 5000):
+        graph = project_graph(batch_size)
+        assert dict(graph.nodes) == dict(expected.nodes)
+        assert graph.relationships == expected.relationships
+
+
+def test_project_graph_contents():
+    graph = project_graph(batch_size = 2)
+    projects = graph.nodes['Project']
+    assert set(projects) == {101, 102, 103, 104}
+    assert projects[101]['totalCost'] == 1000000.5
+    assert projects[103]['acronym'] == 'GAMMA "G"'
+    assert (('Organization', 'Fraunhofer'), 'coordinates', ('Project', 102)) in graph.relationships
+    assert (('Organization', 'National Technical University of Athens'), 'participates_in',
+            ('Project', 101)) in graph.relationships
+    assert (('Organization', 'CNRS'), 'participates_in', ('Project', 103)) in graph.relationships
+
+
+def test_keyphrases_graph_matches_expected():
+    expected = expected_graph()
+    for batch_size in (None, 1, 3, 5000):
+        graph = keyphrases_graph(batch_size)
+        assert dict(graph.nodes) == dict(expected.nodes)
+        assert graph.relationships == expected.relationships
+
+
+def test_chunked_deliverables_join_matches_single_chunk():
+    graphs = []
+    for chunk_size in (1, 2, 100000):
+        graph = Graph()
+        database = RecordingDatabase(graph)
+        create_project_graph(database, projects_csv)
+        create_deliverable_graph(database, deliverables_csv, persons_csv, chunk_size = chunk_size)
+        graphs.append(graph)
+    expected = expected_graph(keyphrases = False)
+    for graph in graphs:
+        assert dict(graph.nodes) == dict(expected.nodes)
+        assert graph.relationships == expected.relationships
+
+
+def test_concurrent_keyphrase_batches_do_not_share_keyphrases():
+    graph = Graph()
+    database = RecordingDatabase(graph)
+    create_project_graph(database, projects_csv)
+    create_keyphrases_graph(database, project_keyphrases_csv, 'Project', batch_size = 2, workers = 2)
+    query, maps = database.calls[-1]
+    batches = [[row['key'] for row in parameters['rows']] for parameters in maps]
+    keys = [key for batch in batches for key in batch]
+    assert len(keys) == len(set(keys)) == len(graph.nodes['Keyphrase'])
+    assert graph.relationships
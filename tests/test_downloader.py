@@ -0,0 +1,110 @@
+import os
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from CordisKG.downloader import Downloader
+
+pdf_body = b'%PDF-1.4 ' + b'x' * 200000
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the Cordis site, where /landing/{name} redirects
+    to /pdf/{name}, the flaky paths fail with 503 on their first request,
+    and the truncated pdf closes the connection before its declared length.
+    """
+    def do_GET(self):
+        self.server.requests[self.path] += 1
+        name = self.path.rsplit('/', 1)[-1]
+        if 'flaky' in name and self.server.requests[self.path] == 1:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path.startswith('/landing/'):
+            host, port = self.server.server_address
+            body = f"<script>window.location='http://{host}:{port}/pdf/{name}'</script>".encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path.startswith('/pdf/'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/pdf')
+            self.send_header('Content-Length', str(len(pdf_body)))
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.write(pdf_body[:1000] if 'truncated' in name else pdf_body)
+            self.close_connection = True
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def log_message(self, format, *args):
+        return
+
+
+class CountingBucket:
+    def __init__(self):
+        self.acquired = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            self.acquired += 1
+
+
+def serve():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.requests = Counter()
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+
+def test_download_all_against_stand_in_server(tmp_path):
+    server = serve()
+    host, port = server.server_address
+    try:
+        downloader = Downloader(workers = 2, rate = 1000, max_retries = 2, backoff_factor = 0.01)
+        downloader.bucket = CountingBucket()
+        names = ['ok', 'flaky', 'flakypdf', 'truncated']
+        items = [
+            (name, f'http://{host}:{port}/landing/{name}', os.path.join(tmp_path, f'{name}.pdf'))
+            for name in names
+        ]
+        status = {key: ok for key, _, ok in downloader.download_all(items)}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert status == {'ok': True, 'flaky': True, 'flakypdf': True, 'truncated': False}
+
+    # The 503 responses were retried once, and every retry took a token.
+    assert server.requests['/landing/flaky'] == 2
+    assert server.requests['/pdf/flakypdf'] == 2
+    assert downloader.bucket.acquired == sum(server.requests.values())
+
+    # The complete pdfs were renamed from their partial files,
+    # while the truncated pdf left no file behind.
+    for name in ['ok', 'flaky', 'flakypdf']:
+        with open(os.path.join(tmp_path, f'{name}.pdf'), 'rb') as file:
+            assert file.read() == pdf_body
+    assert sorted(os.listdir(tmp_path)) == ['flaky.pdf', 'flakypdf.pdf', 'ok.pdf']
+
+
+def test_retries_stop_at_max_retries(tmp_path):
+    server = serve()
+    host, port = server.server_address
+    try:
+        downloader = Downloader(workers = 1, rate = 1000, max_retries = 0, backoff_factor = 0.01)
+        ok = downloader.download_pdf(
+            f'http://{host}:{port}/landing/flaky', os.path.join(tmp_path, 'flaky.pdf')
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+    # The landing page failed after its only attempt, thus nothing is downloaded.
+    assert not ok
+    assert server.requests['/landing/flaky'] == 1
+    assert os.listdir(tmp_path) == []
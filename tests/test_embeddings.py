@@ -0,0 +1,51 @@
+import os
+import numpy as np
+from CordisKG.embeddings import EmbeddingCache
+
+
+class Encoder:
+    """
+    Deterministic stand-in for a sentence encoder,
+    which counts the texts that it encodes.
+    """
+    def __init__(self):
+        self.encoded = 0
+
+    def __call__(self, texts):
+        self.encoded += len(texts)
+        return np.array([[len(text), text.count('a'), 1.0] for text in texts], dtype = np.float32)
+
+
+def test_embeddings_are_reused_across_instances(tmp_path):
+    path = os.path.join(tmp_path, 'embeddings')
+    encode = Encoder()
+    first = EmbeddingCache(path, 'model').embed(['alpha', 'beta', 'alpha'], encode)
+    second = EmbeddingCache(path, 'model').embed(['beta', 'alpha'], encode)
+    assert encode.encoded == 2
+    assert np.array_equal(first[1], second[0])
+    assert np.array_equal(first[0], second[1])
+
+
+def test_missing_vectors_file_is_an_empty_cache(tmp_path):
+    path = os.path.join(tmp_path, 'embeddings')
+    encode = Encoder()
+    EmbeddingCache(path, 'model').embed(['alpha', 'beta'], encode)
+    os.remove(f'{path}.f32')
+
+    cache = EmbeddingCache(path, 'model')
+    assert cache.index == {}
+    vectors = cache.embed(['beta'], encode)
+    assert encode.encoded == 3
+    assert np.array_equal(vectors, encode(['beta']))
+
+
+def test_partially_written_vectors_are_dropped(tmp_path):
+    path = os.path.join(tmp_path, 'embeddings')
+    encode = Encoder()
+    EmbeddingCache(path, 'model').embed(['alpha', 'beta'], encode)
+    # Cut the last vector in half, as an interrupted write would.
+    os.truncate(f'{path}.f32', os.path.getsize(f'{path}.f32') - 6)
+
+    cache = EmbeddingCache(path, 'model')
+    assert len(cache.index) == 1
+    assert os.path.getsize(f'{path}.f32') == 4 * 3
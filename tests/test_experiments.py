@@ -0,0 +1,63 @@
+import os
+import pytest
+
+# The experiments import the keyphrase models, which are stubbed below.
+experiments = pytest.importorskip('CordisKG.experiments')
+
+
+def write_dataset(path):
+    for directory in ('docsutf8', 'keys'):
+        os.makedirs(path / directory)
+    (path / 'language.txt').write_text('english\n')
+    words = ' '.join(f'word{i}' for i in range(40))
+    for name in ('a', 'b'):
+        (path / 'docsutf8' / f'{name}.txt').write_text(f'{name} {words}')
+        (path / 'keys' / f'{name}.key').write_text('word1\nword2\n')
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    """
+    Runs the experiments on a dataset of two documents, with the models
+    replaced by a stand-in, which ranks the words of each text in order.
+    Returns the (method, top_n) of each extraction of the run.
+    """
+    write_dataset(tmp_path / 'dataset')
+    monkeypatch.setattr(experiments, 'EmbeddingCache', lambda *args: None)
+    monkeypatch.setattr(experiments.models, 'keybert', lambda: None)
+
+    def execute(top_n, score_at = None, cache_top_n = None):
+        extracted = []
+        def extract_keys(task):
+            method, text, n = task
+            extracted.append((method, n))
+            return text.split()[1:n + 1], 0.01
+        def keybert_batch(texts, *args, top_n, **kwargs):
+            extracted.extend(('Keybert', top_n) for _ in texts)
+            return [text.split()[1:top_n + 1] for text in texts]
+        monkeypatch.setattr(experiments, 'extract_keys', extract_keys)
+        monkeypatch.setattr(experiments.CordisKG.models, 'keybert_batch', keybert_batch)
+        monkeypatch.setattr(experiments.pd.DataFrame, 'to_excel', lambda *args, **kwargs: None)
+        df = experiments.run_experiments(
+            str(tmp_path), str(tmp_path / 'results.xlsx'), top_n, (1, 3), None,
+            cache_path = str(tmp_path / 'cache.json'), score_at = score_at, cache_top_n = cache_top_n
+        )
+        return extracted, df
+    return execute
+
+
+def test_cached_rankings_are_sliced_for_smaller_cutoffs(run):
+    extracted, first = run(top_n = 5, cache_top_n = 10)
+    assert sorted(extracted) == sorted(
+        [(method, 10) for method in ('Yake', 'Textrank', 'Singlerank') for _ in range(2)] + [('Keybert', 5)] * 2
+    )
+
+    # A smaller top_n reuses the rankings, except for the combinations of Max Sum.
+    extracted, second = run(top_n = 3, score_at = [1, 3])
+    assert extracted == [('Keybert', 3)] * 2
+    assert list(second['Yake pF1@1']) == list(second['Textrank pF1@1'])
+
+    # The same top_n is fully cached, and a larger one extracts the rankings again.
+    assert run(top_n = 5, cache_top_n = 10)[0] == []
+    extracted, _ = run(top_n = 5, score_at = [5, 20])
+    assert ('Yake', 20) in extracted and ('Keybert', 5) not in extracted
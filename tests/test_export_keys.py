@@ -0,0 +1,95 @@
+import os
+import glob
+import pandas
+import pytest
+
+# The export imports the keyphrase models, which are stubbed below.
+export_keys = pytest.importorskip('CordisKG.export_keys')
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def export(tmp_path, monkeypatch):
+    """
+    Runs the serial export of the input rows, with the models replaced
+    by a stand-in, which returns the first word and the length of each text.
+    Returns the texts that each run extracted the keyphrases of.
+    """
+    aux_keys_path = tmp_path / 'keyphrases.txt'
+    aux_keys_path.write_text('graph\n')
+    input_csv, output_csv = tmp_path / 'projects.csv', tmp_path / 'project_keyphrases.csv'
+
+    monkeypatch.setattr(export_keys, 'load_worker_models', lambda *args: None)
+    monkeypatch.setattr(export_keys, 'load_matcher', lambda *args: None)
+    monkeypatch.setattr(export_keys.CordisKG.utils, 'clear_screen', lambda: None)
+    monkeypatch.setattr(export_keys.CordisKG.models, 'textrank_pipe',
+                        lambda items, **kwargs: ((i, text.split()[:1]) for i, text in items))
+
+    def run(rows, fail_on = None, top_n = 10):
+        extracted = []
+        def extract_keys(text, textrank_phrases, *args):
+            if text == fail_on:
+                raise Interrupted(text)
+            extracted.append(text)
+            return f'{textrank_phrases[0]};{len(text)}'
+        monkeypatch.setattr(export_keys, 'extract_keys', extract_keys)
+        pandas.DataFrame(rows, columns = ['id', 'objective']).to_csv(input_csv, sep = ';', index = False)
+        export_keys.export_keys_to_csv(
+            str(input_csv), str(output_csv), str(aux_keys_path), top_n, (1, 3), 0.7,
+            id_field = 'id', text_field = 'objective', checkpoint_every = 1
+        )
+        return extracted
+
+    def output():
+        return pandas.read_csv(output_csv, dtype = str).values.tolist()
+
+    def deltas():
+        return sorted(glob.glob(f'{output_csv}.delta*'))
+
+    run.output, run.deltas, run.output_csv = output, deltas, output_csv
+    return run
+
+
+def test_only_new_and_changed_rows_are_extracted(export):
+    rows = [[1, 'alpha text'], [2, 'beta text'], [3, 'gamma text']]
+    assert export(rows) == ['alpha text', 'beta text', 'gamma text']
+    assert export.output() == [['1', 'alpha;10'], ['2', 'beta;9'], ['3', 'gamma;10']]
+    assert export.deltas() == []
+
+    # Nothing is extracted again, unless a text changes or is added,
+    # and the removed rows are dropped from the output.
+    assert export(rows) == []
+    rows = [[2, 'beta text changed'], [3, 'gamma text'], [4, 'delta']]
+    assert export(rows) == ['beta text changed', 'delta']
+    assert export.output() == [['2', 'beta;17'], ['3', 'gamma;10'], ['4', 'delta;5']]
+
+    # Other parameters extract every row again.
+    assert len(export(rows, top_n = 5)) == 3
+
+
+def test_interrupted_export_resumes_from_deltas(export):
+    rows = [[1, 'alpha text'], [2, 'beta text'], [3, 'gamma text']]
+    export(rows[:1])
+    with pytest.raises(Interrupted):
+        export(rows, fail_on = 'gamma text')
+
+    # The previous output is left whole, and the finished rows are in the deltas.
+    assert export.output() == [['1', 'alpha;10']]
+    assert len(export.deltas()) == 1
+    assert not os.path.exists(f'{export.output_csv}.part')
+
+    assert export(rows) == ['gamma text']
+    assert export.output() == [['1', 'alpha;10'], ['2', 'beta;9'], ['3', 'gamma;10']]
+    assert export.deltas() == []
+
+
+def test_stale_deltas_are_dropped_with_other_parameters(export):
+    rows = [[1, 'alpha text'], [2, 'beta text']]
+    with pytest.raises(Interrupted):
+        export(rows, fail_on = 'beta text')
+    assert len(export.deltas()) == 1
+    assert export(rows, top_n = 5) == ['alpha text', 'beta text']
+    assert export.deltas() == []
@@ -0,0 +1,37 @@
+import os
+import pytest
+
+# The extraction imports the spacy models of the registry.
+extract_persons = pytest.importorskip('CordisKG.extract_persons')
+
+
+def write_csv(path, rows):
+    path.write_text(''.join(f'{rcn},{persons}\n' for rcn, persons in [('rcn', 'persons')] + rows))
+
+
+def test_merge_persons_replaces_and_drops_rows(tmp_path):
+    persons_csv = tmp_path / 'persons.csv'
+    write_csv(persons_csv, [('1', 'Anna Müller'), ('2', 'John Smith'), ('3', 'Maria Papadopoulou')])
+    first, second = tmp_path / 'persons.csv.delta000000', tmp_path / 'persons.csv.delta000001'
+    # The deltas replace the rows of the same rcn, and an empty persons string removes it.
+    write_csv(first, [('10', 'Pierre Dupont'), ('2', '')])
+    write_csv(second, [('3', 'Maria Papadopoulou;Anna Müller'), ('4', 'Jan Kowalski')])
+
+    # The documents are sorted as names, thus 10.txt comes before 2.txt,
+    # and the persons of the documents which no longer exist are dropped.
+    docnames = sorted(['1.txt', '10.txt', '2.txt', '3.txt'])
+    extract_persons.merge_persons(str(persons_csv), [str(first), str(second)], docnames)
+
+    assert persons_csv.read_text(encoding = 'utf-8').splitlines() == [
+        'rcn,persons', '1,Anna Müller', '10,Pierre Dupont', '3,Maria Papadopoulou;Anna Müller'
+    ]
+    assert not first.exists() and not second.exists()
+    assert not os.path.exists(f'{persons_csv}.part')
+
+
+def test_merge_persons_without_previous_csv(tmp_path):
+    persons_csv = tmp_path / 'persons.csv'
+    delta = tmp_path / 'persons.csv.delta000000'
+    write_csv(delta, [('1', 'Anna Müller')])
+    extract_persons.merge_persons(str(persons_csv), [str(delta)], ['1.txt'])
+    assert persons_csv.read_text(encoding = 'utf-8').splitlines() == ['rcn,persons', '1,Anna Müller']
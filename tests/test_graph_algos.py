@@ -0,0 +1,75 @@
+import numpy as np
+from CordisKG.graph_algos import GraphAlgos
+from CordisKG.local_algos import LocalGraphAlgos
+from CordisKG.create import run_initial_algorithms
+
+
+class FailingDatabase:
+    """
+    Stand-in for Neo4jDatabase, which returns no result for the queries
+    of the failing procedures, as execute does when it catches a CypherError.
+    """
+    def __init__(self, failing):
+        self.failing = failing
+        self.queries = []
+
+    def execute(self, query, mode, parameters = None):
+        self.queries.append(query)
+        if any(procedure in query for procedure in self.failing):
+            return None
+        return []
+
+
+class GraphDatabase:
+    # Stand-in which returns the nodes and the relationships of the projection.
+    def execute(self, query, mode, parameters = None):
+        if 'labels(n)' in query:
+            return [[10, ['Project']], [11, ['Project']], [12, ['Keyphrase']]]
+        if '[:includes]' in query:
+            return [[10, 12], [11, 12]]
+        return []
+
+
+def test_failed_mutate_is_not_written():
+    GraphAlgos.database = None
+    database = FailingDatabase(failing = ['gds.louvain.mutate', 'gds.nodeSimilarity.mutate'])
+    with GraphAlgos(database, ['Project', 'Keyphrase'], ['includes']) as graph:
+        graph.pagerank('pagerank')
+        graph.louvain('community')
+        graph.nodeSimilarity('score', 'similar')
+        assert graph.node_properties == ['pagerank']
+        assert graph.relationships == []
+    writes = [query for query in database.queries if 'gds.graph.write' in query]
+    assert len(writes) == 1 and writes[0].endswith("['pagerank'])")
+    GraphAlgos.database = None
+
+
+def test_subgraph_without_matching_types():
+    LocalGraphAlgos.database = None
+    graph = LocalGraphAlgos(GraphDatabase(), ['Project', 'Keyphrase'], ['includes'])
+    nodes, adjacency = graph.subgraph(relationship_types = ['similar'])
+    assert list(nodes) == [0, 1, 2]
+    assert adjacency.shape == (3, 3) and adjacency.nnz == 0
+
+    nodes, adjacency = graph.subgraph(node_labels = ['Project'], relationship_types = ['similar'])
+    assert list(nodes) == [0, 1]
+    assert adjacency.shape == (2, 2) and adjacency.nnz == 0
+
+    nodes, adjacency = graph.subgraph()
+    assert np.array_equal(adjacency.toarray(), [[0, 0, 1], [0, 0, 1], [0, 0, 0]])
+    LocalGraphAlgos.database = None
+
+
+def test_communities_of_each_label_are_written_separately():
+    GraphAlgos.database = None
+    # The louvain of the deliverables fails, while the rest of the labels succeed.
+    database = FailingDatabase(failing = ["nodeLabels: ['Deliverable']"])
+    run_initial_algorithms(database)
+    writes = [query for query in database.queries if 'gds.graph.writeNodeProperties' in query]
+    assert [write.split(', ', 1)[1] for write in writes] == [
+        "['pagerank'])",
+        "['community'], ['Project'])",
+        "['community'], ['Organization'])",
+        "['community'], ['Person'])"
+    ]
+    GraphAlgos.database = None
@@ -0,0 +1,65 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from CordisKG.batching import bounded_map
+from CordisKG.instrumentation import MetricsCollector, metrics, counter
+
+
+def test_repeated_stage_is_summed():
+    collector = MetricsCollector()
+    for _ in range(2):
+        with collector.stage('extract'):
+            time.sleep(0.05)
+    assert list(collector.stages) == ['extract']
+    assert collector.stages['extract']['seconds'] >= 0.1
+    # The peak memory of the process is labelled as such, next to the growth during the stage.
+    assert set(collector.stages['extract']) == {'seconds', 'process_peak_memory', 'memory_delta'}
+    assert collector.stages['extract']['process_peak_memory'] > 0
+
+
+@counter
+def produce(values, delay):
+    for value in values:
+        time.sleep(delay)
+        yield value
+
+
+def test_generator_is_recorded_with_yielded_values():
+    with metrics.stage('test_generator'):
+        consumed = []
+        for value in produce(range(3), 0.02):
+            consumed.append(value)
+            time.sleep(0.1) # The time of the consumer is not recorded.
+        # A generator which is closed early is recorded as well.
+        partial = produce(range(10), 0)
+        next(partial)
+        partial.close()
+
+    histogram = metrics.histograms[('test_generator', produce.__qualname__)]
+    assert consumed == [0, 1, 2]
+    assert histogram.calls == 2
+    assert histogram.items == 4
+    assert 0.06 <= histogram.total < 0.3
+
+
+@counter(items = len)
+def square_all(values):
+    return [value * value for value in values]
+
+
+def test_thread_calls_are_recorded_under_the_stage():
+    with metrics.stage('test_threads'):
+        with ThreadPoolExecutor(max_workers = 2) as executor:
+            results = list(bounded_map(executor, square_all, [[1, 2], [3], [4, 5, 6]], 2))
+    assert results == [[1, 4], [9], [16, 25, 36]]
+    histogram = metrics.histograms[('test_threads', square_all.__qualname__)]
+    assert (histogram.calls, histogram.items) == (3, 6)
+    assert ('main', square_all.__qualname__) not in metrics.histograms
+
+
+def test_worker_process_metrics_are_merged():
+    with metrics.stage('test_processes'):
+        with ProcessPoolExecutor(max_workers = 2) as executor:
+            results = list(bounded_map(executor, square_all, [[1, 2], [3], [4, 5, 6], [7]], 2))
+    assert results == [[1, 4], [9], [16, 25, 36], [49]]
+    histogram = metrics.histograms[('test_processes', square_all.__qualname__)]
+    assert (histogram.calls, histogram.items) == (4, 7)
@@ -0,0 +1,321 @@
+import re
+import copy
+import numpy as np
+from scipy.sparse import csr_matrix
+from CordisKG.local_algos import LocalGraphAlgos, jaccard_top_k
+
+organizations_graph = (
+    ['Organization', 'Project', 'Keyphrase'],
+    [('participates_in', 'NATURAL', []), ('includes', 'NATURAL', [])]
+)
+persons_graph = (
+    ['Person', 'Deliverable', 'Project', 'Keyphrase'],
+    [('writes', 'NATURAL', []), ('belongs', 'NATURAL', []), ('includes', 'NATURAL', [])]
+)
+
+
+class SimilarityDatabase:
+    """
+    Stand-in for Neo4jDatabase, which keeps the nodes, their properties
+    and the relationships in memory, and answers the queries
+    of the projection and of the similarity methods of LocalGraphAlgos.
+    """
+    def __init__(self, labels, relationships):
+        self.labels = labels
+        self.properties = {node: {} for node in labels}
+        self.relationships = [
+            {'type': type, 'a': a, 'b': b, 'properties': {}} for type, a, b in relationships
+        ]
+
+    def nodes(self, query):
+        labels = set(re.findall(r'n:(\w+)', query))
+        return [node for node in sorted(self.labels) if self.labels[node] & labels]
+
+    def outgoing(self, type, node, projection):
+        return [
+            r for r in self.relationships if r['type'] == type and r['a'] == node
+            and r['properties'].get('projection') == projection
+        ]
+
+    def execute(self, query, mode, parameters = None):
+        parameters = parameters or {}
+        if 'RETURN id(n), labels(n)' in query:
+            return [[node, sorted(self.labels[node])] for node in self.nodes(query)]
+        if query.endswith('RETURN id(a), id(b)'):
+            type = re.search(r'\[:(\w+)\]', query).group(1)
+            return [[r['a'], r['b']] for r in self.relationships if r['type'] == type]
+        if 'IS NOT NULL' in query:
+            hash_property = re.search(r'n\.(\w+) IS NOT NULL', query).group(1)
+            type = re.search(r'\[r:(\w+)\]', query).group(1)
+            return [
+                [node, self.properties[node][hash_property],
+                 len(self.outgoing(type, node, parameters['projection']))]
+                for node in self.nodes(query.split('AND')[0])
+                if hash_property in self.properties[node]
+            ]
+        if 'WHERE id(b) IN $ids' in query:
+            type = re.search(r'\[r:(\w+)\]', query).group(1)
+            return [
+                [r['a']] for r in self.relationships if r['type'] == type
+                and r['b'] in parameters['ids'] and r['properties'].get('projection') == parameters['projection']
+            ]
+        raise AssertionError(f'Unexpected query: {query}')
+
+    def execute_many(self, query, parameters, batch_size = 1000, workers = 1):
+        type = re.search(r'\(a\)-\[r?:(\w+)', query).group(1)
+        for maps in parameters:
+            projection = maps['projection']
+            for row in maps['rows']:
+                if query.split('row.source ')[1].startswith('MATCH (b)'):
+                    # The relationships of a full computation are created.
+                    self.relationships.append({'type': type, 'a': row['source'], 'b': row['target'], 'properties': {
+                        'score': row['score'], 'projection': projection
+                    }})
+                    continue
+                hash_property = re.search(r'SET a\.(\w+) = row.fingerprint', query).group(1)
+                self.properties[row['source']][hash_property] = row['fingerprint']
+                targets = {pair['target']: pair['score'] for pair in row['similar']}
+                self.relationships = [
+                    r for r in self.relationships if not (
+                        r['type'] == type and r['a'] == row['source'] and (
+                            r['properties'].get('projection') is None or
+                            (r['properties']['projection'] == projection and r['b'] not in targets)
+                        )
+                    )
+                ]
+                for target, score in targets.items():
+                    merged = [r for r in self.outgoing(type, row['source'], projection) if r['b'] == target]
+                    if not merged:
+                        merged = [{'type': type, 'a': row['source'], 'b': target, 'properties': {'projection': projection}}]
+                        self.relationships += merged
+                    merged[0]['properties']['score'] = score
+        return 0
+
+    def similarities(self):
+        return sorted(
+            (r['a'], r['b'], round(r['properties']['score'], 9), r['properties'].get('projection'))
+            for r in self.relationships if r['type'] == 'is_similar'
+        )
+
+
+def graph(database, node_list, rel_list):
+    LocalGraphAlgos.database = None
+    return LocalGraphAlgos(database, node_list, rel_list)
+
+
+def update(database):
+    return [
+        graph(database, node_list, rel_list).updateNodeSimilarity('score', 'is_similar', cutoff = 0.23, top_k = 1)
+        for node_list, rel_list in (organizations_graph, persons_graph)
+    ]
+
+
+def full_recompute(database):
+    # A copy of the graph without any similarity relationships.
+    rebuilt = copy.deepcopy(database)
+    rebuilt.relationships = [r for r in rebuilt.relationships if r['type'] != 'is_similar']
+    for node_list, rel_list in (organizations_graph, persons_graph):
+        graph(rebuilt, node_list, rel_list).nodeSimilarity('score', 'is_similar', cutoff = 0.23, top_k = 1)
+    return rebuilt.similarities()
+
+
+def cordis_graph():
+    labels = {}
+    for node in range(1, 4): labels[node] = {'Organization'}
+    for node in range(10, 15): labels[node] = {'Project'}
+    for node in range(20, 28): labels[node] = {'Keyphrase'}
+    for node in range(30, 33): labels[node] = {'Person'}
+    for node in range(40, 44): labels[node] = {'Deliverable'}
+    relationships = [
+        ('participates_in', 1, 10), ('participates_in', 1, 11), ('participates_in', 2, 11),
+        ('participates_in', 2, 12), ('participates_in', 3, 13), ('participates_in', 3, 14),
+        ('includes', 10, 20), ('includes', 10, 21), ('includes', 11, 20), ('includes', 11, 21),
+        ('includes', 11, 22), ('includes', 12, 22), ('includes', 12, 23), ('includes', 13, 24),
+        ('includes', 13, 25), ('includes', 14, 25), ('includes', 14, 26),
+        ('writes', 30, 40), ('writes', 30, 41), ('writes', 31, 41), ('writes', 32, 43),
+        ('belongs', 40, 10), ('belongs', 41, 11), ('belongs', 42, 12), ('belongs', 43, 13),
+        ('includes', 40, 20), ('includes', 41, 21), ('includes', 42, 22), ('includes', 43, 27)
+    ]
+    return SimilarityDatabase(labels, relationships)
+
+
+def test_incremental_similarity_matches_full_recompute():
+    database = cordis_graph()
+    update(database)
+    assert database.similarities() == full_recompute(database)
+    # The projects are updated by both projections, without undoing each other.
+    assert update(database) == [0, 0]
+
+    # Change the neighbourhoods, and update again.
+    database.relationships = [
+        r for r in database.relationships if (r['type'], r['a'], r['b']) != ('includes', 11, 22)
+    ]
+    database.relationships += [
+        {'type': type, 'a': a, 'b': b, 'properties': {}} for type, a, b in
+        [('includes', 12, 20), ('participates_in', 3, 10), ('writes', 32, 40), ('includes', 14, 24)]
+    ]
+    assert all(count > 0 for count in update(database))
+    assert database.similarities() == full_recompute(database)
+    assert update(database) == [0, 0]
+
+
+def test_incremental_similarity_replaces_unmarked_relationships():
+    database = cordis_graph()
+    # The unmarked relationships of a full rebuild with GDS are replaced by the first update.
+    database.relationships += [
+        {'type': 'is_similar', 'a': a, 'b': b, 'properties': {'score': 0.5}} for a, b in [(10, 11), (1, 3)]
+    ]
+    update(database)
+    assert database.similarities() == full_recompute(database)
+
+
+class ProjectionDatabase:
+    """
+    Stand-in for Neo4jDatabase, which returns the nodes and the relationships
+    of a projection with a single label and relationship type,
+    and keeps the written node properties.
+    """
+    def __init__(self, nodes, relationships):
+        self.node_ids = nodes
+        self.edges = relationships
+        self.written = {}
+
+    def execute(self, query, mode, parameters = None):
+        if 'labels(n)' in query:
+            return [[node, ['Node']] for node in self.node_ids]
+        return [list(edge) for edge in self.edges]
+
+    def execute_many(self, query, parameters, batch_size = 1000, workers = 1):
+        for maps in parameters:
+            for row in maps['rows']:
+                self.written[row['id']] = row['value']
+        return 0
+
+
+def projection(nodes, relationships):
+    return graph(ProjectionDatabase(nodes, relationships), ['Node'], ['links'])
+
+
+def reference_pagerank(nodes, relationships, damping_factor, iterations):
+    # The per node definition of PageRank, where the rank of dangling nodes is not redistributed.
+    out_degrees = {node: sum(1 for a, _ in relationships if a == node) for node in nodes}
+    scores = {node: 1 - damping_factor for node in nodes}
+    for _ in range(iterations):
+        scores = {
+            node: (1 - damping_factor) + damping_factor * sum(
+                scores[a] / out_degrees[a] for a, b in relationships if b == node
+            ) for node in nodes
+        }
+    return [scores[node] for node in nodes]
+
+
+def test_pagerank_matches_reference():
+    nodes = [1, 2, 3, 4, 5]
+    # Node 5 has no outgoing relationships.
+    relationships = [(1, 2), (1, 3), (2, 3), (3, 1), (4, 3), (4, 5), (2, 5)]
+    database = ProjectionDatabase(nodes, relationships)
+    scores = graph(database, ['Node'], ['links']).pagerank('pagerank', max_iterations = 100, tolerance = 1e-12)
+    assert np.allclose(scores, reference_pagerank(nodes, relationships, 0.85, 100))
+    assert np.allclose([database.written[node] for node in nodes], scores)
+
+
+def cliques(count, size):
+    # Cliques of the given size, where each clique is joined to the next one by a single relationship.
+    nodes = list(range(count * size))
+    relationships = [
+        (start + a, start + b) for start in range(0, count * size, size)
+        for a in range(size) for b in range(a + 1, size)
+    ]
+    relationships += [(start + size - 1, (start + size) % (count * size)) for start in range(0, count * size, size)]
+    return nodes, relationships
+
+
+def partition(nodes, communities):
+    groups = {}
+    for node, community in zip(nodes, communities):
+        groups.setdefault(community, set()).add(node)
+    return sorted(map(sorted, groups.values()))
+
+
+def test_louvain_finds_two_cliques():
+    nodes = list(range(10))
+    relationships = [(a, b) for a in range(5) for b in range(a + 1, 5)]
+    relationships += [(a, b) for a in range(5, 10) for b in range(a + 1, 10)] + [(4, 5)]
+    database = ProjectionDatabase(nodes, relationships)
+    communities = graph(database, ['Node'], ['links']).louvain('community')
+    assert partition(nodes, communities) == [list(range(5)), list(range(5, 10))]
+    assert [database.written[node] for node in nodes] == list(communities)
+
+
+def test_louvain_finds_ring_of_cliques():
+    # The cliques are large enough for the resolution limit of modularity,
+    # otherwise merging pairs of cliques would have a higher modularity.
+    nodes, relationships = cliques(count = 6, size = 7)
+    _, communities = projection(nodes, relationships).communities()
+    assert partition(nodes, communities) == [list(range(start, start + 7)) for start in range(0, 42, 7)]
+
+    # A graph without relationships keeps every node in its own community.
+    _, communities = projection(list(range(4)), []).communities()
+    assert sorted(communities) == [0, 1, 2, 3]
+
+
+def brute_force_top_k(neighbours, cutoff, top_k, rows):
+    # The Jaccard similarity of every pair of sets, ranked by descending similarity and then by the lower node.
+    results = []
+    for row in rows:
+        similar = []
+        for other, candidates in enumerate(neighbours):
+            shared = len(neighbours[row] & candidates)
+            if other == row or shared == 0:
+                continue
+            similarity = shared / len(neighbours[row] | candidates)
+            if similarity >= cutoff:
+                similar.append((-similarity, other))
+        results += [(row, other, -similarity) for similarity, other in sorted(similar)[:top_k]]
+    return results
+
+
+def incidence_matrix(neighbours, columns):
+    rows = [row for row, targets in enumerate(neighbours) for _ in targets]
+    targets = [target for row_targets in neighbours for target in sorted(row_targets)]
+    return csr_matrix((np.ones(len(rows)), (rows, targets)), shape = (len(neighbours), columns))
+
+
+def test_jaccard_top_k_matches_brute_force():
+    rng = np.random.default_rng(0)
+    # Few columns result in many equal similarities, and some rows without any neighbours.
+    neighbours = [set(rng.choice(6, size = rng.integers(0, 5), replace = False).tolist()) for _ in range(40)]
+    # Rows 40 and 41 are equal, and rows 42 to 44 have the same similarity 0.5 to row 40.
+    neighbours += [{0, 1}, {0, 1}, {0, 2}, {1, 3}, {0, 4}]
+    incidence = incidence_matrix(neighbours, 6)
+
+    for cutoff in (1e-42, 0.25, 0.5, 1.0):
+        for top_k in (1, 2, 3, 100):
+            for block_size, rows in ((1, None), (7, None), (1000, [40, 0, 44, 13])):
+                expected = brute_force_top_k(neighbours, cutoff, top_k, rows or range(len(neighbours)))
+                sources, targets, scores = jaccard_top_k(incidence, cutoff, top_k, block_size, rows)
+                assert list(zip(sources.tolist(), targets.tolist(), scores.tolist())) == expected
+
+
+
+def test_jaccard_top_k_ties():
+    # Rows 1 to 3 have the same similarity 0.5 to row 0, and row 4 has 1/3.
+    incidence = incidence_matrix([{0, 1}, {0, 1, 2, 3}, {1}, {0}, {0, 2}], 4)
+    sources, targets, scores = jaccard_top_k(incidence, 0.5, 2, rows = [0])
+    assert targets.tolist() == [1, 2] and scores.tolist() == [0.5, 0.5]
+    # The ties at the cutoff are kept.
+    sources, targets, scores = jaccard_top_k(incidence, 0.5, 10, rows = [0])
+    assert targets.tolist() == [1, 2, 3]
+    sources, targets, scores = jaccard_top_k(incidence, 0.3, 10, rows = [0])
+    assert targets.tolist() == [1, 2, 3, 4]
+
+
+def test_similarities_match_brute_force():
+    database = cordis_graph()
+    for node_list, rel_list in (organizations_graph, persons_graph):
+        local_graph = graph(database, node_list, rel_list)
+        nodes, adjacency = local_graph.subgraph()
+        neighbours = [set(adjacency[row].indices.tolist()) for row in range(adjacency.shape[0])]
+        sources, targets, scores = local_graph.similarities(cutoff = 0.23, top_k = 2)
+        expected = brute_force_top_k(neighbours, 0.23, 2, range(len(neighbours)))
+        assert list(zip(sources.tolist(), targets.tolist(), scores.tolist())) == expected
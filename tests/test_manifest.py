@@ -0,0 +1,40 @@
+from CordisKG.manifest import Manifest, file_fingerprint
+
+
+def test_manifest_tracks_changed_records(tmp_path):
+    path = str(tmp_path / 'output.csv.manifest')
+    manifest = Manifest(path, {'top_n': 10})
+    assert manifest.changed(1, 'first text')
+    manifest.update(1, 'first text')
+    manifest.update('2', 'second text')
+    assert not manifest.changed('1', 'first text')
+    assert manifest.changed(2, 'edited text')
+    assert 1 in manifest and '2' in manifest
+    manifest.save()
+    assert not (tmp_path / 'output.csv.manifest.part').exists()
+
+    # The entries are kept for the same parameters, and dropped for others.
+    stored = Manifest(path, {'top_n': 10})
+    assert stored.entries == manifest.entries
+    assert not stored.changed(2, 'second text')
+    assert Manifest(path, {'top_n': 5}).entries == {}
+
+    stored.retain([2, 3])
+    assert list(stored.entries) == ['2']
+
+
+def test_manifest_parameters_are_compared_as_json(tmp_path):
+    path = str(tmp_path / 'output.csv.manifest')
+    manifest = Manifest(path, {'ngram_range': (1, 3)})
+    manifest.update(1, 'text')
+    manifest.save()
+    # The tuples of the parameters are stored as lists.
+    assert Manifest(path, {'ngram_range': (1, 3)}).entries == manifest.entries
+
+
+def test_file_fingerprint_changes_with_content(tmp_path):
+    path = tmp_path / 'doc.txt'
+    path.write_text('one')
+    before = file_fingerprint(str(path))
+    path.write_text('one two')
+    assert file_fingerprint(str(path)) != before
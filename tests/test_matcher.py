@@ -0,0 +1,53 @@
+import random
+from CordisKG.matcher import KeyphraseMatcher
+from CordisKG.utils import find_keys_in_text
+
+
+def find_bounded_keys(text, keyphrases):
+    # Every occurrence of each keyphrase, which is not preceded or followed by a letter or a digit.
+    text, found = text.lower(), []
+    for keyphrase in map(str.lower, keyphrases):
+        start = text.find(keyphrase)
+        while start != -1:
+            end = start + len(keyphrase)
+            if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                found.append(keyphrase)
+                break
+            start = text.find(keyphrase, start + 1)
+    return found
+
+
+def random_strings(rng, count, length, alphabet):
+    return [''.join(rng.choice(alphabet) for _ in range(rng.randint(1, length))) for _ in range(count)]
+
+
+def test_matcher_matches_find_keys_in_text():
+    rng = random.Random(0)
+    # A small alphabet results in many nested and overlapping keyphrases.
+    alphabet = 'abAB -'
+    for _ in range(200):
+        keyphrases = random_strings(rng, 8, 4, alphabet)
+        texts = random_strings(rng, 5, 30, alphabet)
+        for word_boundaries, reference in ((False, find_keys_in_text), (True, find_bounded_keys)):
+            matcher = KeyphraseMatcher(keyphrases, word_boundaries)
+            for text in texts:
+                assert matcher.find(text) == reference(text, keyphrases), (text, keyphrases)
+
+
+def test_matcher_cases():
+    keyphrases = ['Graph', 'graph database', 'database', 'base', 'Neural Network', 'network', 'graph', 'ΓΡΑΦΟΣ']
+    text = 'A Graph Database of neural networks, and the γράφος.'
+    matcher = KeyphraseMatcher(keyphrases)
+    assert matcher.find(text) == find_keys_in_text(text, keyphrases) == [
+        'graph', 'graph database', 'database', 'base', 'neural network', 'network', 'graph'
+    ]
+    # The keyphrases inside another word are dropped with word boundaries, even if nested in a match.
+    bounded = KeyphraseMatcher(keyphrases, word_boundaries = True)
+    assert bounded.find(text) == find_bounded_keys(text, keyphrases) == [
+        'graph', 'graph database', 'database', 'graph'
+    ]
+    # A keyphrase which only appears inside a word, then as a word, is found by its later occurrence.
+    assert bounded.find('networks and network') == ['network']
+    # The empty keyphrase is contained in any text, but is not a word.
+    assert KeyphraseMatcher(['', 'a']).find('b') == find_keys_in_text('b', ['', 'a']) == ['']
+    assert KeyphraseMatcher([''], word_boundaries = True).find('b') == []
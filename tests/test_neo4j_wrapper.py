@@ -0,0 +1,170 @@
+import threading
+import pytest
+from neo4j.exceptions import ConstraintError, TransientError
+from CordisKG.neo4j_wrapper import Neo4jDatabase
+
+
+class FakeResult:
+    def __init__(self, records = None):
+        self.records = records or []
+
+    def consume(self):
+        return None
+
+    def single(self):
+        return self.records[0] if self.records else None
+
+    def values(self):
+        return self.records
+
+
+class FakeTransaction:
+    def __init__(self, driver):
+        self.driver = driver
+        self.runs = []
+
+    def run(self, query, parameters = None):
+        if parameters and parameters.get('fail'):
+            raise ConstraintError('Node already exists')
+        self.runs.append(parameters)
+        return FakeResult()
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+    def read_transaction(self, function, *args):
+        return function(FakeTransaction(self.driver), *args)
+
+    def write_transaction(self, function, *args):
+        # The runs of the transaction are only kept, if it commits.
+        tx = FakeTransaction(self.driver)
+        result = function(tx, *args)
+        with self.driver.lock:
+            self.driver.runs.extend(tx.runs)
+        return result
+
+
+class FakeDriver:
+    """
+    Stand-in for the neo4j driver, which records the parameters
+    of every query that its transactions run.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.runs = []
+
+    def session(self):
+        return FakeSession(self)
+
+
+def fake_database():
+    database = Neo4jDatabase.__new__(Neo4jDatabase)
+    database._driver = FakeDriver()
+    return database
+
+
+def test_execute_many_counts_committed_maps_only():
+    parameters = [{'id': i, 'fail': i == 4} for i in range(10)]
+    for workers in (1, 3):
+        database = fake_database()
+        # The batch of the failing map is [3, 4, 5], thus 7 maps are committed.
+        count = database.execute_many('RETURN $id', parameters, batch_size = 3, workers = workers)
+        assert count == 7
+
+
+def test_execute_many_reads_a_bounded_window_of_batches():
+    database = fake_database()
+    read = []
+    def parameters():
+        for i in range(1000):
+            read.append(i)
+            # At most 2 * workers batches are pending, besides the one being read.
+            assert len(read) - len(database._driver.runs) <= (2 * 2 + 1) * 10
+            yield {'id': i}
+    count = database.execute_many('RETURN $id', parameters(), batch_size = 10, workers = 2)
+    assert count == 1000
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    monkeypatch.setattr('CordisKG.neo4j_wrapper.time.sleep', lambda seconds: None)
+    database = fake_database()
+    failures = {'left': 2}
+    def run(query, parameters = None):
+        if failures['left']:
+            failures['left'] -= 1
+            raise TransientError('Deadlock detected')
+        return FakeResult()
+    monkeypatch.setattr(FakeTransaction, 'run', lambda self, query, parameters = None: run(query, parameters))
+    assert database.execute_many('RETURN $id', [{'id': 1}, {'id': 2}], batch_size = 2) == 2
+    assert failures['left'] == 0
+
+    # A batch which keeps failing raises the error, rather than being dropped.
+    failures['left'] = Neo4jDatabase.transient_retries + 1
+    with pytest.raises(TransientError):
+        database.execute_many('RETURN $id', [{'id': 3}], batch_size = 1)
+
+
+def test_conflicting_batches_are_committed_serially(monkeypatch):
+    monkeypatch.setattr('CordisKG.neo4j_wrapper.time.sleep', lambda seconds: None)
+    database = fake_database()
+    def run(tx, query, parameters = None):
+        # The batch of id 5 deadlocks, as long as it runs in a worker thread.
+        if parameters['id'] == 5 and threading.current_thread() is not threading.main_thread():
+            raise TransientError('Deadlock detected')
+        tx.runs.append(parameters)
+        return FakeResult()
+    monkeypatch.setattr(FakeTransaction, 'run', run)
+    parameters = [{'id': i} for i in range(20)]
+    assert database.execute_many('RETURN $id', parameters, batch_size = 2, workers = 3) == 20
+    assert sorted(run['id'] for run in database._driver.runs) == list(range(20))
+
+
+def test_execute_chunked_retries_transient_errors(monkeypatch):
+    monkeypatch.setattr('CordisKG.neo4j_wrapper.time.sleep', lambda seconds: None)
+    database = fake_database()
+    items = set(range(25))
+    failures = {'left': 3}
+    def run(tx, query, parameters = None):
+        # The batches are deleted until none is left, while the first attempts deadlock.
+        if failures['left']:
+            failures['left'] -= 1
+            raise TransientError('Deadlock detected')
+        batch = sorted(items)[:parameters['batch_size']]
+        items.difference_update(batch)
+        return FakeResult([[len(batch)]])
+    monkeypatch.setattr(FakeTransaction, 'run', run)
+    assert database.execute_chunked('DELETE', batch_size = 10) == 25
+    assert not items and failures['left'] == 0
+
+    # A batch which keeps failing raises the error.
+    items.update(range(5))
+    failures['left'] = Neo4jDatabase.transient_retries + 1
+    with pytest.raises(TransientError):
+        database.execute_chunked('DELETE', batch_size = 10)
+
+
+def test_execute_chunked_pages_the_ids(monkeypatch):
+    database = fake_database()
+    items = set(range(0, 190, 2))
+    pages = []
+    def run(tx, query, parameters = None):
+        if query == 'IDS':
+            page = [[i] for i in sorted(items) if i > parameters['after']][:parameters['page_size']]
+            pages.append(len(page))
+            return FakeResult(page)
+        with tx.driver.lock:
+            items.difference_update(parameters['ids'])
+        return FakeResult()
+    monkeypatch.setattr(FakeTransaction, 'run', run)
+    total = database.execute_chunked('DELETE', ids_query = 'IDS', batch_size = 7, workers = 3, page_size = 20)
+    assert total == 95 and not items
+    # No more than a page of ids is read at once.
+    assert pages == [20, 20, 20, 20, 15]
@@ -0,0 +1,52 @@
+from string import punctuation
+from CordisKG.normalizer import Normalizer, stemmers
+from CordisKG.utils import preprocess
+
+keyphrases = [
+    'Graph Databases', 'graph-database', 'NEURAL networks!', 'networking', "Researchers' data",
+    'Réseaux de neurones', 'redes neuronales', 'Bases de Dados', 'sieci neuronowe', 'a.b,c'
+]
+# The keyphrases which are empty without their punctuation, which stempel fails on, as before.
+empty_keyphrases = ['', '...']
+
+
+def baseline_preprocess(lis, language):
+    # The preprocessing of the keyphrases before the normalizer.
+    return list(map(stemmers[language].stem,
+           map(lambda s: s.translate(str.maketrans('', '', punctuation)),
+           map(str.lower, lis))))
+
+
+def tokens(normalizer, token_set):
+    # The normalized tokens of a set of token ids.
+    inverse = {token_id: token for token, token_id in normalizer.vocabulary.items()}
+    return {inverse[token_id] for token_id in token_set}
+
+
+def test_normalizer_matches_baseline_preprocess():
+    for language in stemmers:
+        normalizer = Normalizer(language)
+        lis = keyphrases + (empty_keyphrases if language != 'polish' else [])
+        expected = baseline_preprocess(lis, language)
+        assert normalizer.normalize_all(lis) == expected
+        assert preprocess(lis, language) == expected
+        # The memoized results are the same for a repeated call.
+        assert normalizer.normalize_all(lis) == expected
+
+        token_sets = normalizer.token_sets(lis)
+        assert [tokens(normalizer, token_set) for token_set in token_sets] == [
+            set(keyphrase.split()) for keyphrase in expected
+        ]
+
+
+def test_normalizer_without_language_only_lowercases():
+    normalizer = Normalizer()
+    lis = keyphrases + empty_keyphrases
+    assert normalizer.normalize_all(lis) == [keyphrase.lower() for keyphrase in lis]
+    # The token sets are the lowercase terms of the partial match, with the punctuation kept.
+    token_sets = normalizer.token_sets(lis)
+    assert [tokens(normalizer, token_set) for token_set in token_sets] == [
+        set(keyphrase.lower().split()) for keyphrase in lis
+    ]
+    assert token_sets[0] & normalizer.token_set('graph')
+    assert not token_sets[1] & normalizer.token_set('graph')
@@ -0,0 +1,47 @@
+import os
+import time
+import queue
+from CordisKG.parse_pdfs import ConversionPool
+
+
+def stand_in_convert(input_pdf, output_txt, max_pages):
+    """
+    Stand-in conversion, which hangs on the pdfs named hang,
+    fails on the pdfs named broken, and copies the rest.
+    """
+    name = os.path.basename(input_pdf)
+    if name.startswith('hang'):
+        time.sleep(60)
+    if name.startswith('broken'):
+        raise ValueError('Cannot parse the pdf')
+    with open(input_pdf, 'r') as pdf, open(output_txt, 'w') as txt:
+        txt.write(pdf.read())
+
+
+def test_conversion_pool_replaces_timed_out_processes(tmp_path):
+    names = ['a', 'hang1', 'b', 'broken', 'c', 'hang2', 'd', 'e']
+    tasks = queue.Queue()
+    for name in names:
+        input_pdf = os.path.join(tmp_path, f'{name}.pdf')
+        with open(input_pdf, 'w') as pdf:
+            pdf.write(name)
+        tasks.put((name, input_pdf, os.path.join(tmp_path, f'{name}.txt')))
+    tasks.put(None)
+
+    pool = ConversionPool(workers = 2, timeout = 1, convert = stand_in_convert)
+    started = {slot['process'].pid for slot in pool.slots}
+    start_time = time.monotonic()
+    status = {key: ok for key, _, ok in pool.convert_all(tasks)}
+    elapsed = time.monotonic() - start_time
+    processes = [slot['process'] for slot in pool.slots]
+    pool.close()
+
+    assert status == {name: not name.startswith(('hang', 'broken')) for name in names}
+    # The hanging conversions were killed after the timeout,
+    # instead of blocking the pool for their whole duration.
+    assert elapsed < 10
+    assert {process.pid for process in processes} != started
+    assert all(not process.is_alive() for process in processes)
+    for name in ['a', 'b', 'c', 'd', 'e']:
+        with open(os.path.join(tmp_path, f'{name}.txt')) as txt:
+            assert txt.read() == name
@@ -0,0 +1,72 @@
+import random
+from CordisKG.metrics import partial_match
+from CordisKG.normalizer import Normalizer
+from CordisKG.token_index import TokenIndex
+from CordisKG.utils import get_diff_of_keys
+from tests.test_normalizer import baseline_preprocess
+
+words = ['Graph', 'graph', 'database', 'neural', 'Networks', 'network', 'learning', 'energy', 'grid', 'model']
+
+
+def baseline_diff_of_keys(source, target):
+    # The set based diff of the keyphrases before the token index.
+    return [
+        key_src for key_src in source
+        if not any(
+            set(key_src.lower().split())
+            & set(key_tar.lower().split())
+            for key_tar in target)
+    ]
+
+
+def baseline_partial_match(assigned, extracted):
+    # The set based partial match before the token index.
+    assigned, extracted = min((assigned, extracted), key = len), max((assigned, extracted), key = len)
+    assigned_sets = [set(keyword.split()) for keyword in assigned]
+    extracted_sets = [set(keyword.split()) for keyword in extracted]
+
+    return sum(
+        1.0 for i in assigned_sets
+            if any(True for j in extracted_sets if i & j))
+
+
+def corpus(rng, size):
+    # Short keyphrases of few words, which often share a word, or only differ in case.
+    return [' '.join(rng.sample(words, rng.randint(1, 3))) for _ in range(size)]
+
+
+def test_diff_of_keys_matches_baseline():
+    rng = random.Random(0)
+    for _ in range(100):
+        source, target = corpus(rng, rng.randint(0, 8)), corpus(rng, rng.randint(0, 4))
+        expected = baseline_diff_of_keys(source, target)
+        assert get_diff_of_keys(source, target) == expected
+        # An index of the target, e.g. of the whole graph, is reused as it is.
+        index = TokenIndex(target)
+        assert get_diff_of_keys(source, index) == expected
+        # The keys of a source index are compared in the order of the index.
+        assert sorted(index.diff(TokenIndex(source))) == sorted(set(expected))
+
+
+def test_updated_index_matches_rebuilt_index():
+    rng = random.Random(1)
+    keys = corpus(rng, 30)
+    index = TokenIndex(keys[:20])
+    index.update(added = keys[20:], removed = keys[:10])
+    rebuilt = TokenIndex(keys[10:])
+    sources = corpus(rng, 50)
+    assert index.diff(sources) == rebuilt.diff(sources) == baseline_diff_of_keys(sources, keys[10:])
+    assert index.overlap(sources) == rebuilt.overlap(sources)
+    assert dict(index.postings) == dict(rebuilt.postings)
+
+
+def test_partial_match_matches_baseline():
+    rng = random.Random(2)
+    normalizer = Normalizer('english')
+    for _ in range(100):
+        assigned, extracted = corpus(rng, rng.randint(0, 6)), corpus(rng, rng.randint(0, 10))
+        assert partial_match(assigned, extracted) == baseline_partial_match(assigned, extracted)
+        # The token sets of the normalizer match as the preprocessed strings did.
+        assert partial_match(normalizer.token_sets(assigned), normalizer.token_sets(extracted)) == (
+            baseline_partial_match(baseline_preprocess(assigned, 'english'), baseline_preprocess(extracted, 'english'))
+        )
@@ -0,0 +1,66 @@
+import random
+import numpy
+import pandas
+import pytest
+from suffix_trees import STree
+import CordisKG.utils
+from CordisKG.utils import remove_common_strings_from_list, longest_common_substrings, read_csv_chunks
+from CordisKG.benchmarks import remove_common_strings_pairwise, synthetic_keyphrases
+
+
+def test_remove_common_strings_matches_pairwise_reference():
+    # The suffix trees of the reference dominate the time of the test,
+    # thus the corpus is kept small, and the lower cutoff,
+    # which compares all pairs, is checked on fewer lists.
+    rng = random.Random(0)
+    for i in range(25):
+        keyphrases = synthetic_keyphrases(rng)
+        for cutoff in ((0.7, 0.5) if i % 5 == 0 else (0.7,)):
+            assert (remove_common_strings_from_list(keyphrases, cutoff) ==
+                    remove_common_strings_pairwise(keyphrases, cutoff))
+
+
+def test_remove_common_strings_keeps_non_transitive_matches():
+    keyphrases = ['cells learning', 'cell learning', 'battery model', 'battery models', 'models', 'model']
+    assert (remove_common_strings_from_list(keyphrases) ==
+            remove_common_strings_pairwise(keyphrases))
+    assert remove_common_strings_from_list([]) == []
+    assert remove_common_strings_from_list(['Solar', 'solar']) == ['solar']
+
+
+def test_longest_common_substrings_contain_suffix_tree_lcs():
+    rng = random.Random(1)
+    for _ in range(200):
+        strings = synthetic_keyphrases(rng, size = rng.randint(2, 5))
+        found = longest_common_substrings(strings)
+        assert STree.STree(strings).lcs() in found
+        assert len({len(string) for string in found}) == 1
+
+
+@pytest.fixture(params = ['pandas', 'pyarrow'])
+def csv_reader(request, monkeypatch):
+    # The chunks are read by pyarrow, if it is installed, otherwise by pandas.
+    if request.param == 'pandas':
+        monkeypatch.setattr(CordisKG.utils, 'pyarrow', None)
+    elif CordisKG.utils.pyarrow is None:
+        pytest.skip('pyarrow is not installed')
+    return read_csv_chunks
+
+
+def test_read_csv_chunks_of_chunksize_rows(tmp_path, csv_reader):
+    path = tmp_path / 'rows.csv'
+    lines = ['id;text;extra'] + [f'{i};"text {i}\nsecond line";{i if i % 3 else ""}' for i in range(10)]
+    # The file starts with a byte order mark, which is not part of the first column.
+    path.write_text('\n'.join(lines) + '\n', encoding = 'utf-8-sig')
+    expected = pandas.read_csv(path, sep = ';', dtype = str, encoding = 'utf-8-sig')
+
+    for chunksize in (1, 3, 10, 100):
+        for usecols in (None, ['id', 'extra']):
+            chunks = list(csv_reader(str(path), sep = ';', usecols = usecols, chunksize = chunksize))
+            assert [len(chunk) for chunk in chunks[:-1]] == [chunksize] * (len(chunks) - 1)
+            assert 0 < len(chunks[-1]) <= chunksize
+            frame = pandas.concat(chunks, ignore_index = True)
+            columns = usecols or ['id', 'text', 'extra']
+            assert list(frame.columns) == columns
+            assert frame.equals(expected[columns])
+            assert numpy.isnan(frame['extra'][0])